@@ -9,6 +9,8 @@ except ImportError:
 
 import os
 import json
+import base64
+import atexit
 import time
 import logging
 import subprocess
@@ -19,11 +21,34 @@ from flask import Flask, render_template, request, redirect, url_for, abort, jso
 # Импорт модуля аудио-улучшений
 from audio_enhancement import AudioEnhancement
 
-# Импорт парсера CUE-файлов
-from cue_parser import CueParser
+# Импорт кэша разобранных CUE-файлов и таблицы треков играющего альбома
+from cue_cache import CueCache, cue_file_for_audio
+from cue_track_table import CueTrackTable
+from cue_timeline import build_cue_timeline
+
+# Импорт хранилища настроек с отложенной записью
+from settings_store import SettingsStore
+
+# Импорт постоянного IPC клиента MPV
+from mpv_ipc import MpvIpcClient, CoalescingCommandQueue
+
+# Импорт push-канала состояния (снимок + дельты через Socket.IO)
+from state_push import StatePublisher
+
+# Импорт хранилища состояния плеера (lock + неизменяемые снимки)
+from state_store import StateStore
+
+# Импорт кэша метаданных
+from metadata_cache import MetadataCache
+
+# Импорт индекса медиатеки (SQLite) и его сканера
+from library_index import LibraryIndex, SEARCH_KINDS
+from library_scanner import LibraryScanner
+from library_watcher import LibraryWatcher
+from folder_listing import ListingCache, SORT_KEYS
 
 try:
-    from flask_socketio import SocketIO
+    from flask_socketio import SocketIO, join_room, emit
     SOCKETIO_AVAILABLE = True
 except ImportError:
     SOCKETIO_AVAILABLE = False
@@ -114,12 +139,24 @@ elif SOCKETIO_AVAILABLE:
 else:
     socketio = None
 
+# Push-рассылка состояния клиентам (каналы регистрируются ниже)
+# Без Socket.IO публикатор все равно нужен - версии каналов использует long-poll
+state_publisher = StatePublisher(socketio)
+
+# Long-poll для клиентов без WebSocket: запрос ждет изменения состояния
+LONG_POLL_TIMEOUT = 25.0      # По умолчанию, меньше типичных таймаутов прокси (30с)
+LONG_POLL_MAX_TIMEOUT = 30.0
+STATE_ETAG_PREFIX = f"{os.getpid()}-{int(time.time())}"  # Версии не переживают перезапуск
+
 MEDIA_ROOT = "/mnt/hdd"
 MPV_SOCKET = "/tmp/mpv_socket"
 MEDIA_EXTENSIONS = ['.flac', '.wav', '.wv', '.ape', '.dsf', '.dff', '.mp3', '.aac', '.ogg', '.m4a', 
                    '.mkv', '.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm', 
                    '.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff']
 
+# Одно постоянное соединение с MPV на весь процесс (вместо socat на каждую команду)
+mpv_ipc = MpvIpcClient(MPV_SOCKET)
+
 def check_hdd_status():
     """Проверяет статус подключения HDD"""
     try:
@@ -173,43 +210,77 @@ def get_file_type(filepath):
     else:
         return 'unknown'
 
-def get_cue_info_for_folder(folder_path):
-    """Получаем информацию о CUE-файлах в папке"""
+# Индекс медиатеки на локальном носителе (не на HDD - диск может спать или отсутствовать)
+LIBRARY_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'library.db')
+library_index = LibraryIndex(LIBRARY_DB)
+
+def is_library_available():
+    """Диск смонтирован на самом деле: пустая точка монтирования не должна стереть индекс"""
+    return os.path.ismount(MEDIA_ROOT) and is_hdd_available()
+
+# Параллельность первичного сканирования: для HDD небольшая очередь запросов
+# сокращает время поиска головки, для SSD значения можно увеличить
+LIBRARY_SCAN_WORKERS = 4
+LIBRARY_PROBE_WORKERS = 2
+
+# Листинги недавно открытых папок в памяти (проверка - один stat папки)
+LISTING_CACHE_ENTRIES = 256
+LISTING_CACHE_BYTES = 16 * 1024 * 1024
+listing_cache = ListingCache(max_entries=LISTING_CACHE_ENTRIES, max_bytes=LISTING_CACHE_BYTES)
+
+library_scanner = LibraryScanner(library_index, MEDIA_ROOT, get_file_type, is_available=is_library_available,
+                                 scan_workers=LIBRARY_SCAN_WORKERS, probe_workers=LIBRARY_PROBE_WORKERS,
+                                 listing_cache=listing_cache)
+library_watcher = LibraryWatcher(library_scanner)
+
+def get_folder_listing(folder_path):
+    """FolderListing папки из индекса медиатеки (пересканируется при смене mtime)
+
+    Один листинг на запрос делится между просмотром, плейлистом, галереей
+    и CUE-альбомами. None, если папки нет.
+    """
+    return library_scanner.listing(library_scanner.relative_path(folder_path))
+
+# Разобранные CUE-файлы: повторное воспроизведение альбома не открывает .cue
+CUE_CACHE_SIZE = 128
+cue_cache = CueCache(maxsize=CUE_CACHE_SIZE)
+
+def get_image_gallery(listing):
+    """Пути изображений папки для монитора (в порядке имен)"""
+    return listing.paths('image') if listing is not None else []
+
+def get_cue_info_for_folder(folder_path, listing=None):
+    """Получаем информацию о CUE-файлах в папке (из индекса медиатеки)"""
     cue_albums = []
-    
-    if not os.path.exists(folder_path):
+
+    if listing is None:
+        listing = get_folder_listing(folder_path)
+    if listing is None:
         return cue_albums
-    
-    # Ищем все CUE-файлы в папке
-    cue_files = [f for f in os.listdir(folder_path) 
-                 if f.lower().endswith('.cue') and os.path.isfile(os.path.join(folder_path, f))]
-    
-    for cue_file in cue_files:
-        cue_path = os.path.join(folder_path, cue_file)
-        try:
-            parser = CueParser(cue_path)
-            info = parser.get_info()
-            
-            # Проверяем, существует ли файл с музыкой
-            audio_file_path = None
-            if info['file']:
-                test_path = os.path.join(folder_path, info['file'])
-                if os.path.exists(test_path):
-                    audio_file_path = test_path
-            
-            if audio_file_path and info['tracks']:
-                cue_albums.append({
-                    'cue_file': cue_file,
-                    'audio_file': info['file'],
-                    'audio_file_path': audio_file_path,
-                    'title': info['title'] or os.path.splitext(cue_file)[0],
-                    'performer': info['performer'] or 'Unknown Artist',
-                    'tracks': info['tracks'],
-                    'total_tracks': len(info['tracks'])
-                })
-                
-        except Exception as e:
-            print(f"Ошибка при обработке CUE-файла {cue_file}: {e}")
+
+    try:
+        albums = library_index.cue_albums(library_scanner.relative_path(folder_path))
+    except Exception as e:
+        logger.error(f"Ошибка чтения CUE-альбомов из индекса: {e}")
+        return cue_albums
+
+    for info in albums:
+        # Проверяем, существует ли файл с музыкой
+        if info['file'] in listing and info['tracks']:
+            cue_file = info['cue_file']
+            # play() найдет CUE любого аудиофайла альбома без перебора папки
+            for name in {info['file'], *(track['file'] for track in info['tracks'])}:
+                if name:
+                    cue_cache.register(os.path.join(folder_path, name), os.path.join(folder_path, cue_file))
+            cue_albums.append({
+                'cue_file': cue_file,
+                'audio_file': info['file'],
+                'audio_file_path': os.path.join(folder_path, info['file']),
+                'title': info['title'] or os.path.splitext(cue_file)[0],
+                'performer': info['performer'] or 'Unknown Artist',
+                'tracks': info['tracks'],
+                'total_tracks': len(info['tracks'])
+            })
     
     return cue_albums
 
@@ -272,263 +343,373 @@ def get_best_audio_device():
         logger.error(f"Ошибка определения аудио устройства: {e}")
         return "auto"
 
-def get_file_duration_ffprobe(filepath):
+# Метаданные файлов пробуются один раз на (путь, размер, mtime)
+METADATA_CACHE_SIZE = 512
+metadata_cache = MetadataCache(library_scanner.stream_info, maxsize=METADATA_CACHE_SIZE,
+                               on_loaded=lambda path: emit_status_update())
+
+def get_file_duration(filepath):
     """
-    Получает длительность аудио файла через ffprobe как fallback для DSF/DSD файлов
+    Получает длительность аудио файла по заголовкам (ffprobe - только для
+    неизвестных контейнеров) как fallback для DSF/DSD файлов
     """
-    try:
-        import subprocess
-        cmd = [
-            'ffprobe', 
-            '-v', 'quiet', 
-            '-print_format', 'json', 
-            '-show_format', 
-            filepath
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            import json
-            probe_data = json.loads(result.stdout)
-            duration = float(probe_data.get('format', {}).get('duration', 0))
-            if duration > 0:
-                logger.info(f"📊 FFprobe определил duration: {duration:.1f}s для {os.path.basename(filepath)}")
-                return duration
-        else:
-            logger.warning(f"FFprobe error: {result.stderr}")
-    except Exception as e:
-        logger.warning(f"Ошибка ffprobe для {filepath}: {e}")
-    
-    return None
+    info = metadata_cache.get(filepath)
+    duration = info.get('duration') if info else None
+    if duration:
+        logger.info(f"📊 Проба определила duration: {duration:.1f}s для {os.path.basename(filepath)}")
+    return duration
 
-def save_volume_setting(volume):
-    """Сохраняет настройку громкости в файл"""
-    try:
-        volume_file = '/tmp/aether-player-volume.txt'
-        with open(volume_file, 'w') as f:
-            f.write(str(int(volume)))
-        logger.debug(f"💾 Громкость сохранена: {volume}%")
-    except Exception as e:
-        logger.warning(f"Не удалось сохранить громкость: {e}")
+# Глобальные переменные
+player_process = None
 
-def save_audio_enhancement_setting(preset):
-    """Сохраняет настройку предустановки аудио в файл"""
-    try:
-        preset_file = '/tmp/aether-player-audio-enhancement.txt'
-        with open(preset_file, 'w') as f:
-            f.write(str(preset))
-        logger.debug(f"💾 Предустановка аудио сохранена: {preset}")
-    except Exception as e:
-        logger.warning(f"Не удалось сохранить предустановку аудио: {e}")
+# Инициализация модуля аудио-улучшений
+audio_enhancer = AudioEnhancement()
 
-def load_volume_setting():
-    """Загружает сохраненную настройку громкости"""
+# Настройки: громкость, предустановка, пользовательские параметры, HDMI монитор
+SETTINGS_FILE = '/tmp/aether-player-settings.json'
+LEGACY_VOLUME_FILE = '/tmp/aether-player-volume.txt'
+LEGACY_AUDIO_ENHANCEMENT_FILE = '/tmp/aether-player-audio-enhancement.txt'
+
+settings_store = SettingsStore(SETTINGS_FILE, defaults={
+    'volume': 50,
+    'audio_enhancement': 'off',
+    'custom_enhancement': {},
+    'monitor_display_mode': 'split',
+    'monitor_theme': 'dark'
+})
+atexit.register(settings_store.flush)
+
+def _read_legacy_setting(path):
+    """Читает значение из старого однострочного файла настроек"""
     try:
-        volume_file = '/tmp/aether-player-volume.txt'
-        if os.path.exists(volume_file):
-            with open(volume_file, 'r') as f:
-                saved_volume = int(f.read().strip())
-                # Безопасное ограничение: не более 70% при запуске
-                safe_volume = min(saved_volume, 70)
-                if saved_volume > 70:
-                    logger.info(f"🔒 Громкость ограничена для безопасности: {saved_volume}% -> {safe_volume}%")
-                else:
-                    logger.info(f"📂 Загружена сохраненная громкость: {safe_volume}%")
-                return safe_volume
-    except Exception as e:
-        logger.warning(f"Не удалось загрузить громкость: {e}")
-    
-    # По умолчанию - безопасные 50%
-    logger.info("🔊 Установлена громкость по умолчанию: 50%")
-    return 50
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
 
-def load_audio_enhancement_setting():
-    """Загружает сохраненную предустановку виртуальной стереосцены"""
-    try:
-        preset_file = '/tmp/aether-player-audio-enhancement.txt'
-        if os.path.exists(preset_file):
-            with open(preset_file, 'r') as f:
-                saved_preset = f.read().strip()
-                # Проверяем, что предустановка корректна
-                if saved_preset in audio_enhancer.PRESETS:
-                    logger.info(f"📂 Загружена сохраненная предустановка аудио: {saved_preset}")
-                    return saved_preset
-                else:
-                    logger.warning(f"Некорректная сохраненная предустановка: {saved_preset}")
-    except Exception as e:
-        logger.warning(f"Не удалось загрузить предустановку аудио: {e}")
-    
-    # По умолчанию - выключено
-    logger.info("🎵 Установлена предустановка аудио по умолчанию: off")
-    return 'off'
+def load_player_settings():
+    """Загружает все сохраненные настройки одним чтением при старте"""
+    if not os.path.exists(SETTINGS_FILE):
+        # Переносим настройки из старых файлов (по одному файлу на настройку)
+        legacy_volume = _read_legacy_setting(LEGACY_VOLUME_FILE)
+        legacy_preset = _read_legacy_setting(LEGACY_AUDIO_ENHANCEMENT_FILE)
+        if legacy_volume and legacy_volume.isdigit():
+            settings_store.set('volume', int(legacy_volume))
+        if legacy_preset:
+            settings_store.set('audio_enhancement', legacy_preset)
+
+    settings = settings_store.load()
+
+    # Безопасное ограничение: не более 70% при запуске
+    saved_volume = int(settings.get('volume', 50))
+    safe_volume = max(0, min(saved_volume, 70))
+    if saved_volume > 70:
+        logger.info(f"🔒 Громкость ограничена для безопасности: {saved_volume}% -> {safe_volume}%")
+    else:
+        logger.info(f"📂 Загружена сохраненная громкость: {safe_volume}%")
+    settings['volume'] = safe_volume
 
-def save_audio_enhancement_setting(preset):
-    """Сохраняет предустановку виртуальной стереосцены в файл"""
-    try:
-        preset_file = '/tmp/aether-player-audio-enhancement.txt'
-        with open(preset_file, 'w') as f:
-            f.write(str(preset))
-        logger.debug(f"💾 Предустановка аудио сохранена: {preset}")
-    except Exception as e:
-        logger.warning(f"Не удалось сохранить предустановку аудио: {e}")
+    if settings.get('audio_enhancement') not in audio_enhancer.PRESETS:
+        logger.warning(f"Неизвестная предустановка аудио: {settings.get('audio_enhancement')}, используем 'off'")
+        settings['audio_enhancement'] = 'off'
+    logger.info(f"🎵 Предустановка аудио: {settings['audio_enhancement']}")
 
-def load_audio_enhancement_setting():
-    """Загружает сохраненную предустановку виртуальной стереосцены"""
-    try:
-        preset_file = '/tmp/aether-player-audio-enhancement.txt'
-        if os.path.exists(preset_file):
-            with open(preset_file, 'r') as f:
-                saved_preset = f.read().strip()
-                if saved_preset in audio_enhancer.PRESETS:
-                    logger.info(f"📂 Загружена сохраненная предустановка аудио: {saved_preset}")
-                    return saved_preset
-                else:
-                    logger.warning(f"Неизвестная предустановка аудио: {saved_preset}, используем 'off'")
-    except Exception as e:
-        logger.warning(f"Не удалось загрузить предустановку аудио: {e}")
-    
-    # По умолчанию - выключено
-    logger.info("🎵 Установлена предустановка аудио по умолчанию: off")
-    return 'off'
+    for setting_name, value in (settings.get('custom_enhancement') or {}).items():
+        audio_enhancer.update_custom_setting(setting_name, value)
 
-# Глобальные переменные
-player_process = None
-last_position_update = time.time()
+    return settings
 
-# Инициализация модуля аудио-улучшений
-audio_enhancer = AudioEnhancement()
+startup_settings = load_player_settings()
 
-# Состояние плеера
-player_state = {
+# Состояние плеера: запись под lock, чтение из неизменяемых снимков
+# Любая публикация новой версии будит push/long-poll рассылку
+player_state = StateStore({
     'status': 'stopped',
     'track': '',
     'position': 0.0,
     'duration': 0.0,
-    'volume': load_volume_setting(),  # Загружаем сохраненную громкость
+    'volume': startup_settings['volume'],  # Сохраненная громкость
     'playlist': [],
     'playlist_index': -1,
-    'audio_enhancement': load_audio_enhancement_setting(),  # Загружаем сохраненную предустановку
-    'cue_tracks': None,  # Список треков CUE для текущего файла
-    'current_cue_track': None  # Текущий трек CUE (определяется по позиции)
-}
+    'audio_enhancement': startup_settings['audio_enhancement'],  # Сохраненная предустановка
+    'cue_tracks': None,  # CueTrackTable треков CUE для текущего файла
+    'current_cue_track': None,  # Текущий трек CUE (определяется по позиции)
+    'mpv_idle': True,  # idle-active от MPV
+    'mpv_eof_reached': False,  # eof-reached от MPV
+    'gapless': False,  # Остаток плейлиста стоит в очереди MPV (loadfile append)
+    'mpv_source': None,  # Что загружено в MPV: файл или edl:// шкала многофайлового CUE
+    'mpv_playlist_offset': 0  # Индекс плейлиста, соответствующий playlist-pos 0 в MPV
+}, on_change=lambda version: emit_status_update())
 
 # Состояние монитора HDMI
 monitor_state = {
-    'display_mode': 'split',  # full, split, info
-    'theme': 'dark',  # dark, light
+    'display_mode': startup_settings['monitor_display_mode'],  # full, split, info
+    'theme': startup_settings['monitor_theme'],  # dark, light
     'current_image_index': 0,
     'image_gallery': [],  # Список изображений текущего альбома
 }
 
-def get_current_cue_track():
-    """Определяет текущий трек CUE по позиции воспроизведения"""
-    if not player_state.get('cue_tracks'):
+def get_current_cue_track(state=None):
+    """Определяет текущий трек CUE по позиции воспроизведения
+
+    state - снимок или черновик транзакции, по умолчанию текущий снимок.
+    """
+    if state is None:
+        state = player_state.snapshot()
+    table = state.get('cue_tracks')
+    if not table:
         return None
 
-    current_position = player_state['position']
-    tracks = player_state['cue_tracks']
+    # Двоичный поиск по границам треков; последний трек - до конца файла
+    return table.track_at(state['position'], state['duration'])
 
-    # Находим трек, в диапазон которого попадает текущая позиция
-    for i, track in enumerate(tracks):
-        track_start = track.get('relative_time_seconds', 0)
+def track_subpath(filepath):
+    """Путь трека относительно MEDIA_ROOT (как его отправляет UI)"""
+    return os.path.relpath(filepath, MEDIA_ROOT)
 
-        # Определяем конец трека
-        if i < len(tracks) - 1:
-            track_end = tracks[i + 1].get('relative_time_seconds', 0)
-        else:
-            # Последний трек - до конца файла
-            track_end = player_state['duration']
+def playing_subpath(state):
+    """Файл, который сейчас звучит (как его отправляет UI)
 
-        if track_start <= current_position < track_end:
-            return track
+    На шкале многофайлового CUE это FILE текущего трека, а не файл,
+    с которого начали воспроизведение.
+    """
+    cue_tracks = state.get('cue_tracks')
+    current_cue = state.get('current_cue_track')
+    if cue_tracks and cue_tracks.timeline and current_cue and current_cue.get('file'):
+        return os.path.join(os.path.dirname(state['track']), current_cue['file'])
+    return state['track']
 
-    return None
+def is_gapless_candidate(filepath, cue_tracks):
+    """Gapless-очередь используем только для обычных аудиофайлов (не CUE-альбомов)"""
+    return get_file_type(filepath) == 'audio' and not cue_tracks
 
-def update_position_if_playing():
-    """Обновляет позицию если трек играет"""
-    global player_state, last_position_update
+def queue_following_tracks(index):
+    """Ставит оставшиеся треки плейлиста в очередь MPV для gapless-воспроизведения
 
-    current_time = time.time()
+    MPV с --prefetch-playlist заранее открывает следующий файл, поэтому
+    переход между треками альбома происходит без паузы и без участия Python.
+    """
+    following = player_state['playlist'][index + 1:]
+    if following:
+        mpv_command_batch([{"command": ["loadfile", filepath, "append"]} for filepath in following])
+    player_state['gapless'] = True
+
+def handle_gapless_advance(mpv_position):
+    """MPV сам перешел на следующий элемент своей очереди - синхронизируем состояние"""
+    with player_state.transaction() as state:
+        new_index = state.get('mpv_playlist_offset', 0) + mpv_position
+        if new_index == state['playlist_index'] or new_index >= len(state['playlist']):
+            return
 
-    if player_state['status'] == 'playing':
-        time_elapsed = current_time - last_position_update
+        filepath = state['playlist'][new_index]
+        state.update({
+            'status': 'playing',
+            'track': track_subpath(filepath),
+            'position': 0.0,
+            'playlist_index': new_index,
+            'start_time': None,
+            'current_cue_track': None,
+            'mpv_source': filepath
+        })
+    logger.info(f"⏭️ Gapless переход на трек: {player_state['track']}")
 
-        # Обновляем позицию на основе прошедшего времени
-        if time_elapsed >= 0.1:  # Более частые обновления
-            player_state['position'] += time_elapsed
-            last_position_update = current_time
+def reset_player_state_after_end():
+    """Сбрасывает состояние плеера после окончания плейлиста"""
+    player_state.update({
+        'status': 'stopped',
+        'track': '',
+        'position': 0.0,
+        'playlist': [],
+        'playlist_index': -1,
+        'gapless': False,
+        'mpv_source': None
+    })
 
-            # Обновляем текущий трек CUE если есть
-            if player_state.get('cue_tracks'):
-                player_state['current_cue_track'] = get_current_cue_track()
+def handle_track_end():
+    """Автопереключение трека по событию end-file (reason=eof)"""
+    try:
+        state = player_state.snapshot()
+        if (not state.get('cue_tracks') and state['playlist'] and
+                state['playlist_index'] < len(state['playlist']) - 1):
+            handle_playlist_change('next')
+        else:
+            reset_player_state_after_end()
+    except Exception as e:
+        logger.error(f"Ошибка автопереключения трека: {e}")
 
-            # Проверяем конец трека
-            if player_state['position'] >= player_state['duration'] - 0.5:
-                if player_state['playlist'] and player_state['playlist_index'] < len(player_state['playlist']) - 1:
-                    handle_playlist_change('next')
-                else:
-                    player_state['status'] = 'stopped'
-                    player_state['track'] = ''
-                    player_state['position'] = 0.0
-                    player_state['playlist'] = []
-                    player_state['playlist_index'] = -1
+# Свойства MPV, изменения которых приходят событиями property-change
+MPV_OBSERVED_PROPERTIES = ['time-pos', 'duration', 'pause', 'idle-active', 'eof-reached', 'playlist-pos']
 
-# Фоновый мониторинг для автопереключения треков
-def background_monitor_thread():
-    """Фоновый поток для мониторинга MPV и автопереключения треков независимо от браузера"""
-    logger.info("🔄 Запущен фоновый мониторинг MPV для автопереключения треков")
+def handle_mpv_event(event):
+    """Переносит события MPV в player_state
 
-    while True:
-        try:
-            # Вызываем update_position_if_playing каждые 0.5 секунды
-            update_position_if_playing()
-            time.sleep(0.5)
-        except Exception as e:
-            logger.error(f"Ошибка в фоновом мониторинге: {e}")
-            time.sleep(1)  # При ошибке ждём дольше
+    Вызывается из потока чтения IPC - здесь нельзя ждать ответы MPV,
+    поэтому все, что шлет команды, уходит в отдельный поток.
+    """
+    event_name = event.get('event')
+
+    if event_name == 'property-change':
+        name = event.get('name')
+        value = event.get('data')
+
+        if name == 'time-pos':
+            if value is not None:
+                with player_state.transaction() as state:
+                    if state['status'] != 'stopped':
+                        state['position'] = float(value)
+                        if state.get('cue_tracks'):
+                            state['current_cue_track'] = get_current_cue_track(state)
+        elif name == 'duration':
+            if value:
+                player_state['duration'] = float(value)
+        elif name == 'pause':
+            if value is not None:
+                with player_state.transaction() as state:
+                    if state['status'] in ('playing', 'paused'):
+                        state['status'] = 'paused' if value else 'playing'
+        elif name == 'idle-active':
+            player_state['mpv_idle'] = bool(value)
+        elif name == 'eof-reached':
+            player_state['mpv_eof_reached'] = bool(value)
+        elif name == 'playlist-pos':
+            if value is not None and value >= 0 and player_state.get('gapless'):
+                handle_gapless_advance(value)
+
+    elif event_name == 'file-loaded':
+        logger.debug("MPV: file-loaded")
+
+    elif event_name == 'end-file':
+        reason = event.get('reason')
+        logger.debug(f"MPV: end-file (reason={reason})")
+        state = player_state.snapshot()
+        if reason == 'eof' and state['status'] == 'playing':
+            if (state.get('gapless') and
+                    state['playlist_index'] < len(state['playlist']) - 1):
+                return  # Следующий трек уже в очереди MPV, переход по playlist-pos
+            threading.Thread(target=handle_track_end, daemon=True).start()
+
+# Единый дедлайн ожидания загрузки файла в MPV (секунды)
+MPV_LOAD_TIMEOUT = 5.0
+
+def expect_track_loaded():
+    """Регистрирует ожидание загрузки файла - вызывать ДО loadfile"""
+    return mpv_ipc.expect(until_events=('playback-restart',), properties=('duration',))
+
+def wait_for_track_duration(waiter, filepath):
+    """Ждет готовности MPV после loadfile и возвращает длительность файла
+
+    Длительность берется из первого валидного property-change события,
+    поэтому ожидание длится ровно столько, сколько MPV грузит файл.
+    """
+    raw_duration = None
+    if waiter.wait(MPV_LOAD_TIMEOUT):
+        raw_duration = waiter.values.get('duration') or get_mpv_property("duration")
+    elif waiter.failed:
+        logger.warning(f"⚠️ MPV не смог загрузить файл: {filepath}")
+    else:
+        logger.warning(f"⚠️ MPV не загрузил файл за {MPV_LOAD_TIMEOUT}s: {filepath}")
+
+    if raw_duration:
+        logger.info(f"🎵 MPV duration получен: {raw_duration:.1f}s")
+
+    # Fallback для DSF файлов: читаем длительность из заголовков файла
+    if not raw_duration and filepath.lower().endswith(('.dsf', '.dff')):
+        logger.info("🔍 MPV не смог получить duration для DSF, читаем заголовки файла...")
+        raw_duration = get_file_duration(filepath)
+        if raw_duration:
+            logger.info(f"✅ Проба успешно определила duration: {raw_duration:.1f}s")
+
+    if not raw_duration:
+        raw_duration = 100.0
+        logger.warning(f"⚠️ Не удалось получить duration для {filepath}, используем fallback: {raw_duration}s")
+
+    return raw_duration
+
+mpv_ipc.add_event_handler(handle_mpv_event)
+for _property_name in MPV_OBSERVED_PROPERTIES:
+    mpv_ipc.observe_property(_property_name)
 
 # MPV управление
 def mpv_command(command):
     """Отправляет команду в MPV через IPC сокет"""
-    if not player_process or player_process.poll() is not None:
-        ensure_mpv_is_running()
-        if not player_process or player_process.poll() is not None:
-            return {"status": "error", "message": "mpv не удалось запустить"}
+    if not ensure_mpv_is_running():
+        return {"status": "error", "message": "MPV не готов (перезапускается)"}
     
-    try:
-        json_command = json.dumps(command) + '\n'
-        logger.debug(f"Отправка команды MPV: {json_command.strip()}")
-        
-        if not os.path.exists(MPV_SOCKET):
-            logger.error(f"Сокет {MPV_SOCKET} не существует")
-            return {"status": "error", "message": "MPV сокет не существует"}
-        
-        proc_result = isolated_run(
-            ['socat', '-t', '2', '-', MPV_SOCKET],
-            input=json_command, text=True, check=True, capture_output=True, timeout=2.0
-        )
-        stdout = proc_result.get('stdout', '')
-        
-        if stdout:
-            try:
-                return json.loads(stdout)
-            except json.JSONDecodeError as e:
-                logger.error(f"Ошибка JSON в ответе MPV: {e}")
-                return {"status": "error", "message": f"JSON error: {e}"}
-        return {"status": "ok"}
-    except Exception as e:
-        logger.error(f"Ошибка команды MPV: {e}")
-        return {"status": "error", "message": str(e)}
+    logger.debug(f"Отправка команды MPV: {json.dumps(command)}")
 
-def get_mpv_property(prop):
-    """Получает свойство из MPV"""
-    response = mpv_command({"command": ["get_property", prop]})
+    if not os.path.exists(MPV_SOCKET):
+        logger.error(f"Сокет {MPV_SOCKET} не существует")
+        return {"status": "error", "message": "MPV сокет не существует"}
+
+    response = mpv_ipc.command(command)
     if response.get("status") == "error":
+        logger.error(f"Ошибка команды MPV: {response.get('message')}")
+    return response
+
+def mpv_command_batch(commands):
+    """Отправляет несколько команд в MPV за один обмен по IPC сокету
+
+    Возвращает список ответов в порядке команд.
+    """
+    if not ensure_mpv_is_running():
+        return [{"status": "error", "message": "MPV не готов (перезапускается)"} for _ in commands]
+
+    logger.debug(f"Отправка пакета команд MPV ({len(commands)}): {json.dumps(commands)}")
+
+    if not os.path.exists(MPV_SOCKET):
+        logger.error(f"Сокет {MPV_SOCKET} не существует")
+        return [{"status": "error", "message": "MPV сокет не существует"} for _ in commands]
+
+    responses = mpv_ipc.command_batch(commands)
+    for command, response in zip(commands, responses):
+        if response.get("status") == "error":
+            logger.error(f"Ошибка команды MPV {command.get('command')}: {response.get('message')}")
+    return responses
+
+def mpv_response_data(response):
+    """Данные из ответа MPV на get_property, None при ошибке"""
+    if response.get("status") == "error" or response.get("error") not in (None, "success"):
         return None
     return response.get("data")
 
+# Громкость и перемотка с ползунков: в MPV уходит только последнее значение за квант
+MPV_COALESCE_INTERVAL = 0.05
+mpv_coalescer = CoalescingCommandQueue(mpv_command_batch, interval=MPV_COALESCE_INTERVAL)
+
+def get_mpv_property(prop):
+    """Получает свойство из MPV"""
+    return mpv_response_data(mpv_command({"command": ["get_property", prop]}))
+
+# Жизненным циклом MPV владеет mpv_supervisor_thread; обработчики запросов
+# только проверяют готовность и никогда не ждут запуска процесса
+mpv_ready = threading.Event()
+mpv_supervisor_wakeup = threading.Event()
+mpv_lifecycle_lock = threading.Lock()
+MPV_HEARTBEAT_INTERVAL = 2.0
+MPV_HEARTBEAT_FAILURES = 3  # Неотвеченных пингов подряд до принудительного перезапуска
+
+def is_mpv_process_alive():
+    """Жив ли процесс MPV (без обращения к сокету)"""
+    return player_process is not None and player_process.poll() is None
+
 def ensure_mpv_is_running():
-    """Обеспечивает работу процесса MPV"""
+    """Проверяет готовность MPV, не дожидаясь запуска
+
+    Если MPV не готов, будит супервизор и сразу возвращает False.
+    """
+    if mpv_ready.is_set() and is_mpv_process_alive():
+        return True
+    mpv_ready.clear()
+    mpv_supervisor_wakeup.set()
+    return False
+
+def mpv_heartbeat():
+    """Дешевая проверка живости MPV: один get_property по постоянному сокету"""
+    response = mpv_ipc.command({"command": ["get_property", "pid"]}, timeout=1.0)
+    return mpv_response_data(response) is not None
+
+def start_mpv_process():
+    """Запускает процесс MPV (вызывается только супервизором)"""
     global player_process
     
     if not player_process or player_process.poll() is not None:
@@ -542,6 +723,9 @@ def ensure_mpv_is_running():
             except:
                 pass
             player_process = None
+
+        # Старое IPC соединение относится к прежнему процессу
+        mpv_ipc.reset()
         
         # Завершаем только основной MPV процесс с IPC socket, НЕ трогая MPV для изображений
         try:
@@ -619,6 +803,9 @@ def ensure_mpv_is_running():
             # DSD/DSF поддержка - КРИТИЧЕСКИ ВАЖНО для воспроизведения DSF файлов
             "--audio-samplerate=0",            # Не ресемплируем - важно для DSD!
             "--ad=+dsd_lsbf,+dsd_msbf,+dsd_lsbf_planar,+dsd_msbf_planar",  # Явно включаем DSD декодеры
+            # Gapless: следующий трек из очереди MPV открывается заранее
+            "--gapless-audio=weak",            # Без паузы между файлами одного формата
+            "--prefetch-playlist=yes",         # Предзагрузка следующего элемента очереди
             # Минимальные параметры для поддержки и аудио, и видео
         ]
         
@@ -646,6 +833,9 @@ def ensure_mpv_is_running():
             if not os.path.exists(MPV_SOCKET):
                 logger.error("MPV запущен, но сокет не создан")
                 return False
+
+            # Сразу поднимаем постоянное IPC соединение
+            mpv_ipc.connect()
                 
         except Exception as e:
             logger.error(f"Ошибка запуска MPV: {e}")
@@ -653,9 +843,94 @@ def ensure_mpv_is_running():
         
     return True
 
+def restore_playback_after_restart(resume):
+    """Возвращает воспроизведение на место после перезапуска MPV
+
+    Громкость и цепочка фильтров уже переданы MPV аргументами запуска.
+    """
+    filepath = player_state['playlist'][resume['playlist_index']]
+    # Многофайловый CUE - снова всей шкалой EDL: позиция и таблица треков отсчитаны по ней
+    source = player_state.get('mpv_source') or filepath
+    vo_driver = "gpu" if get_file_type(filepath) == 'video' else "null"
+    logger.info(f"♻️ Восстанавливаем воспроизведение: {os.path.basename(filepath)} @ {resume['position']:.1f}s")
+
+    player_state.update({'gapless': False, 'mpv_playlist_offset': resume['playlist_index']})
+    waiter = expect_track_loaded()
+    responses = mpv_command_batch([
+        {"command": ["set_property", "vo", vo_driver]},
+        {"command": ["loadfile", source, "replace"]},
+    ])
+    if responses[-1].get("status") == "error":
+        waiter.cancel()
+        logger.error("Не удалось восстановить воспроизведение после перезапуска MPV")
+        return
+
+    wait_for_track_duration(waiter, filepath)
+    mpv_command_batch([
+        {"command": ["seek", resume['position'], "absolute"]},
+        {"command": ["set_property", "pause", resume['paused']]},
+    ])
+    if is_gapless_candidate(filepath, player_state.get('cue_tracks')):
+        queue_following_tracks(resume['playlist_index'])
+
+def restart_mpv():
+    """Теплый перезапуск MPV с последней громкостью, фильтрами и позицией"""
+    with mpv_lifecycle_lock:
+        resume = None
+        state = player_state.snapshot()
+        if state['status'] in ('playing', 'paused') and 0 <= state['playlist_index'] < len(state['playlist']):
+            resume = {
+                'playlist_index': state['playlist_index'],
+                'position': state['position'],
+                'paused': state['status'] == 'paused'
+            }
+
+        if not start_mpv_process():
+            return False
+
+    mpv_ready.set()
+    logger.info("✅ MPV готов")
+
+    if resume:
+        restore_playback_after_restart(resume)
+    return True
+
+def mpv_supervisor_thread():
+    """Фоновый супервизор MPV: heartbeat, обнаружение падений и перезапуск"""
+    logger.info("🛡️ Запущен супервизор MPV")
+    failures = 0
+
+    while True:
+        try:
+            if is_mpv_process_alive():
+                if mpv_heartbeat():
+                    failures = 0
+                    mpv_ready.set()
+                else:
+                    failures += 1
+                    logger.warning(f"MPV не ответил на heartbeat ({failures}/{MPV_HEARTBEAT_FAILURES})")
+                    if failures >= MPV_HEARTBEAT_FAILURES:
+                        logger.error("MPV завис - принудительный перезапуск")
+                        mpv_ready.clear()
+                        with mpv_lifecycle_lock:
+                            if is_mpv_process_alive():
+                                player_process.kill()
+
+            if not is_mpv_process_alive():
+                mpv_ready.clear()
+                failures = 0
+                if player_process is not None:
+                    logger.warning("⚠️ Процесс MPV завершился - перезапуск в фоне")
+                restart_mpv()
+        except Exception as e:
+            logger.error(f"Ошибка в супервизоре MPV: {e}")
+
+        mpv_supervisor_wakeup.wait(MPV_HEARTBEAT_INTERVAL)
+        mpv_supervisor_wakeup.clear()
+
 def apply_audio_enhancement(preset_name='off'):
     """Применяет аудиофильтры для виртуальной стереосцены"""
-    global player_state, audio_enhancer
+    global audio_enhancer
     
     try:
         # Получаем цепочку фильтров
@@ -666,7 +941,7 @@ def apply_audio_enhancement(preset_name='off'):
         audio_enhancer.current_preset = preset_name
         
         # Сохраняем настройку
-        save_audio_enhancement_setting(preset_name)
+        settings_store.set('audio_enhancement', preset_name)
         
         # Проверяем, запущен ли MPV
         if not player_process or player_process.poll() is not None:
@@ -701,16 +976,29 @@ def apply_audio_enhancement(preset_name='off'):
         try:
             player_state['audio_enhancement'] = preset_name
             audio_enhancer.current_preset = preset_name
-            save_audio_enhancement_setting(preset_name)
+            settings_store.set('audio_enhancement', preset_name)
             logger.info(f"🎵 Предустановка '{preset_name}' сохранена несмотря на ошибку")
             return True
         except:
             return False
 
 def stop_mpv_internal():
-    """Останавливает MPV процесс"""
+    """Останавливает MPV процесс
+
+    Супервизор сразу поднимет новый MPV в режиме ожидания, чтобы следующее
+    воспроизведение не ждало запуска процесса.
+    """
+    with mpv_lifecycle_lock:
+        # Остановка намеренная - супервизор не должен восстанавливать трек
+        player_state['status'] = 'stopped'
+        _stop_mpv_process()
+
+    mpv_supervisor_wakeup.set()
+
+def _stop_mpv_process():
+    """Завершает процесс MPV (под mpv_lifecycle_lock)"""
     global player_process
-    
+
     if player_process:
         try:
             # Сначала пытаемся нормально остановить через команду
@@ -730,6 +1018,9 @@ def stop_mpv_internal():
             pass
         
         player_process = None
+
+    mpv_ready.clear()
+    mpv_ipc.reset()
     
     # Завершаем все процессы
     try:
@@ -740,50 +1031,26 @@ def stop_mpv_internal():
         pass
 
 def emit_status_update():
-    """Отправляет обновление статуса клиентам"""
-    status_data = {
-        'state': player_state['status'],
-        'track': player_state['track'],
-        'position': round(player_state['position'], 1),
-        'duration': round(player_state['duration'], 1),
-        'volume': player_state['volume']
-    }
-    if socketio:
-        socketio.emit('status_update', status_data)
+    """Сообщает push-каналу, что состояние изменилось (рассылка дельт в фоне)"""
+    state_publisher.notify()
+
 def status_update_task():
     """Отключённая фоновая задача"""
     pass
 
 def handle_cue_track_change(direction):
-    """Обработка смены CUE-трека внутри одного файла"""
-    global player_state, last_position_update
-
-    cue_tracks = player_state.get('cue_tracks')
+    """Обработка смены CUE-трека внутри файла (или шкалы многофайлового CUE)"""
+    state = player_state.snapshot()
+    cue_tracks = state.get('cue_tracks')
     if not cue_tracks:
         return
 
-    current_position = player_state['position']
-    current_cue = player_state.get('current_cue_track')
+    current_position = state['position']
 
-    # Находим индекс текущего трека
-    current_index = -1
-    for i, track in enumerate(cue_tracks):
-        if current_cue and track.get('number') == current_cue.get('number'):
-            current_index = i
-            break
-
-    # Если не нашли текущий трек, определяем по позиции
+    # Индекс текущего трека, если не известен - по позиции
+    current_index = cue_tracks.index_of(state.get('current_cue_track'))
     if current_index == -1:
-        for i, track in enumerate(cue_tracks):
-            track_start = track.get('relative_time_seconds', 0)
-            if i < len(cue_tracks) - 1:
-                track_end = cue_tracks[i + 1].get('relative_time_seconds', 0)
-            else:
-                track_end = player_state['duration']
-
-            if track_start <= current_position < track_end:
-                current_index = i
-                break
+        current_index = cue_tracks.index_at(current_position, state['duration'])
 
     logger.info(f"[CUE NAVIGATION] Текущий индекс трека: {current_index}/{len(cue_tracks)}")
 
@@ -797,14 +1064,12 @@ def handle_cue_track_change(direction):
     elif direction == 'previous':
         # Если воспроизведение больше 3 секунд от начала трека, перемотать в начало текущего
         if current_index >= 0:
-            track_start = cue_tracks[current_index].get('relative_time_seconds', 0)
+            track_start = cue_tracks.starts[current_index]
             if current_position - track_start > 3.0:
                 logger.info(f"[CUE NAVIGATION] Перемотка в начало текущего трека: {track_start}s")
                 mpv_command({"command": ["seek", track_start, "absolute"]})
-                player_state['position'] = track_start
-                player_state['current_cue_track'] = cue_tracks[current_index]
-                last_position_update = time.time()
-                emit_status_update()
+                player_state.update({'position': track_start,
+                                     'current_cue_track': cue_tracks.tracks[current_index]})
                 return
 
         # Иначе переход к предыдущему треку
@@ -817,40 +1082,44 @@ def handle_cue_track_change(direction):
         return
 
     # Перематываем на начало целевого трека
-    target_track = cue_tracks[target_index]
-    target_time = target_track.get('relative_time_seconds', 0)
+    target_track = cue_tracks.tracks[target_index]
+    target_time = cue_tracks.starts[target_index]
 
     logger.info(f"[CUE NAVIGATION] Переход на трек {target_index + 1}: {target_track.get('title')} (время: {target_time}s)")
 
     mpv_command({"command": ["seek", target_time, "absolute"]})
-    player_state['position'] = target_time
-    player_state['current_cue_track'] = target_track
-    last_position_update = time.time()
+    player_state.update({'position': target_time, 'current_cue_track': target_track})
 
-    emit_status_update()
+# Смена трека приходит и из API, и из автопереключения по end-file -
+# выполняем их по очереди, чтобы вторая видела результат первой
+playlist_change_lock = threading.RLock()
 
 def handle_playlist_change(direction):
     """Обработка смены трека в плейлисте или CUE-треках"""
-    global player_state
+    with playlist_change_lock:
+        _handle_playlist_change(direction)
+
+def _handle_playlist_change(direction):
+    state = player_state.snapshot()
 
     # Проверяем, воспроизводим ли мы CUE-альбом
-    if player_state.get('cue_tracks'):
+    if state.get('cue_tracks'):
         logger.info(f"[CUE NAVIGATION] Навигация по CUE-трекам: {direction}")
         handle_cue_track_change(direction)
         return
 
-    if not player_state['playlist']:
+    if not state['playlist']:
         return
 
-    current_index = player_state['playlist_index']
+    current_index = state['playlist_index']
     
     if direction == 'next':
-        if current_index < len(player_state['playlist']) - 1:
+        if current_index < len(state['playlist']) - 1:
             new_index = current_index + 1
         else:
             return  # Конец плейлиста
     elif direction == 'previous':
-        if player_state['position'] > 3.0 or current_index == 0:
+        if state['position'] > 3.0 or current_index == 0:
             # Перемотка в начало текущего трека
             mpv_command({"command": ["seek", 0, "absolute"]})
             player_state['position'] = 0.0
@@ -860,53 +1129,30 @@ def handle_playlist_change(direction):
     else:
         return
     
-    # Загружаем новый трек
-    filepath = player_state['playlist'][new_index]
+    # Загружаем новый трек (replace очищает очередь MPV)
+    filepath = state['playlist'][new_index]
+    player_state.update({'gapless': False, 'mpv_playlist_offset': new_index})
+    waiter = expect_track_loaded()
     mpv_result = mpv_command({"command": ["loadfile", filepath, "replace"]})
     
     if mpv_result.get("status") != "error":
-        # Синхронизируемся с MPV для получения duration
-        time.sleep(0.5)
-        
-        # Получаем duration с улучшенной поддержкой DSF файлов
-        raw_duration = None
-        is_dsf_file = filepath.lower().endswith(('.dsf', '.dff'))
-        
-        # Для DSF файлов используем более агрессивный подход
-        retry_count = 10 if is_dsf_file else 5
-        sleep_interval = 0.5 if is_dsf_file else 0.2
-        
-        for attempt in range(retry_count):
-            raw_duration = get_mpv_property("duration")
-            if raw_duration and raw_duration > 0:
-                logger.info(f"🎵 MPV duration получен на попытке {attempt+1}: {raw_duration:.1f}s")
-                break
-            time.sleep(sleep_interval)
-        
-        # Fallback для DSF файлов: используем ffprobe
-        if not raw_duration and is_dsf_file:
-            logger.info("🔍 MPV не смог получить duration для DSF, пробуем ffprobe...")
-            raw_duration = get_file_duration_ffprobe(filepath)
-            if raw_duration:
-                logger.info(f"✅ FFprobe успешно определил duration: {raw_duration:.1f}s")
-        
-        if not raw_duration:
-            raw_duration = 100.0
-            logger.warning(f"⚠️ Не удалось получить duration для {filepath}, используем fallback: {raw_duration}s")
+        raw_duration = wait_for_track_duration(waiter, filepath)
         
         player_state.update({
             'status': 'playing',
-            'track': os.path.basename(filepath),
+            'track': track_subpath(filepath),
             'position': 0.0,
             'duration': raw_duration,
-            'playlist_index': new_index
+            'playlist_index': new_index,
+            'mpv_source': filepath
         })
-        
-        # Обновляем время последнего изменения позиции
-        global last_position_update
-        last_position_update = time.time()
+
+        if is_gapless_candidate(filepath, player_state.get('cue_tracks')):
+            queue_following_tracks(new_index)
         
         logger.info(f"Переключен на трек: {player_state['track']} (duration: {raw_duration})")
+    else:
+        waiter.cancel()
 
 # API маршруты
 @app.route("/")
@@ -933,26 +1179,29 @@ def browse(subpath=""):
     current_path = os.path.join(MEDIA_ROOT, subpath)
     if not os.path.realpath(current_path).startswith(os.path.realpath(MEDIA_ROOT)):
         abort(403)
-    if not os.path.isdir(current_path):
+
+    # Содержимое папки из индекса медиатеки: на диск - только stat папки
+    listing = get_folder_listing(current_path)
+    if listing is None:
         abort(404)
     
-    items = os.listdir(current_path)
-    folders = sorted([i for i in items if os.path.isdir(os.path.join(current_path, i))])
-    files = sorted([i for i in items if os.path.isfile(os.path.join(current_path, i))])
     parent_path = os.path.dirname(subpath) if subpath else None
+    total_entries = len(listing.folders) + len(listing.files)
+
+    # Большие папки не рендерим целиком: страница подгружает их через /api/browse
+    virtual_list = total_entries > BROWSE_VIRTUAL_THRESHOLD
+    if virtual_list:
+        folders = []
+        files = []
+    else:
+        folders = list(listing.folders)
+        files = [f.name for f in listing.files]
     
     # Ищем CUE-файлы в текущей папке
-    cue_albums = get_cue_info_for_folder(current_path)
+    cue_albums = get_cue_info_for_folder(current_path, listing)
     
     # Добавляем информацию о типах файлов
-    files_with_types = []
-    for file in files:
-        file_path = os.path.join(current_path, file)
-        file_type = get_file_type(file_path)
-        files_with_types.append({
-            'name': file,
-            'type': file_type
-        })
+    files_with_types = [] if virtual_list else [{'name': f.name, 'type': f.type} for f in listing.files]
     
     return render_template("index.html", 
                          current_subpath=subpath, 
@@ -960,7 +1209,127 @@ def browse(subpath=""):
                          files_with_types=files_with_types,
                          files=files,  # Оставляем для обратной совместимости
                          cue_albums=cue_albums,  # Добавляем CUE-альбомы
-                         parent_path=parent_path)
+                         parent_path=parent_path,
+                         virtual_list=virtual_list,
+                         total_entries=total_entries)
+
+# Постраничный просмотр больших папок
+BROWSE_VIRTUAL_THRESHOLD = 500  # Папки больше этого рендерятся виртуальным списком
+BROWSE_PAGE_SIZE = 200
+BROWSE_MAX_PAGE_SIZE = 1000
+BROWSE_TYPES = {'folder', 'audio', 'video', 'image', 'text', 'unknown'}
+
+def encode_browse_cursor(mtime_ns, offset, last_name):
+    """Курсор следующей страницы: позиция и имя последнего элемента"""
+    raw = json.dumps({'m': mtime_ns, 'o': offset, 'n': last_name}, ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_browse_cursor(cursor, entries, mtime_ns):
+    """Смещение начала страницы по курсору
+
+    Пока папка не менялась, курсор - просто позиция. Если папка изменилась
+    между страницами, продолжаем после последнего показанного имени, чтобы
+    не пропустить и не повторить элементы. ValueError - курсор испорчен.
+    """
+    data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    offset = int(data['o'])
+    if offset < 0:
+        raise ValueError(f"Отрицательное смещение курсора: {offset}")
+    if data.get('m') == mtime_ns:
+        if offset > len(entries):
+            raise ValueError(f"Смещение курсора за концом папки: {offset}")
+        return offset
+    last_name = data.get('n')
+    for position, entry in enumerate(entries):
+        if entry.name == last_name:
+            return position + 1
+    return min(offset, len(entries))
+
+@app.route('/api/browse')
+def api_browse():
+    """Страница содержимого папки в JSON
+
+    ?path=<папка>&cursor=<курсор>&limit=<N>&sort=name|type|size|mtime
+    &order=asc|desc&type=audio,video,... Папки идут первыми.
+    """
+    if not is_hdd_available():
+        return jsonify({'status': 'error', 'message': 'HDD не подключен'}), 503
+
+    subpath = request.args.get('path', '').strip('/')
+    current_path = os.path.join(MEDIA_ROOT, subpath)
+    if not os.path.realpath(current_path).startswith(os.path.realpath(MEDIA_ROOT)):
+        abort(403)
+
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    types = {t for t in request.args.get('type', '').split(',') if t}
+    if sort not in SORT_KEYS or order not in ('asc', 'desc') or not types <= BROWSE_TYPES:
+        return jsonify({'status': 'error', 'message': 'Некорректные параметры сортировки или фильтра'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', BROWSE_PAGE_SIZE)), 1), BROWSE_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Некорректный limit'}), 400
+
+    listing = get_folder_listing(current_path)
+    if listing is None:
+        return jsonify({'status': 'error', 'message': 'Папка не найдена'}), 404
+    entries = listing.view(sort, order == 'desc', types or None)
+
+    cursor = request.args.get('cursor')
+    offset = 0
+    if cursor:
+        try:
+            offset = decode_browse_cursor(cursor, entries, listing.mtime_ns)
+        except (ValueError, KeyError, TypeError):
+            return jsonify({'status': 'error', 'message': 'Некорректный курсор'}), 400
+
+    page = entries[offset:offset + limit]
+    end = offset + len(page)
+    next_cursor = encode_browse_cursor(listing.mtime_ns, end, page[-1].name) if page and end < len(entries) else None
+
+    return jsonify({
+        'path': subpath,
+        'total': len(entries),
+        'offset': offset,
+        'items': [{'name': e.name, 'type': e.type, 'size': e.size,
+                   'mtime': e.mtime_ns / 1e9 if e.mtime_ns is not None else None} for e in page],
+        'next_cursor': next_cursor
+    })
+
+# Поиск по медиатеке
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_PAGE_SIZE = 200
+
+@app.route('/api/search')
+def api_search():
+    """Поиск по индексу медиатеки
+
+    ?q=<запрос>&limit=<N>&offset=<N>&kind=folder,file,album,track
+    Ищутся имена папок и файлов, названия и исполнители CUE-альбомов и треков.
+    """
+    query = request.args.get('q', '').strip()
+    kinds = [k for k in request.args.get('kind', '').split(',') if k]
+    if any(kind not in SEARCH_KINDS for kind in kinds):
+        return jsonify({'status': 'error', 'message': 'Некорректный kind'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Некорректные limit/offset'}), 400
+
+    try:
+        # Запрашиваем на одну запись больше - так известно, есть ли следующая страница
+        results = library_index.search(query, limit=limit + 1, offset=offset, kinds=kinds or None)
+    except Exception as e:
+        logger.error(f"Ошибка поиска по медиатеке '{query}': {e}")
+        return jsonify({'status': 'error', 'message': 'Ошибка поиска'}), 500
+
+    has_more = len(results) > limit
+    return jsonify({
+        'query': query,
+        'results': results[:limit],
+        'next_offset': offset + limit if has_more else None
+    })
 
 @app.route('/media/<path:filepath>')
 def media_file(filepath):
@@ -1020,6 +1389,11 @@ def get_hdd_status():
     """API endpoint для проверки статуса HDD"""
     return jsonify(check_hdd_status())
 
+@app.route('/api/library/status')
+def get_library_status():
+    """API endpoint хода сканирования и размера индекса медиатеки"""
+    return jsonify({'progress': library_scanner.progress, 'index': library_index.stats()})
+
 @app.route('/api/retry-hdd-mount')
 def retry_hdd_mount():
     """API endpoint для повторной попытки монтирования HDD"""
@@ -1044,47 +1418,35 @@ def retry_hdd_mount():
             'error': str(e)
         }), 500
 
-@app.route('/get_status')
-def get_status():
-    """Возвращает текущий статус плеера"""
-    update_position_if_playing()
-
-    position = player_state['position']
-    duration = player_state['duration']
+def build_status_snapshot():
+    """Снимок статуса плеера для основного интерфейса"""
+    state = player_state.snapshot()
+    position = state['position']
+    duration = state['duration']
 
     # Добавляем информацию о текущем CUE треке если есть
-    current_cue = player_state.get('current_cue_track')
-    logger.debug(f"[GET_STATUS] status={player_state['status']}, cue_tracks={player_state.get('cue_tracks') is not None}, current_cue={current_cue is not None}")
-    if current_cue:
+    current_cue = state.get('current_cue_track')
+    if current_cue and state.get('cue_tracks'):
         # Для CUE треков корректируем position и duration
-        track_start = current_cue.get('relative_time_seconds', 0)
-
-        # Определяем конец трека
-        cue_tracks = player_state.get('cue_tracks', [])
-        track_index = None
-        for i, track in enumerate(cue_tracks):
-            if track.get('number') == current_cue.get('number'):
-                track_index = i
-                break
-
-        if track_index is not None:
-            if track_index < len(cue_tracks) - 1:
-                track_end = cue_tracks[track_index + 1].get('relative_time_seconds', 0)
-            else:
-                track_end = player_state['duration']
+        cue_tracks = state['cue_tracks']
+        track_index = cue_tracks.index_of(current_cue)
+
+        if track_index >= 0:
+            track_start = cue_tracks.starts[track_index]
+            track_end = cue_tracks.end(track_index, state['duration'])
 
             # Корректируем position и duration для отображения трека
             position = position - track_start  # Относительная позиция внутри трека
             duration = track_end - track_start  # Длительность трека
 
     response_data = {
-        'state': player_state['status'],
-        'track': player_state['track'],
+        'state': state['status'],
+        'track': playing_subpath(state),
         'position': round(position, 1),
         'duration': round(duration, 1),
-        'volume': player_state['volume'],
-        'audio_enhancement': player_state.get('audio_enhancement', 'off'),
-        'start_time': player_state.get('start_time')  # Время начала для CUE треков
+        'volume': state['volume'],
+        'audio_enhancement': state.get('audio_enhancement', 'off'),
+        'start_time': state.get('start_time')  # Время начала для CUE треков
     }
 
     if current_cue:
@@ -1093,19 +1455,65 @@ def get_status():
         response_data['cue_track_start_time'] = current_cue.get('relative_time_seconds', 0)
         response_data['cue_track_performer'] = current_cue.get('performer', '')
 
-    logger.debug(f"[GET_STATUS] Возврат: state={response_data['state']}, pos={response_data['position']}, dur={response_data['duration']}, has_cue_data={'cue_track_number' in response_data}")
+    return response_data
+
+def _requested_state_version():
+    """Версия, которую уже видел клиент: ?since=<версия> или If-None-Match"""
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            return int(since)
+        except ValueError:
+            return None
+
+    for etag in request.if_none_match:
+        prefix, _, version = etag.rpartition('-')
+        if prefix == STATE_ETAG_PREFIX and version.isdigit():
+            return int(version)
+    return None
 
-    # Запрещаем кэширование статуса
-    response = jsonify(response_data)
+def state_channel_response(channel_name):
+    """Ответ со снимком канала состояния с поддержкой long-poll
+
+    Без since/If-None-Match отвечает сразу. Иначе держит запрос, пока версия
+    канала не изменится или не истечет timeout, и тогда отвечает 304.
+    """
+    since = _requested_state_version()
+    if since is None:
+        version, snapshot = state_publisher.current(channel_name)
+    else:
+        try:
+            timeout = float(request.args.get('timeout', LONG_POLL_TIMEOUT))
+        except ValueError:
+            timeout = LONG_POLL_TIMEOUT
+        timeout = max(0.0, min(timeout, LONG_POLL_MAX_TIMEOUT))
+        version, snapshot = state_publisher.wait_for_change(channel_name, since, timeout)
+
+    if snapshot is None:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(snapshot)
+
+    # Запрещаем кэширование статуса, версию клиент передает сам
+    response.set_etag(f"{STATE_ETAG_PREFIX}-{version}")
+    response.headers['X-State-Version'] = str(version)
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
     return response
 
+@app.route('/get_status')
+def get_status():
+    """Возвращает текущий статус плеера (fallback для клиентов без Socket.IO)
+
+    ?since=<версия> или If-None-Match включают long-poll (304 без изменений).
+    """
+    return state_channel_response('status')
+
 @app.route("/play", methods=['POST'])
 def play():
     """Начать воспроизведение файла"""
-    global player_state, monitor_state
+    global monitor_state
 
     file_subpath = request.form.get('filepath')
     start_time = request.form.get('start_time')  # Время начала в секундах для CUE-треков
@@ -1121,18 +1529,14 @@ def play():
         logger.info(f"Отображение изображения: {file_subpath}")
 
         # Обновляем состояние для HDMI display
-        image_dir = os.path.dirname(full_path)
-        image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff')
-        monitor_state['image_gallery'] = [
-            os.path.join(image_dir, f) for f in sorted(os.listdir(image_dir))
-            if f.lower().endswith(image_extensions)
-        ]
+        monitor_state['image_gallery'] = get_image_gallery(get_folder_listing(os.path.dirname(full_path)))
         try:
             monitor_state['current_image_index'] = monitor_state['image_gallery'].index(full_path)
         except ValueError:
             monitor_state['current_image_index'] = 0
 
         logger.info(f"🖼️ Изображение отображено на HDMI через браузер: {os.path.basename(full_path)} ({monitor_state['current_image_index'] + 1}/{len(monitor_state['image_gallery'])})")
+        emit_status_update()
 
         return jsonify({'status': 'ok', 'message': 'Изображение отображено'})
     
@@ -1140,8 +1544,9 @@ def play():
     if file_type not in ['audio', 'video']:
         return jsonify({'status': 'error', 'message': 'Неподдерживаемый тип файла'})
     
-    # Подготавливаем MPV
-    ensure_mpv_is_running()
+    # MPV запускает супервизор - здесь только проверяем готовность
+    if not ensure_mpv_is_running():
+        return jsonify({'status': 'error', 'message': 'MPV перезапускается, повторите через секунду'})
 
     # НЕ закрываем изображения при воспроизведении аудио - пусть остаются на экране
     
@@ -1151,132 +1556,120 @@ def play():
     logger.info(f"Директория: {current_dir}")
     logger.info(f"Директория существует: {os.path.exists(current_dir)}")
     
-    if not os.path.exists(current_dir):
+    listing = get_folder_listing(current_dir)
+    if listing is None:
         logger.error(f"Директория не найдена: {current_dir}")
         return jsonify({'status': 'error', 'message': f'Директория не найдена: {os.path.basename(current_dir)}'})
     
-    all_files = os.listdir(current_dir)
-    playlist = []
-    
-    for f in sorted(all_files):
-        file_path = os.path.join(current_dir, f)
-        if get_file_type(file_path) in ['audio', 'video']:
-            playlist.append(file_path)
+    playlist = listing.paths('audio', 'video')
     
     try:
         playlist_index = playlist.index(full_path)
     except ValueError:
         playlist = [full_path]
         playlist_index = 0
-    
-    # Переключаем video output в зависимости от типа файла
+
+    # CUE этого аудиофайла: обратная карта кэша, при промахе - разбор .cue папки.
+    # Нужен до loadfile: многофайловый CUE (стороны винила) загружается
+    # одной шкалой EDL, и переходы между файлами идут без перезагрузки
+    audio_dir = os.path.dirname(full_path)
+    cue_path, cue_info = cue_cache.find_for_audio(
+        full_path, [os.path.join(audio_dir, name) for name in listing.with_extension('.cue')])
+    cue_timeline = None
+    if cue_info and file_type == 'audio':
+        cue_timeline = build_cue_timeline(cue_path, cue_info['tracks'], get_file_duration)
+        if cue_timeline:
+            logger.info(f"📀 Многофайловый CUE: {len(cue_timeline.paths)} файлов одной шкалой")
+    
+    # Переключаем video output в зависимости от типа файла и загружаем файл -
+    # одним пакетом, MPV выполнит команды по порядку
     if file_type == 'video':
         # Для видео включаем DRM output
         logger.info("🎬 Видео файл - включаем DRM output")
-        mpv_command({"command": ["set_property", "vo", "gpu"]})
-        mpv_command({"command": ["set_property", "gpu-context", "drm"]})
+        load_commands = [
+            {"command": ["set_property", "vo", "gpu"]},
+            {"command": ["set_property", "gpu-context", "drm"]},
+        ]
     else:
         # Для аудио отключаем video output, чтобы не блокировать DRM для изображений
         logger.info("🎵 Аудио файл - отключаем video output (vo=null)")
-        mpv_command({"command": ["set_property", "vo", "null"]})
-
-    # Загружаем файл в MPV
-    mpv_result = mpv_command({"command": ["loadfile", full_path, "replace"]})
+        load_commands = [{"command": ["set_property", "vo", "null"]}]
+    mpv_source = cue_timeline.url if cue_timeline else full_path
+    load_commands.append({"command": ["loadfile", mpv_source, "replace"]})
+
+    # Ожидание готовности регистрируем до отправки loadfile
+    player_state.update({'gapless': False, 'mpv_playlist_offset': playlist_index})
+    waiter = expect_track_loaded()
+    mpv_result = mpv_command_batch(load_commands)[-1]
     if mpv_result.get("status") == "error":
+        waiter.cancel()
         logger.error(f"Ошибка загрузки файла: {mpv_result}")
         return jsonify({'status': 'error', 'message': 'Ошибка загрузки файла'})
+
+    # Метаданные для монитора пробуем один раз, пока MPV грузит файл
+    metadata_cache.prefetch(full_path)
     
+    # Обновляем галерею изображений для монитора (тот же листинг, что и плейлист)
+    monitor_state['image_gallery'] = get_image_gallery(listing)
+    logger.info(f"🖼️ Обновлена галерея изображений: {len(monitor_state['image_gallery'])} файлов")
+
     # Загружаем информацию о CUE треках если есть CUE файл для этого аудио
     cue_tracks_info = None
-    audio_dir = os.path.dirname(full_path)
-    audio_filename = os.path.basename(full_path)
+    if cue_info:
+        # Границы треков считаются один раз - статус и навигация ищут по ним bisect'ом
+        # Без шкалы в MPV только этот файл - и в таблице только треки его FILE
+        cue_tracks_info = CueTrackTable(cue_info['tracks'], cue_timeline.offsets if cue_timeline else None,
+                                        cue_file_for_audio(cue_info, os.path.basename(full_path)))
+        logger.info(f"📀 Загружен CUE файл: {os.path.basename(cue_path)}, треков: {len(cue_tracks_info)}")
 
-    # Обновляем галерею изображений для монитора
-    image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff')
-    monitor_state['image_gallery'] = [
-        os.path.join(audio_dir, f) for f in sorted(os.listdir(audio_dir))
-        if f.lower().endswith(image_extensions)
-    ]
-    logger.info(f"🖼️ Обновлена галерея изображений: {len(monitor_state['image_gallery'])} файлов")
+    # Пока MPV грузил файл, мы подготовили галерею и треки - теперь ждем готовности
+    raw_duration = wait_for_track_duration(waiter, full_path)
 
-    for cue_file in os.listdir(audio_dir):
-        if cue_file.lower().endswith('.cue'):
-            cue_path = os.path.join(audio_dir, cue_file)
-            try:
-                parser = CueParser(cue_path)
-                info = parser.get_info()
-                # Проверяем, что этот CUE файл относится к нашему аудио файлу
-                if info['file'] == audio_filename:
-                    cue_tracks_info = info['tracks']
-                    logger.info(f"📀 Загружен CUE файл: {cue_file}, треков: {len(cue_tracks_info)}")
-                    break
-            except Exception as e:
-                logger.warning(f"Ошибка загрузки CUE файла {cue_file}: {e}")
+    # Стартовые настройки воспроизведения - один обмен с MPV вместо десятка
+    start_commands = []
 
     # Если указано время начала (для CUE-треков), устанавливаем позицию
     initial_position = 0.0
+    start_seconds = 0.0
     if start_time:
         try:
             start_seconds = float(start_time)
-            initial_position = start_seconds
-            # Ждем немного, чтобы файл загрузился
-            time.sleep(0.3)
-            mpv_command({"command": ["seek", start_seconds, "absolute"]})
-            logger.info(f"Установлена позиция: {start_seconds}s")
         except (ValueError, TypeError) as e:
             logger.warning(f"Некорректное время начала: {start_time}, ошибка: {e}")
+    if cue_timeline:
+        # Время внутри файла -> позиция на шкале всего альбома
+        start_seconds = cue_timeline.position(full_path, start_seconds)
+    if start_seconds:
+        initial_position = start_seconds
+        start_commands.append({"command": ["seek", start_seconds, "absolute"]})
+        logger.info(f"Установлена позиция: {start_seconds}s")
     
     # Настройки в зависимости от типа файла
     if file_type == 'video':
         logger.info(f"Воспроизведение видео: {os.path.basename(full_path)}")
         # Включаем видео вывод и полноэкранный режим для видео
-        mpv_command({"command": ["set_property", "vid", "auto"]})  # Включаем видео
-        mpv_command({"command": ["set_property", "fullscreen", True]})
-        mpv_command({"command": ["set_property", "vo", "gpu"]})  # GPU вывод для HDMI
+        start_commands += [
+            {"command": ["set_property", "vid", "auto"]},  # Включаем видео
+            {"command": ["set_property", "fullscreen", True]},
+            {"command": ["set_property", "vo", "gpu"]},  # GPU вывод для HDMI
+        ]
     else:
         logger.info(f"Воспроизведение аудио: {os.path.basename(full_path)}")
         # Для аудио файлов отключаем видео вывод
-        mpv_command({"command": ["set_property", "vid", "no"]})
-    
-    # СИНХРОНИЗАЦИЯ С MPV - получаем duration и volume
-    time.sleep(0.5)
-    
-    # Получаем duration с улучшенной поддержкой DSF файлов
-    raw_duration = None
-    is_dsf_file = full_path.lower().endswith(('.dsf', '.dff'))
-    
-    # Для DSF файлов используем более агрессивный подход
-    retry_count = 10 if is_dsf_file else 5
-    sleep_interval = 0.5 if is_dsf_file else 0.2
-    
-    for attempt in range(retry_count):
-        raw_duration = get_mpv_property("duration")
-        if raw_duration and raw_duration > 0:
-            logger.info(f"🎵 MPV duration получен на попытке {attempt+1}: {raw_duration:.1f}s")
-            break
-        time.sleep(sleep_interval)
-    
-    # Fallback для DSF файлов: используем ffprobe
-    if not raw_duration and is_dsf_file:
-        logger.info("🔍 MPV не смог получить duration для DSF, пробуем ffprobe...")
-        raw_duration = get_file_duration_ffprobe(full_path)
-        if raw_duration:
-            logger.info(f"✅ FFprobe успешно определил duration: {raw_duration:.1f}s")
-    
-    if not raw_duration:
-        raw_duration = 100.0
-        logger.warning(f"⚠️ Не удалось получить duration, используем fallback: {raw_duration}s")
+        start_commands.append({"command": ["set_property", "vid", "no"]})
+
+    # Снимаем паузу если нужно и читаем громкость MPV
+    start_commands += [
+        {"command": ["set_property", "pause", False]},
+        {"command": ["get_property", "volume"]},
+    ]
+    start_responses = mpv_command_batch(start_commands)
     
     # Получаем громкость от MPV и преобразуем обратно для пользователя
-    mpv_volume = get_mpv_property("volume") or int(player_state['volume'] * 1.3)
+    mpv_volume = mpv_response_data(start_responses[-1]) or int(player_state['volume'] * 1.3)
     user_volume = int(mpv_volume / 1.3)  # Обратное преобразование
     user_volume = max(0, min(100, user_volume))  # Ограничиваем диапазон
     
-    # Снимаем паузу если нужно
-    pause_state = get_mpv_property("pause")
-    if pause_state:
-        mpv_command({"command": ["set_property", "pause", False]})
-    
     # Обновляем состояние
     player_state.update({
         'status': 'playing',
@@ -1287,24 +1680,22 @@ def play():
         'playlist': playlist,
         'playlist_index': playlist_index,
         'start_time': float(start_time) if start_time else None,  # Сохраняем время начала для CUE треков
-        'cue_tracks': cue_tracks_info,  # Сохраняем список треков CUE
-        'current_cue_track': None  # Будет определён в update_position_if_playing
+        'cue_tracks': cue_tracks_info,  # Сохраняем таблицу треков CUE
+        'mpv_source': mpv_source,
+        'current_cue_track': None  # Будет определён по событию time-pos
     })
-    
-    # Обновляем время последнего изменения позиции
-    global last_position_update
-    last_position_update = time.time()
+
+    # Остаток альбома ставим в очередь MPV для gapless-переходов
+    if is_gapless_candidate(full_path, cue_tracks_info):
+        queue_following_tracks(playlist_index)
     
     logger.info(f"Воспроизведение запущено: {player_state['track']}")
-    emit_status_update()
     
     return jsonify({'status': 'ok'})
 
 @app.route("/toggle_pause", methods=['POST'])
 def toggle_pause():
     """Переключить паузу"""
-    global player_state
-    
     if player_state['status'] == 'stopped':
         return jsonify({'status': 'error', 'message': 'Плеер остановлен'})
     
@@ -1319,101 +1710,85 @@ def toggle_pause():
     # СИНХРОНИЗАЦИЯ С MPV - получаем реальное состояние паузы
     time.sleep(0.1)
     pause_state = get_mpv_property("pause")
-    
-    if pause_state is not None:
-        if pause_state:
-            # Переход в паузу - синхронизируем позицию с MPV
-            current_position = get_mpv_property("time-pos")
-            if current_position is not None and current_position >= 0:
-                player_state['position'] = float(current_position)
-            player_state['status'] = 'paused'
-            # Обновляем текущий трек CUE если есть
-            if player_state.get('cue_tracks'):
-                player_state['current_cue_track'] = get_current_cue_track()
-        else:
-            # Снятие паузы - обновляем время последнего изменения
-            global last_position_update
-            last_position_update = time.time()
-            player_state['status'] = 'playing'
-    else:
-        # Если не можем получить состояние, переключаем вручную
-        if player_state['status'] == 'playing':
-            player_state['status'] = 'paused'
+    current_position = get_mpv_property("time-pos") if pause_state else None
+    
+    with player_state.transaction() as state:
+        if pause_state is not None:
+            if pause_state:
+                # Переход в паузу - синхронизируем позицию с MPV
+                if current_position is not None and current_position >= 0:
+                    state['position'] = float(current_position)
+                state['status'] = 'paused'
+                # Обновляем текущий трек CUE если есть
+                if state.get('cue_tracks'):
+                    state['current_cue_track'] = get_current_cue_track(state)
+            else:
+                state['status'] = 'playing'
         else:
-            player_state['status'] = 'playing'
-            last_position_update = time.time()
+            # Если не можем получить состояние, переключаем вручную
+            state['status'] = 'paused' if state['status'] == 'playing' else 'playing'
     
     logger.debug(f"Пауза переключена: {player_state['status']}")
-    emit_status_update()
     
     return jsonify({'status': 'ok'})
 
 @app.route("/stop", methods=['POST'])
 def stop():
     """Остановить воспроизведение"""
-    global player_state
-    
     stop_mpv_internal()
 
-    # Сначала очищаем CUE данные явно, чтобы избежать race condition
-    player_state['cue_tracks'] = None
-    player_state['current_cue_track'] = None
-    logger.debug(f"[STOP] После очистки CUE: cue_tracks={player_state.get('cue_tracks')}, current_cue_track={player_state.get('current_cue_track')}")
-
-    # Сбрасываем состояние
+    # Сбрасываем состояние вместе с CUE данными - одной публикацией
     player_state.update({
+        'cue_tracks': None,
+        'current_cue_track': None,
         'status': 'stopped',
         'track': '',
         'position': 0.0,
         'duration': 0.0,
         'playlist': [],
         'playlist_index': -1,
-        'start_time': None
+        'start_time': None,
+        'gapless': False,
+        'mpv_source': None
     })
 
     logger.info(f"[STOP] Воспроизведение остановлено. Финальное состояние: cue_tracks={player_state.get('cue_tracks')}, current_cue_track={player_state.get('current_cue_track')}")
-    emit_status_update()
     
     return jsonify({'status': 'ok'})
 
 @app.route("/seek", methods=['POST'])
 def seek():
     """Перемотка на указанную позицию"""
-    global player_state
-
     position = request.form.get('position', type=float)
     if position is None:
         return jsonify({'status': 'error', 'message': 'Позиция не указана'})
 
     # Для CUE треков конвертируем относительную позицию в абсолютную
     absolute_position = position
-    current_cue = player_state.get('current_cue_track')
-    if current_cue:
-        track_start = current_cue.get('relative_time_seconds', 0)
+    state = player_state.snapshot()
+    track_index = state['cue_tracks'].index_of(state.get('current_cue_track')) if state.get('cue_tracks') else -1
+    if track_index >= 0:
+        track_start = state['cue_tracks'].starts[track_index]
         absolute_position = track_start + position
         logger.debug(f"CUE seek: относительная {position:.1f}s -> абсолютная {absolute_position:.1f}s")
 
     # Проверяем корректность позиции
+    duration = player_state['duration']
     if absolute_position < 0:
         absolute_position = 0
-    if absolute_position > player_state['duration']:
-        absolute_position = player_state['duration']
+    if absolute_position > duration:
+        absolute_position = duration
 
     logger.debug(f"Перемотка на позицию: {absolute_position:.1f}")
 
-    # Отправляем команду в MPV
-    mpv_result = mpv_command({"command": ["seek", absolute_position, "absolute"]})
-    if mpv_result.get("status") == "error":
+    if not ensure_mpv_is_running():
         return jsonify({'status': 'error', 'message': 'Ошибка команды MPV'})
 
-    # Устанавливаем абсолютную позицию
+    # Ставим в очередь: более новая позиция заменит еще не отправленную
+    mpv_coalescer.submit('seek', {"command": ["seek", absolute_position, "absolute"]})
+
+    # Устанавливаем абсолютную позицию (уточнится событием time-pos)
     player_state['position'] = absolute_position
-    
-    # Обновляем время последнего изменения позиции
-    global last_position_update
-    last_position_update = time.time()
-    
-    emit_status_update()
     return jsonify({'status': 'ok'})
 
 @app.route("/playlist_change", methods=['POST'])
@@ -1438,14 +1813,14 @@ def set_volume():
     
     logger.debug(f"Громкость: пользователь {user_volume}% -> MPV {mpv_volume}%")
     
-    # Отправляем значение в MPV
-    mpv_command({"command": ["set_property", "volume", mpv_volume]})
+    # Ставим в очередь: более новая громкость заменит еще не отправленную
+    mpv_coalescer.submit('volume', {"command": ["set_property", "volume", mpv_volume]})
     
     # Сохраняем пользовательское значение
     player_state['volume'] = user_volume
     
-    # Сохраняем настройку для следующего запуска
-    save_volume_setting(user_volume)
+    # Сохраняем настройку для следующего запуска (запись на диск отложенная)
+    settings_store.set('volume', user_volume)
     
     return jsonify({'status': 'ok', 'user_volume': user_volume, 'mpv_volume': mpv_volume})
 
@@ -1459,18 +1834,14 @@ def view_image():
     full_path = os.path.join(MEDIA_ROOT, file_subpath)
     if os.path.isfile(full_path):
         # Обновляем состояние для HDMI display
-        image_dir = os.path.dirname(full_path)
-        image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff')
-        monitor_state['image_gallery'] = [
-            os.path.join(image_dir, f) for f in sorted(os.listdir(image_dir))
-            if f.lower().endswith(image_extensions)
-        ]
+        monitor_state['image_gallery'] = get_image_gallery(get_folder_listing(os.path.dirname(full_path)))
         try:
             monitor_state['current_image_index'] = monitor_state['image_gallery'].index(full_path)
         except ValueError:
             monitor_state['current_image_index'] = 0
 
         logger.info(f"🖼️ Изображение отображено на HDMI: {os.path.basename(full_path)} ({monitor_state['current_image_index'] + 1}/{len(monitor_state['image_gallery'])})")
+        emit_status_update()
 
     return jsonify({'status': 'ok'})
 
@@ -1492,6 +1863,9 @@ def upload_file():
             filename = secure_filename(file.filename)
             save_path = os.path.join(target_folder, filename)
             file.save(save_path)
+            # Размер дописанного файла не меняет mtime папки - сбрасываем листинг явно
+            listing_cache.invalidate(library_scanner.relative_path(target_folder))
+            library_watcher.mark_dirty(library_scanner.relative_path(target_folder))
             if socketio:
                 socketio.emit('file_uploaded', {'path': current_subpath, 'filename': filename})
     
@@ -1514,6 +1888,9 @@ def create_folder():
     
     try:
         os.makedirs(target_folder)
+        parent_folder = library_scanner.relative_path(os.path.dirname(target_folder))
+        listing_cache.invalidate(parent_folder)
+        library_watcher.mark_dirty(parent_folder)
         if socketio:
             socketio.emit('folder_created', {'path': current_subpath, 'foldername': folder_name})
         return jsonify({'status': 'success'})
@@ -1846,6 +2223,8 @@ def update_custom_audio_enhancement():
                 logger.warning(f"❌ Не удалось обновить {setting_name} = {value}")
         
         if updated:
+            settings_store.set('custom_enhancement', audio_enhancer.get_custom_settings())
+
             # Если активна пользовательская предустановка, применяем изменения
             if player_state.get('audio_enhancement') == 'custom':
                 logger.info("🔄 Применяем изменения к custom предустановке")
@@ -1890,6 +2269,9 @@ def get_audio_enhancement_info(preset_name):
 def system_shutdown():
     """Безопасное отключение Raspberry Pi"""
     action = request.form.get('action', 'shutdown')
+
+    # Сбрасываем отложенные настройки до отключения
+    settings_store.flush()
     
     if action == 'shutdown':
         logger.info("Запрос безопасного отключения системы")
@@ -1969,103 +2351,102 @@ if socketio:
     @socketio.on('connect')
     def handle_connect():
         logger.info('Клиент подключился')
-        emit_status_update()
 
-# Запуск фонового мониторинга при импорте модуля
+    @socketio.on('disconnect')
+    def handle_disconnect():
+        state_publisher.unsubscribe(request.sid)
+
+    @socketio.on('subscribe_state')
+    def handle_subscribe_state(data):
+        """Подписка на канал состояния: в ответ полный снимок, дальше дельты"""
+        channel = (data or {}).get('channel', 'status')
+        if channel not in state_publisher.channels:
+            return
+        join_room(channel)
+        snapshot = state_publisher.subscribe(request.sid, channel)
+        emit('state_snapshot', snapshot)
+
+# Запуск супервизора MPV при импорте модуля
 # (это нужно для работы с systemd, который не выполняет блок if __name__)
-monitor_thread = threading.Thread(target=background_monitor_thread, daemon=True)
-monitor_thread.start()
-logger.info("🔄 Запущен фоновый мониторинг MPV")
+mpv_supervisor = threading.Thread(target=mpv_supervisor_thread, daemon=True)
+mpv_supervisor.start()
+
+# Фоновое поддержание индекса медиатеки (сверка по mtime + inotify)
+library_watcher.start()
 
 # ============================================================================
 # HDMI MONITOR ENDPOINTS
 # ============================================================================
 
-def get_audio_metadata(file_path):
-    """Получить метаданные аудиофайла через ffprobe"""
-    try:
-        cmd = [
-            'ffprobe', '-v', 'quiet', '-print_format', 'json',
-            '-show_format', '-show_streams', file_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            data = json.loads(result.stdout)
-
-            # Ищем аудио стрим
-            audio_stream = None
-            for stream in data.get('streams', []):
-                if stream.get('codec_type') == 'audio':
-                    audio_stream = stream
-                    break
-
-            if audio_stream:
-                sample_rate = audio_stream.get('sample_rate', 'N/A')
-                channels = audio_stream.get('channels', 'N/A')
-                codec = audio_stream.get('codec_name', 'N/A').upper()
-
-                # Битрейт из format или stream
-                bitrate = data.get('format', {}).get('bit_rate')
-                if not bitrate:
-                    bitrate = audio_stream.get('bit_rate')
-
-                if bitrate:
-                    bitrate_kbps = int(bitrate) // 1000
-                    bitrate_str = f"{bitrate_kbps} kbps"
-                else:
-                    bitrate_str = "N/A"
-
-                return {
-                    'format': codec,
-                    'sample_rate': f"{int(sample_rate) // 1000} kHz" if sample_rate != 'N/A' else 'N/A',
-                    'channels': f"{channels} ch" if channels != 'N/A' else 'N/A',
-                    'bitrate': bitrate_str
-                }
-    except Exception as e:
-        logger.error(f"Ошибка получения метаданных: {e}")
+def format_audio_metadata(info):
+    """Метаданные для отображения на мониторе из результата пробы"""
+    if not info or not info.get('codec'):
+        return {
+            'format': 'N/A',
+            'sample_rate': 'N/A',
+            'channels': 'N/A',
+            'bitrate': 'N/A'
+        }
 
+    sample_rate = info.get('sample_rate')
+    channels = info.get('channels')
+    bitrate = info.get('bitrate')
     return {
-        'format': 'N/A',
-        'sample_rate': 'N/A',
-        'channels': 'N/A',
-        'bitrate': 'N/A'
+        'format': info['codec'],
+        'sample_rate': f"{sample_rate // 1000} kHz" if sample_rate else 'N/A',
+        'channels': f"{channels} ch" if channels else 'N/A',
+        'bitrate': f"{bitrate // 1000} kbps" if bitrate else 'N/A'
     }
 
+def get_audio_metadata(file_path):
+    """Получить метаданные аудиофайла (из кэша, проба только при промахе)"""
+    return format_audio_metadata(metadata_cache.get(file_path))
+
 @app.route("/hdmi-display")
 def hdmi_display():
     """Страница HDMI монитора"""
     return render_template("monitor_display.html")
 
-@app.route("/api/hdmi-display/state")
-def get_hdmi_display_state():
-    """Получить состояние монитора и плеера"""
-    global monitor_state, player_state
+def build_hdmi_display_snapshot():
+    """Снимок состояния монитора и плеера для HDMI дисплея"""
+    state = player_state.snapshot()
 
     # Получаем метаданные текущего трека
+    # Снимок строится в потоке рассылки - здесь только кэш, проба уходит в фон
+    # и по готовности сама вызовет повторную рассылку
     metadata = {'format': '-', 'sample_rate': '-', 'channels': '-', 'bitrate': '-'}
-    if player_state['track'] and player_state['status'] != 'stopped':
-        track_path = os.path.join(MEDIA_ROOT, player_state['track'])
-        if os.path.exists(track_path):
-            metadata = get_audio_metadata(track_path)
-
-    # Собираем полную информацию
-    response = {
-        'monitor': monitor_state,
+    if state['track'] and state['status'] != 'stopped':
+        track_path = os.path.join(MEDIA_ROOT, state['track'])
+        info = metadata_cache.peek(track_path)
+        if info is not None:
+            metadata = format_audio_metadata(info)
+        else:
+            metadata_cache.prefetch(track_path)
+
+    # Собираем полную информацию (копии - снимок не должен меняться вместе с состоянием)
+    return {
+        'monitor': dict(monitor_state),
         'player': {
-            'status': player_state['status'],
-            'track': player_state['track'],
-            'position': player_state['position'],
-            'duration': player_state['duration'],
-            'volume': player_state['volume'],
-            'playlist': player_state['playlist'],
-            'playlist_index': player_state['playlist_index'],
-            'cue_tracks': player_state.get('cue_tracks'),
-            'current_cue_track': player_state.get('current_cue_track'),
+            'status': state['status'],
+            'track': state['track'],
+            'position': round(state['position'], 1),
+            'duration': state['duration'],
+            'volume': state['volume'],
+            'playlist': state['playlist'],
+            'playlist_index': state['playlist_index'],
+            'cue_tracks': list(state['cue_tracks'].tracks) if state.get('cue_tracks') else None,
+            'current_cue_track': state.get('current_cue_track'),
             'metadata': metadata
         }
     }
 
-    return jsonify(response)
+@app.route("/api/hdmi-display/state")
+def get_hdmi_display_state():
+    """Получить состояние монитора и плеера (fallback для клиентов без Socket.IO)
+
+    Поддерживает long-poll так же, как /get_status.
+    """
+    return state_channel_response('hdmi')
 
 @app.route("/api/hdmi-display/set_mode", methods=['POST'])
 def set_hdmi_display_mode():
@@ -2076,6 +2457,8 @@ def set_hdmi_display_mode():
 
     if mode in ['full', 'split', 'info']:
         monitor_state['display_mode'] = mode
+        settings_store.set('monitor_display_mode', mode)
+        emit_status_update()
         logger.info(f"🖥️ Режим HDMI монитора изменен на: {mode}")
         return jsonify({'status': 'ok', 'mode': mode})
 
@@ -2090,6 +2473,8 @@ def set_hdmi_display_theme():
 
     if theme in ['dark', 'light']:
         monitor_state['theme'] = theme
+        settings_store.set('monitor_theme', theme)
+        emit_status_update()
         logger.info(f"🎨 Тема HDMI монитора изменена на: {theme}")
         return jsonify({'status': 'ok', 'theme': theme})
 
@@ -2116,6 +2501,7 @@ def navigate_hdmi_display_image():
         return jsonify({'status': 'error', 'message': 'Invalid direction'}), 400
 
     new_image = gallery[monitor_state['current_image_index']]
+    emit_status_update()
     logger.info(f"🖼️ Переключение изображения: {direction} -> {new_image}")
 
     return jsonify({
@@ -2125,6 +2511,11 @@ def navigate_hdmi_display_image():
         'total': len(gallery)
     })
 
+# Каналы push-рассылки состояния (Socket.IO и long-poll)
+state_publisher.add_channel('status', build_status_snapshot)
+state_publisher.add_channel('hdmi', build_hdmi_display_snapshot)
+state_publisher.start()
+
 # Запуск сервера
 if __name__ == "__main__":
     logger.info("Запуск Aether Player (простая архитектура)")
@@ -2136,7 +2527,7 @@ if __name__ == "__main__":
     except Exception as e:
         logger.error(f"Ошибка восстановления ALSA: {e}")
     
-    # Запускаем MPV
+    # MPV запускает супервизор в фоне - будим его сразу
     ensure_mpv_is_running()
 
     # Запускаем сервер
@@ -0,0 +1,561 @@
+"""
+Проба аудиофайлов для Aether Player
+Длительность и параметры потока читаются прямо из заголовков контейнера
+(FLAC, WAV/RF64, DSF, DFF, MP3, MP4/M4A) за несколько килобайт чтения.
+ffprobe запускается только для неизвестных контейнеров
+"""
+
+import json
+import logging
+import os
+import struct
+import subprocess
+
+logger = logging.getLogger('aether_player')
+
+# Сколько байт просматриваем в поисках первого MPEG кадра
+MP3_SYNC_SCAN_LIMIT = 64 * 1024
+
+
+def _result(codec, sample_rate=None, channels=None, bits_per_sample=None,
+            duration=None, bitrate=None):
+    """Результат пробы в общем формате (отсутствующие значения - None)"""
+    return {
+        'codec': codec,
+        'sample_rate': int(sample_rate) if sample_rate else None,
+        'channels': int(channels) if channels else None,
+        'bits_per_sample': int(bits_per_sample) if bits_per_sample else None,
+        'duration': float(duration) if duration and duration > 0 else None,
+        'bitrate': int(bitrate) if bitrate else None
+    }
+
+
+def _average_bitrate(size, duration):
+    return int(size * 8 / duration) if size and duration else None
+
+
+def _skip_id3v2(f) -> int:
+    """Пропускает ID3v2 тег в начале файла, возвращает смещение данных"""
+    f.seek(0)
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    # Размер тега - synchsafe integer (по 7 бит в байте)
+    size = (header[6] & 0x7F) << 21 | (header[7] & 0x7F) << 14 | (header[8] & 0x7F) << 7 | (header[9] & 0x7F)
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+# --- FLAC ---
+
+def _probe_flac(f, offset, file_size):
+    f.seek(offset + 4)
+    while True:
+        block_header = f.read(4)
+        if len(block_header) < 4:
+            return None
+        is_last = block_header[0] & 0x80
+        block_type = block_header[0] & 0x7F
+        length = int.from_bytes(block_header[1:4], 'big')
+        if block_type == 0:  # STREAMINFO
+            info = f.read(34)
+            if len(info) < 34:
+                return None
+            packed = int.from_bytes(info[10:18], 'big')
+            sample_rate = packed >> 44
+            channels = ((packed >> 41) & 0x7) + 1
+            bits = ((packed >> 36) & 0x1F) + 1
+            total_samples = packed & 0xFFFFFFFFF
+            duration = total_samples / sample_rate if sample_rate and total_samples else None
+            return _result('FLAC', sample_rate, channels, bits, duration,
+                           _average_bitrate(file_size - offset, duration))
+        if is_last:
+            return None
+        f.seek(length, os.SEEK_CUR)
+
+
+# --- WAV / RF64 ---
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_IEEE_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def _wav_codec(format_tag, bits):
+    if format_tag == _WAVE_FORMAT_PCM:
+        return 'PCM_U8' if bits == 8 else f'PCM_S{bits}LE'
+    if format_tag == _WAVE_FORMAT_IEEE_FLOAT:
+        return f'PCM_F{bits}LE'
+    return 'WAV'
+
+
+def _probe_wav(f, file_size):
+    f.seek(0)
+    riff = f.read(12)
+    is_rf64 = riff[:4] == b'RF64'
+    fmt = None
+    data_size = None
+    ds64_data_size = None
+
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            break
+        chunk_id = chunk_header[:4]
+        chunk_size = struct.unpack('<I', chunk_header[4:])[0]
+
+        if chunk_id == b'ds64' and is_rf64:
+            payload = f.read(chunk_size)
+            if len(payload) >= 16:
+                ds64_data_size = struct.unpack('<Q', payload[8:16])[0]
+            chunk_size = len(payload)
+        elif chunk_id == b'fmt ':
+            payload = f.read(chunk_size)
+            if len(payload) < 16:
+                return None
+            format_tag, channels, sample_rate, byte_rate, _, bits = struct.unpack('<HHIIHH', payload[:16])
+            if format_tag == _WAVE_FORMAT_EXTENSIBLE and len(payload) >= 26:
+                # Настоящий формат - первые два байта SubFormat GUID
+                format_tag = struct.unpack('<H', payload[24:26])[0]
+            fmt = (format_tag, channels, sample_rate, byte_rate, bits)
+            chunk_size = len(payload)
+        elif chunk_id == b'data':
+            data_size = ds64_data_size if is_rf64 and chunk_size == 0xFFFFFFFF else chunk_size
+            # Заголовок мог не обновиться при записи - ограничиваем размером файла
+            data_size = min(data_size, file_size - f.tell())
+            break
+        else:
+            f.seek(chunk_size, os.SEEK_CUR)
+        # Чанки выровнены по 2 байта
+        if chunk_size & 1:
+            f.seek(1, os.SEEK_CUR)
+
+    if fmt is None:
+        return None
+    format_tag, channels, sample_rate, byte_rate, bits = fmt
+    duration = data_size / byte_rate if data_size and byte_rate else None
+    return _result(_wav_codec(format_tag, bits), sample_rate, channels, bits, duration, byte_rate * 8)
+
+
+# --- DSF (Sony DSD Stream File) ---
+
+def _probe_dsf(f):
+    f.seek(0)
+    header = f.read(28 + 52)
+    if len(header) < 80 or header[28:32] != b'fmt ':
+        return None
+    (_, _, channel_type, channels, sample_rate,
+     bits, sample_count) = struct.unpack('<IIIIIIQ', header[40:72])
+    duration = sample_count / sample_rate if sample_rate else None
+    # DSD - 1 бит на отсчет, битрейт потока точно известен
+    return _result('DSD_LSBF_PLANAR', sample_rate, channels, 1, duration, sample_rate * channels)
+
+
+# --- DFF (DSDIFF) ---
+
+def _probe_dff(f, file_size):
+    f.seek(16)
+    sample_rate = None
+    channels = None
+    compression = b'DSD '
+    duration = None
+
+    def chunks(end):
+        while f.tell() + 12 <= end:
+            chunk_header = f.read(12)
+            if len(chunk_header) < 12:
+                return
+            chunk_id = chunk_header[:4]
+            chunk_size = struct.unpack('>Q', chunk_header[4:])[0]
+            start = f.tell()
+            yield chunk_id, chunk_size
+            # Чанки выровнены по 2 байта
+            f.seek(start + chunk_size + (chunk_size & 1))
+
+    for chunk_id, chunk_size in chunks(file_size):
+        if chunk_id == b'PROP':
+            prop_end = f.tell() + chunk_size
+            if f.read(4) != b'SND ':
+                continue
+            for prop_id, prop_size in chunks(prop_end):
+                payload = f.read(min(prop_size, 64))
+                if prop_id == b'FS  ' and len(payload) >= 4:
+                    sample_rate = struct.unpack('>I', payload[:4])[0]
+                elif prop_id == b'CHNL' and len(payload) >= 2:
+                    channels = struct.unpack('>H', payload[:2])[0]
+                elif prop_id == b'CMPR' and len(payload) >= 4:
+                    compression = payload[:4]
+        elif chunk_id == b'DSD ':
+            if sample_rate and channels:
+                duration = chunk_size * 8 / (channels * sample_rate)
+            break
+        elif chunk_id == b'DST ':
+            for dst_id, dst_size in chunks(f.tell() + chunk_size):
+                if dst_id == b'FRTE':
+                    payload = f.read(6)
+                    if len(payload) == 6:
+                        frame_count, frame_rate = struct.unpack('>IH', payload)
+                        duration = frame_count / frame_rate if frame_rate else None
+                    break
+            break
+
+    if not sample_rate:
+        return None
+    codec = 'DST' if compression == b'DST ' else 'DSD_MSBF'
+    return _result(codec, sample_rate, channels, 1, duration,
+                   sample_rate * channels if codec == 'DSD_MSBF' and channels else None)
+
+
+# --- MP3 (MPEG Audio Layer I/II/III) ---
+
+_MPEG_BITRATES = {
+    # (MPEG1?, layer) -> kbps по индексу
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MPEG_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _parse_mpeg_header(header: bytes):
+    """Разбирает 4-байтовый заголовок MPEG кадра, None если это не кадр"""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x3  # 3 - MPEG1, 2 - MPEG2, 0 - MPEG2.5
+    layer = 4 - ((header[1] >> 1) & 0x3)
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = _MPEG_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _MPEG_SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 0x1
+    mono = (header[3] >> 6) == 3
+    if layer == 1:
+        samples_per_frame = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples_per_frame = 1152 if (mpeg1 or layer == 2) else 576
+        frame_length = samples_per_frame // 8 * bitrate // sample_rate + padding
+    return {
+        'mpeg1': mpeg1, 'layer': layer, 'bitrate': bitrate, 'sample_rate': sample_rate,
+        'channels': 1 if mono else 2, 'samples_per_frame': samples_per_frame,
+        'frame_length': frame_length
+    }
+
+
+def _probe_mp3(f, offset, file_size):
+    f.seek(offset)
+    data = f.read(MP3_SYNC_SCAN_LIMIT)
+
+    # Ищем кадр, за которым сразу идет еще один кадр - защита от ложной синхронизации
+    frame = None
+    position = 0
+    while position + 4 <= len(data):
+        position = data.find(b'\xff', position)
+        if position < 0 or position + 4 > len(data):
+            return None
+        frame = _parse_mpeg_header(data[position:position + 4])
+        if frame:
+            next_position = position + frame['frame_length']
+            if next_position + 4 > len(data) or _parse_mpeg_header(data[next_position:next_position + 4]):
+                break
+        frame = None
+        position += 1
+    if frame is None:
+        return None
+
+    audio_start = offset + position
+    audio_size = file_size - audio_start
+    if file_size >= 128:
+        f.seek(file_size - 128)
+        if f.read(3) == b'TAG':
+            audio_size -= 128  # ID3v1 в конце файла
+
+    codec = {1: 'MP1', 2: 'MP2', 3: 'MP3'}[frame['layer']]
+    sample_rate = frame['sample_rate']
+    samples_per_frame = frame['samples_per_frame']
+
+    # Xing/Info (VBR от LAME) стоит сразу после side info первого кадра
+    if frame['mpeg1']:
+        side_info = 17 if frame['channels'] == 1 else 32
+    else:
+        side_info = 9 if frame['channels'] == 1 else 17
+    xing = position + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        cursor = xing + 8
+        frames = stream_bytes = None
+        if flags & 0x1:
+            frames = struct.unpack('>I', data[cursor:cursor + 4])[0]
+            cursor += 4
+        if flags & 0x2:
+            stream_bytes = struct.unpack('>I', data[cursor:cursor + 4])[0]
+            cursor += 4
+        if flags & 0x4:
+            cursor += 100  # TOC
+        if flags & 0x8:
+            cursor += 4  # Качество
+        if frames:
+            total_samples = frames * samples_per_frame
+            # LAME тег: задержка энкодера и паддинг для точной (gapless) длительности
+            if data[cursor:cursor + 4] in (b'LAME', b'Lavf', b'Lavc') and cursor + 24 <= len(data):
+                delay_padding = int.from_bytes(data[cursor + 21:cursor + 24], 'big')
+                trimmed = total_samples - (delay_padding >> 12) - (delay_padding & 0xFFF)
+                if trimmed > 0:
+                    total_samples = trimmed
+            duration = total_samples / sample_rate
+            return _result(codec, sample_rate, frame['channels'], None, duration,
+                           _average_bitrate(stream_bytes or audio_size, duration))
+
+    # VBRI (Fraunhofer) - всегда через 32 байта после заголовка кадра
+    vbri = position + 4 + 32
+    if data[vbri:vbri + 4] == b'VBRI' and vbri + 18 <= len(data):
+        stream_bytes, frames = struct.unpack('>II', data[vbri + 10:vbri + 18])
+        if frames:
+            duration = frames * samples_per_frame / sample_rate
+            return _result(codec, sample_rate, frame['channels'], None, duration,
+                           _average_bitrate(stream_bytes, duration))
+
+    # CBR: длительность по размеру аудиоданных
+    duration = audio_size * 8 / frame['bitrate']
+    return _result(codec, sample_rate, frame['channels'], None, duration, frame['bitrate'])
+
+
+# --- MP4 / M4A ---
+
+_MP4_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+_MP4_CODECS = {b'mp4a': 'AAC', b'alac': 'ALAC', b'fLaC': 'FLAC', b'Opus': 'OPUS',
+               b'ac-3': 'AC3', b'ec-3': 'EAC3', b'.mp3': 'MP3'}
+
+
+def _mp4_atoms(f, start, end):
+    """Перебирает атомы в диапазоне [start, end): (тип, начало данных, конец)"""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, atom_type = struct.unpack('>I4s', header)
+        data_start = position + 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            data_start += 8
+        elif size == 0:
+            size = end - position
+        if size < data_start - position:
+            return
+        yield atom_type, data_start, position + size
+        position += size
+
+
+def _mp4_descriptor_length(data, cursor):
+    length = 0
+    for _ in range(4):
+        if cursor >= len(data):
+            break
+        byte = data[cursor]
+        cursor += 1
+        length = (length << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            break
+    return length, cursor
+
+
+def _mp4_esds_bitrate(data):
+    """Средний битрейт из ES_Descriptor -> DecoderConfigDescriptor"""
+    cursor = 4  # version + flags
+    if cursor >= len(data) or data[cursor] != 0x03:
+        return None
+    _, cursor = _mp4_descriptor_length(data, cursor + 1)
+    if cursor + 3 > len(data):
+        return None
+    es_flags = data[cursor + 2]
+    cursor += 3
+    if es_flags & 0x80:
+        cursor += 2
+    if es_flags & 0x40 and cursor < len(data):
+        cursor += data[cursor] + 1
+    if es_flags & 0x20:
+        cursor += 2
+    if cursor >= len(data) or data[cursor] != 0x04:
+        return None
+    _, cursor = _mp4_descriptor_length(data, cursor + 1)
+    if cursor + 13 > len(data):
+        return None
+    return struct.unpack('>I', data[cursor + 9:cursor + 13])[0] or None
+
+
+def _probe_mp4(f, file_size):
+    movie_duration = None
+    track = None  # Параметры первой звуковой дорожки
+
+    def walk(start, end, current):
+        nonlocal movie_duration, track
+        for atom_type, data_start, atom_end in _mp4_atoms(f, start, end):
+            if atom_type == b'trak':
+                candidate = {}
+                walk(data_start, atom_end, candidate)
+                if track is None and candidate.get('handler') == b'soun':
+                    track = candidate
+            elif atom_type in _MP4_CONTAINERS:
+                walk(data_start, atom_end, current)
+            elif atom_type == b'mvhd':
+                f.seek(data_start)
+                payload = f.read(32)
+                if payload[:1] == b'\x01':
+                    timescale, duration = struct.unpack('>IQ', payload[20:32])
+                else:
+                    timescale, duration = struct.unpack('>II', payload[12:20])
+                movie_duration = duration / timescale if timescale else None
+            elif atom_type == b'mdhd':
+                f.seek(data_start)
+                payload = f.read(32)
+                if payload[:1] == b'\x01':
+                    timescale, duration = struct.unpack('>IQ', payload[20:32])
+                else:
+                    timescale, duration = struct.unpack('>II', payload[12:20])
+                current['timescale'] = timescale
+                current['duration'] = duration / timescale if timescale else None
+            elif atom_type == b'hdlr':
+                f.seek(data_start + 8)
+                current['handler'] = f.read(4)
+            elif atom_type == b'stsd':
+                f.seek(data_start)
+                payload = f.read(min(atom_end - data_start, 4096))
+                _parse_mp4_sample_entry(payload[8:], current)
+
+    for atom_type, data_start, atom_end in _mp4_atoms(f, 0, file_size):
+        if atom_type == b'moov':
+            walk(data_start, atom_end, {})
+            break
+
+    if track is None or 'codec' not in track:
+        return None
+    duration = track.get('duration') or movie_duration
+    sample_rate = track.get('sample_rate') or track.get('timescale')
+    bitrate = track.get('bitrate') or _average_bitrate(file_size, duration)
+    return _result(track['codec'], sample_rate, track.get('channels'),
+                   track.get('bits_per_sample'), duration, bitrate)
+
+
+def _parse_mp4_sample_entry(entry, track):
+    """Разбирает первую запись stsd (AudioSampleEntry)"""
+    if len(entry) < 36:
+        return
+    entry_size, entry_type = struct.unpack('>I4s', entry[:8])
+    track['codec'] = _MP4_CODECS.get(entry_type, entry_type.decode('latin-1').strip().upper())
+    sound_version = struct.unpack('>H', entry[16:18])[0]
+    channels, bits = struct.unpack('>HH', entry[24:28])
+    sample_rate = struct.unpack('>I', entry[32:36])[0] >> 16  # 16.16 fixed point
+    if sound_version == 2 and len(entry) >= 52:
+        # QuickTime v2: частота - double, каналы - отдельное поле
+        sample_rate = int(struct.unpack('>d', entry[40:48])[0])
+        channels = struct.unpack('>I', entry[48:52])[0]
+    track.update(channels=channels, bits_per_sample=bits if entry_type in (b'alac', b'fLaC') else None,
+                 sample_rate=sample_rate or None)
+
+    # Дочерние атомы записи: esds (AAC), alac (настоящие параметры ALAC)
+    position = 36 + {1: 16, 2: 36}.get(sound_version, 0)
+    end = min(entry_size, len(entry))
+    while position + 8 <= end:
+        size, child_type = struct.unpack('>I4s', entry[position:position + 8])
+        if size < 8:
+            break
+        payload = entry[position + 8:position + size]
+        if child_type == b'esds':
+            track['bitrate'] = _mp4_esds_bitrate(payload)
+        elif child_type == b'alac' and len(payload) >= 28:
+            bits, _, _, _, channels, _, _, avg_bitrate, sample_rate = struct.unpack('>BBBBBHIII', payload[9:28])
+            track.update(bits_per_sample=bits, channels=channels,
+                         bitrate=avg_bitrate or None, sample_rate=sample_rate)
+        position += size
+
+
+def probe_native(file_path: str):
+    """Проба по заголовкам контейнера; None, если формат неизвестен"""
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        head = f.read(16)
+        if head[:4] in (b'RIFF', b'RF64') and head[8:12] == b'WAVE':
+            return _probe_wav(f, file_size)
+        if head[:4] == b'DSD ':
+            return _probe_dsf(f)
+        if head[:4] == b'FRM8' and head[12:16] == b'DSD ':
+            return _probe_dff(f, file_size)
+        if head[4:8] == b'ftyp':
+            return _probe_mp4(f, file_size)
+
+        offset = _skip_id3v2(f)
+        f.seek(offset)
+        if f.read(4) == b'fLaC':
+            return _probe_flac(f, offset, file_size)
+        if offset or file_path.lower().endswith(('.mp3', '.mp2', '.mpga')):
+            return _probe_mp3(f, offset, file_size)
+    return None
+
+
+def probe_ffprobe(file_path: str):
+    """Проба через ffprobe (один запуск на формат и стримы)"""
+    cmd = [
+        'ffprobe', '-v', 'quiet', '-print_format', 'json',
+        '-show_format', '-show_streams', file_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+    if result.returncode != 0:
+        logger.warning(f"FFprobe error: {result.stderr}")
+        return None
+
+    data = json.loads(result.stdout)
+    fmt = data.get('format', {})
+
+    # Ищем аудио стрим
+    audio_stream = {}
+    for stream in data.get('streams', []):
+        if stream.get('codec_type') == 'audio':
+            audio_stream = stream
+            break
+
+    def to_number(value, cast):
+        try:
+            return cast(value) if value not in (None, 'N/A') else None
+        except (TypeError, ValueError):
+            return None
+
+    return _result(
+        (audio_stream.get('codec_name') or '').upper() or None,
+        to_number(audio_stream.get('sample_rate'), int),
+        to_number(audio_stream.get('channels'), int),
+        to_number(audio_stream.get('bits_per_raw_sample') or audio_stream.get('bits_per_sample'), int),
+        to_number(fmt.get('duration') or audio_stream.get('duration'), float),
+        # Битрейт из format или stream
+        to_number(fmt.get('bit_rate') or audio_stream.get('bit_rate'), int)
+    )
+
+
+def probe_audio_file(file_path: str):
+    """Параметры аудиофайла: сначала заголовки, ffprobe - только если не вышло
+
+    Возвращает {'codec', 'sample_rate', 'channels', 'bits_per_sample',
+    'duration', 'bitrate'} (отсутствующие значения - None) или None.
+    """
+    try:
+        info = probe_native(file_path)
+    except (OSError, struct.error, ValueError, KeyError, IndexError) as e:
+        logger.debug(f"Не удалось разобрать заголовки {file_path}: {e}")
+        info = None
+
+    if info is not None and info['duration']:
+        return info
+
+    try:
+        return probe_ffprobe(file_path) or info
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        logger.warning(f"Ошибка ffprobe для {file_path}: {e}")
+        return info
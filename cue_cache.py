@@ -0,0 +1,104 @@
+"""
+Кэш разобранных CUE-файлов для Aether Player
+Результат CueParser.get_info() хранится по ключу (путь, размер, mtime)
+с вытеснением LRU, плюс обратная карта "аудиофайл -> CUE"
+"""
+
+import logging
+import os
+import threading
+
+from cue_parser import CueParser
+from metadata_cache import MetadataCache
+
+logger = logging.getLogger('aether_player')
+
+
+def cue_file_for_audio(info, audio_name: str):
+    """FILE CUE-файла (get_info()), который описывает аудиофайл, или None
+
+    Имя сравнивается с каждым FILE, а найденный файл первого FILE
+    (info['file']) может отличаться от записанного в CUE расширением.
+    """
+    if not info or not info['tracks']:
+        return None
+    for track in info['tracks']:
+        if track['file'] == audio_name:
+            return audio_name
+    if info['file'] == audio_name:
+        return info['tracks'][0]['file']
+    return None
+
+
+def describes_audio(info, audio_name: str) -> bool:
+    """Ссылается ли CUE (get_info()) на аудиофайл"""
+    return cue_file_for_audio(info, audio_name) is not None
+
+
+def load_cue_info(cue_path: str):
+    """Разбор CUE-файла при промахе кэша - без абсолютных времен, только времена внутри файлов"""
+    return CueParser(cue_path).get_info(with_times=False)
+
+
+class CueCache:
+    """Разобранные CUE-файлы процесса
+
+    get_info() разбирает файл только если он новый или изменился (размер,
+    mtime). Обратная карта связывает каждый аудиофайл (полный путь) с
+    CUE-файлом, который на него ссылается: find_for_audio() находит CUE за
+    один словарный поиск и stat, не открывая .cue файлов.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self._infos = MetadataCache(load_cue_info, maxsize=maxsize)
+        self._cue_by_audio = {}  # полный путь аудиофайла -> полный путь CUE
+        self._lock = threading.Lock()
+        # Карта живет дольше записей LRU - ограничиваем ее отдельно
+        self._max_links = maxsize * 16
+
+    def get_info(self, cue_path: str):
+        """get_info() CUE-файла (из кэша или разбором) или None, если файла нет"""
+        info = self._infos.get(cue_path)
+        if info:
+            folder = os.path.dirname(cue_path)
+            for name in {info['file'], *(track['file'] for track in info['tracks'])}:
+                if name:
+                    self.register(os.path.join(folder, name), cue_path)
+        return info
+
+    def register(self, audio_path: str, cue_path: str):
+        """Запоминает, что CUE-файл описывает аудиофайл"""
+        with self._lock:
+            if len(self._cue_by_audio) >= self._max_links and audio_path not in self._cue_by_audio:
+                self._cue_by_audio.clear()
+            self._cue_by_audio[audio_path] = cue_path
+
+    def find_for_audio(self, audio_path: str, candidates=()):
+        """(путь CUE, info) для аудиофайла или (None, None)
+
+        Сначала обратная карта; при промахе разбираются candidates - пути
+        .cue файлов папки (каждый разбор тоже попадает в кэш).
+        """
+        audio_name = os.path.basename(audio_path)
+        with self._lock:
+            cue_path = self._cue_by_audio.get(audio_path)
+        if cue_path is not None:
+            info = self.get_info(cue_path)
+            if describes_audio(info, audio_name):
+                return cue_path, info
+            with self._lock:
+                if self._cue_by_audio.get(audio_path) == cue_path:
+                    del self._cue_by_audio[audio_path]
+
+        for candidate in candidates:
+            info = self.get_info(candidate)
+            if describes_audio(info, audio_name):
+                return candidate, info
+        return None, None
+
+    def invalidate(self, cue_path: str = None):
+        """Удаляет разобранный CUE-файл (или все)"""
+        self._infos.invalidate(cue_path)
+        if cue_path is None:
+            with self._lock:
+                self._cue_by_audio.clear()
@@ -5,46 +5,126 @@ CUE File Parser для Aether Player
 UPDATED: 2025-08-09 v2 - исправлена проблема с многофайловыми CUE
 """
 
+import codecs
 import re
 import os
-import subprocess
-import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Tuple
 
+from audio_probe import probe_audio_file
+
+# Грамматика CUE: строка = КОМАНДА аргументы; шаблоны компилируются один раз.
+# Токенизатор выделяет все пары (команда, аргументы) файла одним вызовом
+_LINE_RE = re.compile(r'^[ \t\ufeff]*([A-Za-z]+)[ \t]*([^\n]*)', re.MULTILINE)
+# FILE "имя" тип или FILE имя с пробелами тип. Имя в кавычках - все между
+# кавычками при любом типе; без кавычек тип - необязательное последнее слово
+# без точки (WAVE, mp3, ...), все до него - имя файла
+_FILE_RE = re.compile(r'"(.*)"(?:\s+(\S+))?$|(.+?)(?:\s+([A-Za-z0-9]+))?$')
+_TRACK_RE = re.compile(r'(\d+)\s+(\S+)')
+_TIME_RE = re.compile(r'(\d+):(\d+):(\d+)$')
+
+DURATION_WORKERS = 4  # Сколько длительностей файлов многофайлового CUE узнается одновременно
+_HIGH_RUN_RE = re.compile(rb'[\x80-\xff]{2,}')
+_HIGH_BYTES = bytes(range(0x80, 0x100))
+
+def parse_cue_time(value: str) -> Optional[float]:
+    """mm:ss:ff (75 кадров в секунде) -> секунды, None для некорректного времени"""
+    match = _TIME_RE.match(value or '')
+    if not match:
+        return None
+    minutes, seconds, frames = match.groups()
+    return int(minutes) * 60 + int(seconds) + int(frames) / 75.0
+
+def detect_cue_encoding(raw: bytes) -> str:
+    """Кодировка CUE-файла по BOM и статистике байтов
+
+    Без BOM: корректный UTF-8 - это UTF-8. Иначе однобайтовая кодировка:
+    в кириллице (windows-1251) старшие байты идут подряд - буквы слова,
+    а в западноевропейских названиях (cp1252) это одиночные é, ü, ñ.
+    """
+    if raw.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if raw.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        raw.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    high = len(raw) - len(raw.translate(None, _HIGH_BYTES))
+    in_runs = sum(len(run) for run in _HIGH_RUN_RE.findall(raw))
+    return 'windows-1251' if in_runs * 2 >= high else 'cp1252'
+
+def _split_word(value: str):
+    """Первое слово и остаток: разделитель - любые пробелы и табуляции"""
+    parts = value.split(None, 1)
+    if not parts:
+        return '', ''
+    return parts[0], parts[1].strip() if len(parts) > 1 else ''
+
+def _unquote(value: str) -> str:
+    """"значение" -> значение; кавычки внутри сохраняются (до последней кавычки)"""
+    if value[:1] != '"':
+        return value
+    end = value.rfind('"')
+    return value[1:end] if end > 0 else value[1:]
+
 def get_audio_file_duration(file_path: str) -> Optional[float]:
-    """Получает длительность аудиофайла через ffprobe в секундах"""
+    """Получает длительность аудиофайла в секундах (заголовки, ffprobe - fallback)"""
     try:
-        result = subprocess.run([
-            'ffprobe', '-v', 'quiet', '-print_format', 'json', 
-            '-show_format', file_path
-        ], capture_output=True, text=True, timeout=30)
-        
-        if result.returncode == 0:
-            data = json.loads(result.stdout)
-            duration = data.get('format', {}).get('duration')
-            if duration:
-                return float(duration)
+        info = probe_audio_file(file_path)
+        if info and info.get('duration'):
+            return info['duration']
     except Exception as e:
         print(f"Ошибка получения длительности файла {file_path}: {e}")
     return None
 
+def fetch_durations(paths, get_duration=None, max_workers: int = DURATION_WORKERS) -> List[Optional[float]]:
+    """Длительности файлов (секунды или None) в порядке paths
+
+    Запрашиваются параллельно, не больше max_workers одновременно;
+    get_duration(путь) по умолчанию - get_audio_file_duration.
+    """
+    get_duration = get_duration or get_audio_file_duration
+
+    def duration(path):
+        try:
+            return get_duration(path)
+        except Exception as e:
+            print(f"Не удалось получить длительность файла {path}: {e}")
+            return None
+
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        return list(pool.map(duration, paths))
+
 class CueTrack:
     """Представляет один трек в CUE файле"""
+    __slots__ = ('number', 'title', 'performer', 'index', 'index00', 'pregap', 'flags',
+                 'isrc', 'file', 'absolute_time_seconds')
     
     def __init__(self):
         self.number = 0
         self.title = ""
         self.performer = ""
-        self.index = ""  # Время в формате mm:ss:ff
+        self.index = ""  # INDEX 01 - начало трека, mm:ss:ff
+        self.index00 = ""  # INDEX 00 - начало пре-гэпа в файле (если есть)
+        self.pregap = ""  # PREGAP - тишина, которой нет в файле
+        self.flags = ()  # FLAGS: DCP, 4CH, PRE, SCMS
+        self.isrc = ""
         self.file = ""
-        self.absolute_time_seconds = 0.0  # Абсолютное время с учетом многофайловых CUE
+        # Абсолютное время с учетом многофайловых CUE; None - не вычислено или неизвестно
+        self.absolute_time_seconds = None
     
-    def get_time_seconds(self) -> float:
-        """Возвращает абсолютное время трека в секундах"""
+    def get_time_seconds(self) -> Optional[float]:
+        """Возвращает абсолютное время трека в секундах (None, если неизвестно)"""
         return self.absolute_time_seconds
     
     def get_time_display(self) -> str:
-        """Возвращает время в читаемом формате для отображения"""
+        """Возвращает время в читаемом формате для отображения ('' если неизвестно)"""
+        if self.absolute_time_seconds is None:
+            return ""
         total_seconds = int(self.absolute_time_seconds)
         hours = total_seconds // 3600
         minutes = (total_seconds % 3600) // 60
@@ -56,20 +136,16 @@ class CueTrack:
             return f"{minutes:02d}:{seconds:02d}"
     
     def parse_index_to_seconds(self) -> float:
-        """Конвертирует INDEX в секунды (относительно начала файла)"""
-        if not self.index:
-            return 0.0
-        
-        try:
-            parts = self.index.split(':')
-            if len(parts) == 3:
-                minutes = int(parts[0])
-                seconds = int(parts[1])
-                frames = int(parts[2])  # 75 кадров = 1 секунда
-                return minutes * 60 + seconds + frames / 75.0
-            return 0.0
-        except (ValueError, IndexError):
-            return 0.0
+        """Конвертирует INDEX 01 в секунды (относительно начала файла)"""
+        return parse_cue_time(self.index) or 0.0
+
+    def pregap_seconds(self) -> float:
+        """Длина пре-гэпа: INDEX 00..INDEX 01 в файле плюс PREGAP"""
+        pregap = parse_cue_time(self.pregap) or 0.0
+        index00 = parse_cue_time(self.index00)
+        if index00 is not None:
+            pregap += max(self.parse_index_to_seconds() - index00, 0.0)
+        return pregap
     
     def __str__(self):
         return f"Track {self.number:02d}: {self.title} [{self.get_time_display()}]"
@@ -85,6 +161,7 @@ class CueSheet:
         self.comment = ""
         self.tracks: List[CueTrack] = []
         self.files: Dict[str, List[CueTrack]] = {}
+        self.times_resolved = None  # None - абсолютные времена не вычислялись, иначе все ли известны
     
     def add_track(self, track: CueTrack):
         """Добавляет трек в CUE с автоматической перенумерацией"""
@@ -96,32 +173,36 @@ class CueSheet:
             self.files[track.file] = []
         self.files[track.file].append(track)
     
-    def calculate_absolute_times(self, cue_dir: str):
-        """Вычисляет абсолютные времена для всех треков с учетом многофайловых CUE"""
-        if not self.tracks:
-            return
-            
+    def calculate_absolute_times(self, cue_dir: str, get_duration=None,
+                                 max_workers: int = DURATION_WORKERS) -> bool:
+        """Вычисляет абсолютные времена для всех треков с учетом многофайловых CUE
+
+        Смещение файла - сумма длительностей предыдущих файлов. Длительности
+        нужны для всех файлов, кроме последнего, и запрашиваются параллельно
+        (не больше max_workers одновременно). get_duration(полный путь) ->
+        секунды или None; по умолчанию get_audio_file_duration. Если
+        длительность файла неизвестна, у треков следующих файлов
+        absolute_time_seconds остается None. Возвращает True, если известны
+        времена всех треков; для однофайлового CUE ничего не пробуется.
+        """
+        order = list(self.files)  # Файлы в порядке появления в CUE
+        needed = [name for name in order[:-1] if name]
+        durations = dict(zip(needed, fetch_durations(
+            [os.path.join(cue_dir, name) for name in needed], get_duration, max_workers)))
+
+        offsets = {}
         file_offset = 0.0  # Смещение для следующего файла
-        current_file = None
-        
+        for name in order:
+            offsets[name] = file_offset
+            if file_offset is not None:
+                file_duration = durations.get(name)
+                file_offset = file_offset + file_duration if file_duration else None
+
         for track in self.tracks:
-            # Если началась новая сторона/файл
-            if track.file != current_file:
-                if current_file is not None:
-                    # Получаем длительность предыдущего файла и добавляем к смещению
-                    prev_file_path = os.path.join(cue_dir, current_file)
-                    duration = get_audio_file_duration(prev_file_path)
-                    if duration:
-                        file_offset += duration
-                        print(f"Файл {current_file}: длительность {duration:.1f}s, общее смещение: {file_offset:.1f}s")
-                    else:
-                        print(f"Не удалось получить длительность файла {current_file}")
-                
-                current_file = track.file
-            
-            # Вычисляем абсолютное время
-            relative_time = track.parse_index_to_seconds()
-            track.absolute_time_seconds = file_offset + relative_time
+            offset = offsets[track.file]
+            track.absolute_time_seconds = None if offset is None else offset + track.parse_index_to_seconds()
+        self.times_resolved = all(offsets[name] is not None for name in order)
+        return self.times_resolved
     
     def get_duration_for_track(self, track_num: int) -> Optional[float]:
         """Вычисляет длительность трека"""
@@ -135,100 +216,87 @@ class CueSheet:
             return None
         
         next_track = self.tracks[track_num]
+        if next_track.absolute_time_seconds is None or current_track.absolute_time_seconds is None:
+            return None
         return next_track.absolute_time_seconds - current_track.absolute_time_seconds
     
     def __repr__(self):
         return f"CUE: {self.performer} - {self.title} ({len(self.tracks)} tracks)"
 
 def parse_cue_file(file_path: str) -> Optional[CueSheet]:
-    """Парсит CUE файл и возвращает CueSheet"""
-    if not os.path.exists(file_path):
+    """Парсит CUE файл и возвращает CueSheet
+
+    Один проход: токенизатор разбивает файл на (команда, аргументы),
+    аргументы разбираются шаблоном команды. Кодировка определяется один
+    раз по байтам файла.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+    except OSError:
         return None
-        
+
     try:
+        content = raw.decode(detect_cue_encoding(raw), errors='replace').replace('\r\n', '\n').replace('\r', '\n')
         cue = CueSheet()
         current_track = None
         current_file = None
-        cue_dir = os.path.dirname(file_path)
-        
-        # Пробуем разные кодировки
-        content = None
-        encodings = ['utf-8', 'windows-1251', 'iso-8859-1', 'cp1252']
+        in_track = False  # Внутри TRACK (в том числе пропускаемого не-аудио трека)
         
-        for encoding in encodings:
-            try:
-                with open(file_path, 'r', encoding=encoding) as f:
-                    content = f.read()
-                    break
-            except UnicodeDecodeError:
-                continue
-        
-        if not content:
-            return None
-        
-        # Нормализуем переводы строк
-        content = content.replace('\r\n', '\n').replace('\r', '\n')
-        lines = content.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
+        for command, args in _LINE_RE.findall(content):
+            command = command.upper()
+            args = args.rstrip()
             
-            # Глобальная информация об альбоме
-            if line.startswith('PERFORMER '):
-                match = re.match(r'PERFORMER\s+"([^"]+)"', line)
-                if match:
-                    if current_track:
-                        current_track.performer = match.group(1)
-                    else:
-                        cue.performer = match.group(1)
+            if command == 'TRACK':
+                # Сохраняем предыдущий трек
+                if current_track:
+                    cue.add_track(current_track)
+                    current_track = None
+                in_track = True
+                match = _TRACK_RE.match(args)
+                if match and match.group(2).upper() == 'AUDIO':
+                    # Номер будет назначен автоматически в add_track
+                    current_track = CueTrack()
+                    current_track.file = current_file
+                    
+            elif command == 'INDEX':
+                if current_track:
+                    number, time_value = _split_word(args)
+                    if number in ('01', '1'):
+                        current_track.index = time_value
+                    elif number in ('00', '0'):
+                        current_track.index00 = time_value
                         
-            elif line.startswith('TITLE '):
-                match = re.match(r'TITLE\s+"([^"]+)"', line)
-                if match:
+            elif command == 'TITLE' or command == 'PERFORMER':
+                value = _unquote(args)
+                if in_track:
                     if current_track:
-                        current_track.title = match.group(1)
-                    else:
-                        cue.title = match.group(1)
-                        
-            elif line.startswith('REM GENRE '):
-                match = re.match(r'REM GENRE\s+"([^"]+)"', line)
-                if match:
-                    cue.genre = match.group(1)
+                        setattr(current_track, command.lower(), value)
+                else:
+                    setattr(cue, command.lower(), value)
                     
-            elif line.startswith('REM DATE '):
-                match = re.match(r'REM DATE\s+"([^"]+)"', line)
+            elif command == 'FILE':
+                match = _FILE_RE.match(args)
                 if match:
-                    cue.date = match.group(1)
+                    current_file = match.group(1) if match.group(1) is not None else match.group(3)
                     
-            elif line.startswith('REM COMMENT '):
-                match = re.match(r'REM COMMENT\s+"([^"]+)"', line)
-                if match:
-                    cue.comment = match.group(1)
+            elif command == 'REM':
+                key, value = _split_word(args)
+                key = key.upper()
+                if key in ('GENRE', 'DATE', 'COMMENT') and not in_track:
+                    setattr(cue, key.lower(), _unquote(value))
                     
-            # Информация о файлах
-            elif line.startswith('FILE '):
-                match = re.match(r'FILE\s+"([^"]+)"\s+(\w+)', line)
-                if match:
-                    current_file = match.group(1)
+            elif command == 'FLAGS':
+                if current_track:
+                    current_track.flags = tuple(flag.upper() for flag in args.split())
                     
-            # Информация о треках
-            elif 'TRACK ' in line and 'AUDIO' in line:
-                match = re.match(r'\s*TRACK\s+(\d+)\s+AUDIO', line)
-                if match:
-                    # Сохраняем предыдущий трек
-                    if current_track:
-                        cue.add_track(current_track)
+            elif command == 'PREGAP':
+                if current_track:
+                    current_track.pregap = args
                     
-                    # Создаем новый трек (номер будет назначен автоматически в add_track)
-                    current_track = CueTrack()
-                    current_track.file = current_file
-                    
-            elif 'INDEX ' in line:
-                match = re.match(r'\s*INDEX\s+01\s+([\d:]+)', line)
-                if match and current_track:
-                    current_track.index = match.group(1)
+            elif command == 'ISRC':
+                if current_track:
+                    current_track.isrc = _unquote(args)
         
         # Добавляем последний трек
         if current_track:
@@ -239,9 +307,8 @@ def parse_cue_file(file_path: str) -> Optional[CueSheet]:
             if not track.performer:
                 track.performer = cue.performer
         
-        # Вычисляем абсолютные времена с учетом многофайловых CUE
-        cue.calculate_absolute_times(cue_dir)
-        
+        # Абсолютные времена многофайловых CUE требуют длительностей файлов -
+        # они вычисляются лениво (CueParser.get_info), а не при разборе
         return cue if cue.tracks else None
         
     except Exception as e:
@@ -286,12 +353,28 @@ def find_audio_file_for_cue(cue_path: str, referenced_file: str) -> Optional[str
 class CueParser:
     """Главный класс для работы с CUE файлами"""
     
-    def __init__(self, cue_path: str):
+    def __init__(self, cue_path: str, get_duration=None):
         self.cue_path = cue_path
+        self.get_duration = get_duration  # Источник длительностей файлов (кэш), см. calculate_absolute_times
         self.cue_sheet = parse_cue_file(cue_path)
     
-    def get_info(self) -> Dict:
-        """Возвращает информацию о CUE в удобном формате"""
+    def resolve_times(self) -> bool:
+        """Вычисляет абсолютные времена треков (один раз), True - если известны все"""
+        if not self.cue_sheet:
+            return True
+        if self.cue_sheet.times_resolved is None:
+            self.cue_sheet.calculate_absolute_times(os.path.dirname(self.cue_path), self.get_duration)
+        return self.cue_sheet.times_resolved
+    
+    def get_info(self, with_times: bool = True) -> Dict:
+        """Возвращает информацию о CUE в удобном формате
+
+        with_times=False не вычисляет абсолютные времена ('start_time' пустое,
+        'start_time_seconds' None) - воспроизведению хватает относительных,
+        а многофайловый CUE не ждет длительностей своих файлов.
+        """
+        if with_times:
+            self.resolve_times()
         if not self.cue_sheet:
             return {
                 'title': None,
@@ -343,6 +426,7 @@ class CueParser:
             print("CUE файл не найден или поврежден")
             return
             
+        self.resolve_times()
         print(repr(self.cue_sheet))
         for track in self.cue_sheet.tracks:
             print(f"  {track}")
@@ -0,0 +1,97 @@
+"""
+Единая временная шкала многофайлового CUE для Aether Player
+Все FILE альбома (например, стороны винилового рипа) склеиваются в один
+EDL-источник MPV, поэтому альбом играет без перезагрузки файлов на границах
+"""
+
+import logging
+import os
+
+from cue_parser import fetch_durations, find_audio_file_for_cue
+
+logger = logging.getLogger('aether_player')
+
+
+def cue_files(tracks):
+    """FILE CUE-альбома в порядке появления (по трекам из get_info())"""
+    return list(dict.fromkeys(track.get('file') for track in tracks))
+
+
+def edl_url(segments) -> str:
+    """URL edl:// для MPV из сегментов (полный путь, длительность или None)
+
+    Пути записываются с префиксом длины (%байт%), поэтому запятые и точки
+    с запятой в именах файлов не ломают разбор. Явная длительность
+    сегмента фиксирует границы файлов - они совпадают со смещениями,
+    по которым считаются треки.
+    """
+    entries = []
+    for path, length in segments:
+        entry = f"%{len(path.encode('utf-8'))}%{path}"
+        if length:
+            entry += f",0,{length:.6f}"
+        entries.append(entry)
+    return 'edl://' + ';'.join(entries)
+
+
+class CueTimeline:
+    """Шкала многофайлового CUE: URL для MPV и смещения файлов на ней
+
+    offsets - имя FILE (как в CUE) -> начало файла на шкале в секундах;
+    paths - имя FILE -> найденный полный путь аудиофайла.
+    """
+    __slots__ = ('url', 'offsets', 'paths')
+
+    def __init__(self, url: str, offsets: dict, paths: dict):
+        self.url = url
+        self.offsets = offsets
+        self.paths = paths
+
+    def file_for_path(self, path: str):
+        """Имя FILE, которому соответствует полный путь аудиофайла, или None"""
+        name = os.path.basename(path)
+        for file, file_path in self.paths.items():
+            if file == name or file_path == path:
+                return file
+        return None
+
+    def position(self, path: str, relative_seconds: float = 0.0) -> float:
+        """Позиция на шкале для времени внутри аудиофайла path"""
+        file = self.file_for_path(path)
+        return self.offsets.get(file, 0.0) + relative_seconds
+
+
+def build_cue_timeline(cue_path: str, tracks, get_duration=None):
+    """CueTimeline для CUE с несколькими FILE или None
+
+    None - если FILE один (шкала не нужна) или какой-то файл не найден
+    либо его длительность неизвестна: тогда играет один файл, как раньше.
+    Длительности всех файлов, кроме последнего, запрашиваются параллельно.
+    """
+    files = cue_files(tracks)
+    if len(files) < 2 or not all(files):
+        return None
+
+    paths = {}
+    for file in files:
+        path = find_audio_file_for_cue(cue_path, file)
+        if path is None:
+            logger.warning(f"📀 Файл '{file}' из {os.path.basename(cue_path)} не найден - "
+                           f"играем альбом по одному файлу")
+            return None
+        paths[file] = path
+
+    durations = fetch_durations([paths[file] for file in files[:-1]], get_duration) + [None]
+    if not all(durations[:-1]):
+        logger.warning(f"📀 Неизвестна длительность файлов {os.path.basename(cue_path)} - "
+                       f"играем альбом по одному файлу")
+        return None
+
+    offsets = {}
+    offset = 0.0
+    for file, duration in zip(files, durations):
+        offsets[file] = offset
+        offset += duration or 0.0
+
+    url = edl_url([(paths[file], duration) for file, duration in zip(files, durations)])
+    return CueTimeline(url, offsets, paths)
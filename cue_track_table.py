@@ -0,0 +1,74 @@
+"""
+Таблица треков CUE-альбома для Aether Player
+Строится один раз при старте альбома; текущий трек по позиции
+воспроизведения ищется двоичным поиском по заранее посчитанным границам
+"""
+
+from bisect import bisect_right
+
+
+class CueTrackTable:
+    """Треки CUE-альбома, который играет MPV, с границами по позиции
+
+    tracks - словари треков из CueParser.get_info() (без копирования);
+    starts[i] - начало трека в секундах от начала того, что играет MPV,
+    ends[i] - начало следующего трека, у последнего None: он идет до конца
+    файла, длительность которого знает только MPV. Таблица не меняется,
+    поэтому ее можно хранить в снимке состояния плеера, а запросы статуса
+    не строят ничего заново.
+
+    offsets - смещения FILE на шкале CueTimeline, если MPV играет все файлы
+    альбома одним EDL; тогда в таблицу попадают треки всех этих файлов.
+    Без шкалы - только треки FILE file (по умолчанию первого): лишь они
+    лежат в том аудиофайле, который загружен в MPV.
+    """
+    __slots__ = ('tracks', 'starts', 'ends', 'timeline', '_index_by_number')
+
+    def __init__(self, tracks, offsets: dict = None, file: str = None):
+        tracks = list(tracks)
+        self.timeline = bool(offsets)
+        if not offsets:
+            if file is None and tracks:
+                file = tracks[0].get('file')
+            offsets = {file: 0.0}
+        self.tracks = tuple(track for track in tracks if track.get('file') in offsets)
+        self.starts = tuple(offsets[track.get('file')] + float(track.get('relative_time_seconds') or 0.0)
+                            for track in self.tracks)
+        self.ends = self.starts[1:] + (None,)
+        self._index_by_number = {track.get('number'): i for i, track in enumerate(self.tracks)}
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __repr__(self):
+        return f"CueTrackTable({len(self.tracks)} треков)"
+
+    def end(self, index: int, duration: float = None):
+        """Конец трека; для последнего - duration (длительность файла)"""
+        end = self.ends[index]
+        return duration if end is None else end
+
+    def index_at(self, position: float, duration: float = None) -> int:
+        """Индекс трека, в который попадает позиция, или -1
+
+        Пока длительность файла неизвестна (duration пустая), последний
+        трек считается открытым до конца.
+        """
+        index = bisect_right(self.starts, position) - 1
+        if index < 0:
+            return -1
+        end = self.end(index, duration)
+        if end and position >= end:
+            return -1
+        return index
+
+    def index_of(self, track) -> int:
+        """Индекс трека (словаря из tracks) по номеру или -1"""
+        if not track:
+            return -1
+        return self._index_by_number.get(track.get('number'), -1)
+
+    def track_at(self, position: float, duration: float = None):
+        """Трек, в который попадает позиция, или None"""
+        index = self.index_at(position, duration)
+        return self.tracks[index] if index >= 0 else None
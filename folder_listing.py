@@ -0,0 +1,165 @@
+"""
+Листинг папки медиатеки Aether Player
+Компактное неизменяемое содержимое одной папки (имена, типы, размеры),
+которое строится один раз и делится между просмотром, плейлистом,
+галереей изображений и поиском CUE-альбомов, и LRU кэш таких листингов
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+# Грубая оценка памяти на один элемент листинга (объект, строка имени, числа)
+ENTRY_OVERHEAD = 200
+
+# Ключи сортировки файлов; имя - всегда последний критерий, порядок однозначен
+SORT_KEYS = {
+    'name': lambda f: (f.name.casefold(), f.name),
+    'type': lambda f: (f.type, f.name.casefold(), f.name),
+    'size': lambda f: (f.size, f.name.casefold(), f.name),
+    'mtime': lambda f: (f.mtime_ns, f.name.casefold(), f.name),
+}
+MAX_VIEWS = 8  # Запомненных сортировок на один листинг
+
+
+class FileEntry:
+    """Файл папки: имя, тип медиа, размер и mtime"""
+    __slots__ = ('name', 'type', 'size', 'mtime_ns')
+
+    def __init__(self, name: str, type: str, size: int, mtime_ns: int):
+        self.name = name
+        self.type = type
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    def as_dict(self):
+        return {'name': self.name, 'type': self.type, 'size': self.size, 'mtime_ns': self.mtime_ns}
+
+
+class FolderListing:
+    """Содержимое одной папки на момент mtime_ns
+
+    path - полный путь папки; folders - имена подпапок; files - FileEntry.
+    Оба списка отсортированы по имени.
+    """
+    __slots__ = ('path', 'mtime_ns', 'folders', 'files', '_by_name', '_views', 'size_estimate')
+
+    def __init__(self, path: str, mtime_ns: int, folders, files):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.folders = tuple(folders)
+        self.files = tuple(files)
+        self._by_name = None
+        self._views = {}
+        self.size_estimate = (ENTRY_OVERHEAD * (len(self.folders) + len(self.files) + 1) +
+                              sum(len(name) for name in self.folders) +
+                              sum(len(f.name) for f in self.files))
+
+    @classmethod
+    def from_dict(cls, path: str, listing: dict):
+        """Из словаря {'folders', 'files', 'mtime_ns'} (индекс или сканер)"""
+        files = [FileEntry(f['name'], f['type'], f['size'], f['mtime_ns']) for f in listing['files']]
+        return cls(path, listing['mtime_ns'], listing['folders'], files)
+
+    def __contains__(self, name: str) -> bool:
+        return self.file(name) is not None
+
+    def file(self, name: str):
+        """FileEntry по имени или None"""
+        if self._by_name is None:
+            self._by_name = {f.name: f for f in self.files}
+        return self._by_name.get(name)
+
+    def of_type(self, *types):
+        """Файлы заданных типов ('audio', 'video', 'image', 'text', 'unknown')"""
+        return [f for f in self.files if f.type in types]
+
+    def paths(self, *types):
+        """Полные пути файлов заданных типов в порядке имен"""
+        return [os.path.join(self.path, f.name) for f in self.of_type(*types)]
+
+    def view(self, sort: str = 'name', descending: bool = False, types=None):
+        """Папки (первыми, по имени), затем файлы в порядке sort
+
+        Элементы - FileEntry, у папок type == 'folder', size и mtime_ns None.
+        types - набор типов для фильтра ('folder', 'audio', ...) или None.
+        Результат запоминается, поэтому постраничный просмотр большой папки
+        сортирует ее один раз.
+        """
+        key = (sort, descending, frozenset(types) if types else None)
+        entries = self._views.get(key)
+        if entries is not None:
+            return entries
+
+        entries = []
+        if not types or 'folder' in types:
+            folders = sorted(self.folders, key=lambda name: (name.casefold(), name),
+                             reverse=descending and sort == 'name')
+            entries.extend(FileEntry(name, 'folder', None, None) for name in folders)
+        files = [f for f in self.files if not types or f.type in types]
+        files.sort(key=SORT_KEYS[sort], reverse=descending)
+        entries.extend(files)
+        entries = tuple(entries)
+
+        if len(self._views) >= MAX_VIEWS:
+            self._views.clear()
+        self._views[key] = entries
+        return entries
+
+    def with_extension(self, extension: str):
+        """Имена файлов с расширением (без учета регистра), например '.cue'"""
+        return [f.name for f in self.files if f.name.lower().endswith(extension)]
+
+
+class ListingCache:
+    """LRU кэш листингов папок с проверкой по mtime папки
+
+    Ключ - путь папки относительно MEDIA_ROOT. Запись действительна, пока
+    mtime папки совпадает с mtime листинга, поэтому повторный просмотр и
+    воспроизведение в той же папке стоят один stat. Изменения, которые не
+    меняют mtime папки (дозапись файла), сбрасываются через invalidate().
+    Ограничен и числом записей, и оценкой занимаемой памяти.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, folder: str, mtime_ns: int):
+        """Листинг папки, если он снят при том же mtime, иначе None"""
+        with self._lock:
+            listing = self._entries.get(folder)
+            if listing is None:
+                return None
+            if listing.mtime_ns != mtime_ns:
+                self._remove(folder)
+                return None
+            self._entries.move_to_end(folder)
+            return listing
+
+    def put(self, folder: str, listing: FolderListing):
+        with self._lock:
+            if folder in self._entries:
+                self._remove(folder)
+            if listing.size_estimate > self.max_bytes:
+                return  # Один огромный листинг вытеснил бы весь кэш
+            self._entries[folder] = listing
+            self._bytes += listing.size_estimate
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size_estimate
+
+    def invalidate(self, folder: str = None):
+        """Удаляет листинг папки (или все листинги)"""
+        with self._lock:
+            if folder is None:
+                self._entries.clear()
+                self._bytes = 0
+            elif folder in self._entries:
+                self._remove(folder)
+
+    def _remove(self, folder: str):
+        self._bytes -= self._entries.pop(folder).size_estimate
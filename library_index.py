@@ -0,0 +1,474 @@
+"""
+Индекс медиатеки Aether Player
+Постоянная база SQLite на локальном носителе: папки, файлы, параметры
+потоков и CUE-альбомы. Просмотр, плейлисты и метаданные читаются из
+индекса вместо медленного HDD
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('aether_player')
+
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,          -- путь относительно MEDIA_ROOT, '' - корень
+    parent TEXT,
+    name TEXT NOT NULL,
+    mtime_ns INTEGER                -- NULL - папка найдена, но еще не просканирована
+);
+CREATE INDEX IF NOT EXISTS folders_parent ON folders(parent);
+
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,             -- audio, video, image, text, unknown
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_folder ON files(folder);
+
+CREATE TABLE IF NOT EXISTS stream_info (
+    path TEXT PRIMARY KEY REFERENCES files(path) ON DELETE CASCADE,
+    size INTEGER NOT NULL,          -- размер и mtime файла, для которых сделана проба
+    mtime_ns INTEGER NOT NULL,
+    codec TEXT,
+    sample_rate INTEGER,
+    channels INTEGER,
+    bits_per_sample INTEGER,
+    duration REAL,
+    bitrate INTEGER,
+    failed_at REAL                  -- время неудачной пробы (поля пустые), NULL - проба удалась
+);
+
+CREATE TABLE IF NOT EXISTS cue_albums (
+    path TEXT PRIMARY KEY REFERENCES files(path) ON DELETE CASCADE,
+    folder TEXT NOT NULL,
+    audio_file TEXT,                -- имя первого аудиофайла альбома
+    title TEXT,
+    performer TEXT,
+    genre TEXT,
+    date TEXT,
+    comment TEXT
+);
+CREATE INDEX IF NOT EXISTS cue_albums_folder ON cue_albums(folder);
+
+CREATE TABLE IF NOT EXISTS cue_tracks (
+    cue_path TEXT NOT NULL REFERENCES cue_albums(path) ON DELETE CASCADE,
+    number INTEGER NOT NULL,
+    title TEXT,
+    performer TEXT,
+    file TEXT,
+    start_time TEXT,
+    start_time_seconds REAL,
+    relative_time_seconds REAL,
+    PRIMARY KEY (cue_path, number)
+);
+
+-- Полнотекстовый поиск по всей медиатеке. rowid = rowid исходной строки * 4
+-- плюс вид записи (SEARCH_KINDS); строки поддерживаются триггерами
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(
+    name, performer, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3');
+
+CREATE TRIGGER IF NOT EXISTS folders_search_insert AFTER INSERT ON folders WHEN new.path != '' BEGIN
+    INSERT INTO search (rowid, name) VALUES (new.rowid * 4, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS folders_search_delete AFTER DELETE ON folders BEGIN
+    DELETE FROM search WHERE rowid = old.rowid * 4;
+END;
+CREATE TRIGGER IF NOT EXISTS files_search_insert AFTER INSERT ON files BEGIN
+    INSERT INTO search (rowid, name) VALUES (new.rowid * 4 + 1, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_search_delete AFTER DELETE ON files BEGIN
+    DELETE FROM search WHERE rowid = old.rowid * 4 + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS cue_albums_search_insert AFTER INSERT ON cue_albums BEGIN
+    INSERT INTO search (rowid, name, performer) VALUES (new.rowid * 4 + 2, new.title, new.performer);
+END;
+CREATE TRIGGER IF NOT EXISTS cue_albums_search_delete AFTER DELETE ON cue_albums BEGIN
+    DELETE FROM search WHERE rowid = old.rowid * 4 + 2;
+END;
+CREATE TRIGGER IF NOT EXISTS cue_tracks_search_insert AFTER INSERT ON cue_tracks BEGIN
+    INSERT INTO search (rowid, name, performer) VALUES (new.rowid * 4 + 3, new.title, new.performer);
+END;
+CREATE TRIGGER IF NOT EXISTS cue_tracks_search_delete AFTER DELETE ON cue_tracks BEGIN
+    DELETE FROM search WHERE rowid = old.rowid * 4 + 3;
+END;
+"""
+
+STREAM_INFO_FIELDS = ('codec', 'sample_rate', 'channels', 'bits_per_sample', 'duration', 'bitrate')
+CUE_TRACK_FIELDS = ('number', 'title', 'performer', 'start_time', 'start_time_seconds',
+                    'file', 'relative_time_seconds')
+# Неудачная проба (таймаут ffprobe, диск еще монтируется) повторяется не раньше чем через столько секунд
+PROBE_RETRY_INTERVAL = 600.0
+
+# Вид записи поиска = rowid % 4
+SEARCH_KINDS = ('folder', 'file', 'album', 'track')
+# Папки и альбомы важнее отдельных файлов и треков с тем же совпадением
+SEARCH_KIND_BOOST = "CASE rowid % 4 WHEN 0 THEN 1.5 WHEN 2 THEN 1.5 ELSE 1.0 END"
+
+
+def search_match_expression(query: str) -> str:
+    """Запрос пользователя -> выражение FTS5 MATCH
+
+    Каждое слово ищется как префикс, все слова обязательны:
+    'pink flo' находит 'Pink Floyd'. Пустая строка, если слов нет.
+    """
+    words = re.findall(r'[^\W_]+', query.casefold())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def parent_of(path: str):
+    """Родительская папка относительного пути ('' - корень, None - у корня)"""
+    if not path:
+        return None
+    return path.rpartition('/')[0]
+
+
+def join_path(folder: str, name: str) -> str:
+    return f"{folder}/{name}" if folder else name
+
+
+class LibraryIndex:
+    """Индекс медиатеки в SQLite
+
+    Одно соединение на процесс под RLock: запросы короткие, а под gevent
+    потоки все равно кооперативные. Все пути - относительно MEDIA_ROOT,
+    поэтому индекс переживает перемонтирование диска.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def _connection(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            # INSERT OR REPLACE должен вызывать триггеры удаления (поисковый индекс)
+            conn.execute("PRAGMA recursive_triggers=ON")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # Индекс - производные данные: при смене схемы просто строим заново
+                for table in ('search', 'cue_tracks', 'cue_albums', 'stream_info', 'files', 'folders'):
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.executescript(SCHEMA)
+                conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+                logger.info(f"📚 Создан индекс медиатеки {self.db_path}")
+            self._conn = conn
+        return self._conn
+
+    def _transaction(self):
+        return _Transaction(self)
+
+    # --- Папки ---
+
+    def folder_mtime(self, folder: str):
+        """mtime папки на момент последнего сканирования (None - не сканировалась)"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT mtime_ns FROM folders WHERE path = ?", (folder,)).fetchone()
+        return row['mtime_ns'] if row else None
+
+    def list_folder(self, folder: str):
+        """Содержимое просканированной папки или None
+
+        {'folders': [имена], 'files': [{'name', 'type', 'size', 'mtime_ns'}]},
+        оба списка отсортированы по имени.
+        """
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT mtime_ns FROM folders WHERE path = ?", (folder,)).fetchone()
+            if row is None or row['mtime_ns'] is None:
+                return None
+            folders = [r['name'] for r in conn.execute(
+                "SELECT name FROM folders WHERE parent = ? ORDER BY name", (folder,))]
+            files = [dict(r) for r in conn.execute(
+                "SELECT name, type, size, mtime_ns FROM files WHERE folder = ? ORDER BY name", (folder,))]
+        return {'folders': folders, 'files': files, 'mtime_ns': row['mtime_ns']}
+
+    def replace_folder(self, folder: str, mtime_ns: int, subfolders, files, cue_albums=()):
+        """Записывает результат сканирования одной папки одной транзакцией
+
+        subfolders - имена подпапок; files - словари name/type/size/mtime_ns;
+        cue_albums - словари из CueParser.get_info() с ключом 'cue_file'.
+        Исчезнувшие подпапки удаляются из индекса вместе с содержимым.
+        """
+        with self._transaction() as conn:
+            self._replace_folder(conn, folder, mtime_ns, subfolders, files, cue_albums)
+
+    def replace_folders(self, results):
+        """Записывает пачку результатов сканирования одной транзакцией
+
+        results - кортежи (folder, mtime_ns, subfolders, files, cue_albums).
+        Каждая папка записывается целиком, поэтому прерванное сканирование
+        продолжается с папок, которые остались непросканированными.
+        """
+        with self._transaction() as conn:
+            for folder, mtime_ns, subfolders, files, cue_albums in results:
+                self._replace_folder(conn, folder, mtime_ns, subfolders, files, cue_albums)
+
+    def _replace_folder(self, conn, folder, mtime_ns, subfolders, files, cue_albums):
+        conn.execute(
+            "INSERT INTO folders (path, parent, name, mtime_ns) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns",
+            (folder, parent_of(folder), folder.rpartition('/')[2], mtime_ns))
+
+        # Подпапки: новые добавляем непросканированными, исчезнувшие удаляем целиком
+        known = {r['name'] for r in conn.execute("SELECT name FROM folders WHERE parent = ?", (folder,))}
+        current = set(subfolders)
+        for name in known - current:
+            self._remove_tree(conn, join_path(folder, name))
+        conn.executemany(
+            "INSERT OR IGNORE INTO folders (path, parent, name, mtime_ns) VALUES (?, ?, ?, NULL)",
+            [(join_path(folder, name), folder, name) for name in current - known])
+
+        # Файлы: параметры потоков сохраняются, пока не изменились размер и mtime
+        names = {f['name'] for f in files}
+        stale = [r['path'] for r in conn.execute("SELECT path, name FROM files WHERE folder = ?", (folder,))
+                 if r['name'] not in names]
+        conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in stale])
+        conn.executemany(
+            "INSERT INTO files (path, folder, name, type, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET type = excluded.type, size = excluded.size, "
+            "mtime_ns = excluded.mtime_ns",
+            [(join_path(folder, f['name']), folder, f['name'], f['type'], f['size'], f['mtime_ns'])
+             for f in files])
+
+        conn.execute("DELETE FROM cue_albums WHERE folder = ?", (folder,))
+        for album in cue_albums:
+            cue_path = join_path(folder, album['cue_file'])
+            conn.execute(
+                "INSERT INTO cue_albums (path, folder, audio_file, title, performer, genre, date, comment) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (cue_path, folder, album.get('file'), album.get('title'), album.get('performer'),
+                 album.get('genre'), album.get('date'), album.get('comment')))
+            conn.executemany(
+                f"INSERT OR REPLACE INTO cue_tracks (cue_path, {', '.join(CUE_TRACK_FIELDS)}) "
+                f"VALUES (?, {', '.join('?' for _ in CUE_TRACK_FIELDS)})",
+                [(cue_path, *(track.get(field) for field in CUE_TRACK_FIELDS)) for track in album['tracks']])
+
+    def update_cue_times(self, albums):
+        """Записывает досчитанные абсолютные времена треков CUE-альбомов
+
+        albums - пары (путь CUE относительно MEDIA_ROOT, треки из
+        CueParser.get_info()); остальные поля альбома не меняются.
+        """
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE cue_tracks SET start_time = ?, start_time_seconds = ? "
+                "WHERE cue_path = ? AND number = ?",
+                [(track['start_time'], track['start_time_seconds'], cue_path, track['number'])
+                 for cue_path, tracks in albums for track in tracks])
+
+    def remove_tree(self, folder: str):
+        """Удаляет папку и все ее содержимое из индекса"""
+        with self._transaction() as conn:
+            self._remove_tree(conn, folder)
+
+    def _remove_tree(self, conn, folder):
+        if folder:
+            # Поддерево - диапазон 'folder/' <= path < 'folder0' ('0' следует за '/')
+            low, high = folder + '/', folder + '0'
+            conn.execute("DELETE FROM files WHERE folder = ? OR (folder >= ? AND folder < ?)",
+                         (folder, low, high))
+            conn.execute("DELETE FROM folders WHERE path = ? OR (path >= ? AND path < ?)",
+                         (folder, low, high))
+        else:
+            conn.execute("DELETE FROM files")
+            conn.execute("DELETE FROM folders")
+
+    def folder_tree(self, root: str = ''):
+        """Папки поддерева root: {путь: (родитель, mtime_ns)}"""
+        with self._lock:
+            conn = self._connection()
+            if root:
+                rows = conn.execute(
+                    "SELECT path, parent, mtime_ns FROM folders WHERE path = ? OR (path >= ? AND path < ?)",
+                    (root, root + '/', root + '0'))
+            else:
+                rows = conn.execute("SELECT path, parent, mtime_ns FROM folders")
+            return {r['path']: (r['parent'], r['mtime_ns']) for r in rows}
+
+    def unscanned_folders(self, limit: int = 100):
+        """Папки, найденные при сканировании родителя, но еще не просканированные"""
+        with self._lock:
+            return [r['path'] for r in self._connection().execute(
+                "SELECT path FROM folders WHERE mtime_ns IS NULL LIMIT ?", (limit,))]
+
+    # --- Параметры потоков ---
+
+    def get_stream_info(self, path: str, size: int, mtime_ns: int):
+        """Параметры потока файла, если удачная проба относится к этой версии файла"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT * FROM stream_info WHERE path = ? AND size = ? AND mtime_ns = ? "
+                "AND failed_at IS NULL", (path, size, mtime_ns)).fetchone()
+        return {field: row[field] for field in STREAM_INFO_FIELDS} if row else None
+
+    def store_stream_info(self, path: str, size: int, mtime_ns: int, info: dict):
+        """Сохраняет результат пробы (только для файлов, уже известных индексу)"""
+        self.store_stream_infos([(path, size, mtime_ns, info)])
+
+    def store_stream_infos(self, results):
+        """Сохраняет пачку проб одной транзакцией: [(path, size, mtime_ns, info)]
+
+        Пустой info (None или {}) - неудачная проба: запоминается время,
+        и файл снова попадет в files_without_stream_info() через
+        PROBE_RETRY_INTERVAL, а не останется без параметров навсегда.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            for path, size, mtime_ns, info in results:
+                if conn.execute("SELECT 1 FROM files WHERE path = ?", (path,)).fetchone() is None:
+                    continue
+                info = info or {}
+                conn.execute(
+                    f"INSERT OR REPLACE INTO stream_info (path, size, mtime_ns, failed_at, "
+                    f"{', '.join(STREAM_INFO_FIELDS)}) "
+                    f"VALUES (?, ?, ?, ?, {', '.join('?' for _ in STREAM_INFO_FIELDS)})",
+                    (path, size, mtime_ns, None if info else now,
+                     *(info.get(field) for field in STREAM_INFO_FIELDS)))
+
+    def files_without_stream_info(self, limit: int = 100):
+        """Аудиофайлы без актуальной пробы (или с давней неудачной): [(path, size, mtime_ns)]"""
+        with self._lock:
+            return [(r['path'], r['size'], r['mtime_ns']) for r in self._connection().execute(
+                "SELECT f.path, f.size, f.mtime_ns FROM files f "
+                "LEFT JOIN stream_info s ON s.path = f.path "
+                "AND s.size = f.size AND s.mtime_ns = f.mtime_ns "
+                "WHERE f.type = 'audio' AND (s.path IS NULL OR s.failed_at < ?) LIMIT ?",
+                (time.time() - PROBE_RETRY_INTERVAL, limit))]
+
+    def stats(self):
+        """Размер индекса: папки (всего / непросканированные), файлы, аудио (всего / без пробы)"""
+        with self._lock:
+            conn = self._connection()
+            folders, unscanned = conn.execute(
+                "SELECT COUNT(*), COUNT(*) - COUNT(mtime_ns) FROM folders").fetchone()
+            files, audio = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(type = 'audio'), 0) FROM files").fetchone()
+            unprobed = conn.execute(
+                "SELECT COUNT(*) FROM files f "
+                "LEFT JOIN stream_info s ON s.path = f.path "
+                "AND s.size = f.size AND s.mtime_ns = f.mtime_ns "
+                "WHERE f.type = 'audio' AND (s.path IS NULL OR s.failed_at < ?)",
+                (time.time() - PROBE_RETRY_INTERVAL,)).fetchone()[0]
+        return {'folders': folders, 'unscanned_folders': unscanned, 'files': files,
+                'audio_files': audio, 'unprobed_files': unprobed}
+
+    # --- CUE ---
+
+    def cue_albums(self, folder: str):
+        """CUE-альбомы папки в формате CueParser.get_info() плюс 'cue_file'"""
+        with self._lock:
+            conn = self._connection()
+            albums = []
+            for row in conn.execute("SELECT * FROM cue_albums WHERE folder = ? ORDER BY path", (folder,)):
+                tracks = [dict(r) for r in conn.execute(
+                    f"SELECT {', '.join(CUE_TRACK_FIELDS)} FROM cue_tracks "
+                    f"WHERE cue_path = ? ORDER BY number", (row['path'],))]
+                albums.append({
+                    'cue_file': row['path'].rpartition('/')[2],
+                    'file': row['audio_file'],
+                    'title': row['title'],
+                    'performer': row['performer'],
+                    'genre': row['genre'],
+                    'date': row['date'],
+                    'comment': row['comment'],
+                    'tracks': tracks
+                })
+        return albums
+
+    # --- Поиск ---
+
+    def search(self, query: str, limit: int = 50, offset: int = 0, kinds=None):
+        """Поиск по именам папок и файлов, названиям и исполнителям CUE
+
+        Результаты ранжированы (bm25: совпадение в названии важнее, чем в
+        исполнителе; папки и альбомы выше файлов и треков). kinds - набор
+        из SEARCH_KINDS или None. Возвращает список словарей с ключом 'kind'.
+        """
+        match = search_match_expression(query)
+        if not match:
+            return []
+        kind_filter = ''
+        if kinds:
+            codes = ', '.join(str(SEARCH_KINDS.index(kind)) for kind in kinds)
+            kind_filter = f" AND rowid % 4 IN ({codes})"
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                f"SELECT rowid FROM search WHERE search MATCH ?{kind_filter} "
+                f"ORDER BY bm25(search, 10.0, 5.0) * {SEARCH_KIND_BOOST} LIMIT ? OFFSET ?",
+                (match, limit, offset)).fetchall()
+            results = []
+            for row in rows:
+                result = self._search_result(conn, row['rowid'])
+                if result is not None:
+                    results.append(result)
+        return results
+
+    def _search_result(self, conn, search_rowid: int):
+        kind = SEARCH_KINDS[search_rowid % 4]
+        rowid = search_rowid // 4
+        if kind == 'folder':
+            row = conn.execute("SELECT path, name FROM folders WHERE rowid = ?", (rowid,)).fetchone()
+            return row and {'kind': kind, 'path': row['path'], 'name': row['name']}
+        if kind == 'file':
+            row = conn.execute("SELECT path, folder, name, type FROM files WHERE rowid = ?", (rowid,)).fetchone()
+            return row and {'kind': kind, 'path': row['path'], 'folder': row['folder'],
+                            'name': row['name'], 'type': row['type']}
+        if kind == 'album':
+            row = conn.execute(
+                "SELECT path, folder, audio_file, title, performer FROM cue_albums WHERE rowid = ?",
+                (rowid,)).fetchone()
+            return row and {'kind': kind, 'path': row['path'], 'folder': row['folder'],
+                            'audio_file': row['audio_file'], 'title': row['title'],
+                            'performer': row['performer']}
+        row = conn.execute(
+            "SELECT cue_path, number, title, performer, file, relative_time_seconds "
+            "FROM cue_tracks WHERE rowid = ?", (rowid,)).fetchone()
+        return row and {'kind': kind, 'path': row['cue_path'], 'folder': parent_of(row['cue_path']),
+                        'number': row['number'], 'title': row['title'], 'performer': row['performer'],
+                        'file': row['file'], 'start_time': row['relative_time_seconds']}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT под блокировкой индекса"""
+
+    def __init__(self, index):
+        self._index = index
+
+    def __enter__(self):
+        self._index._lock.acquire()
+        try:
+            conn = self._index._connection()
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self._index._lock.release()
+            raise
+        return conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            conn = self._index._conn
+            conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self._index._lock.release()
+        return False
@@ -0,0 +1,388 @@
+"""
+Сканер медиатеки Aether Player
+Обходит MEDIA_ROOT и поддерживает индекс (library_index) в актуальном
+состоянии: содержимое папок, CUE-альбомы и параметры аудиопотоков
+"""
+
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from audio_probe import probe_audio_file
+from cue_parser import CueParser
+from folder_listing import FolderListing
+from library_index import join_path
+
+try:
+    from gevent import get_hub, monkey
+    GEVENT_PATCHED = monkey.is_module_patched('threading')
+except ImportError:
+    GEVENT_PATCHED = False
+
+logger = logging.getLogger('aether_player')
+
+PROGRESS_LOG_INTERVAL = 10.0  # секунд между сообщениями о ходе сканирования
+
+
+def run_blocking(func, *args):
+    """Выполняет дисковый ввод-вывод, не останавливая остальной сервер
+
+    Под gevent потоки - это гринлеты, и stat/scandir блокировали бы весь
+    цикл событий; поэтому вызов уходит в пул настоящих потоков ОС хаба,
+    а вызывающий гринлет просто ждет результат.
+    """
+    if GEVENT_PATCHED:
+        return get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+
+def _unknown_duration(path):
+    """Источник длительностей при чтении папки: ничего не пробует"""
+    return None
+
+
+class LibraryScanner:
+    """Сканирование папок MEDIA_ROOT в индекс медиатеки
+
+    get_file_type(path) -> 'audio' | 'video' | 'image' | 'text' | 'unknown'
+    is_available() -> bool: смонтирован ли диск. Пока диск недоступен,
+    сканер ничего не пишет, иначе пустая точка монтирования выглядела бы
+    как удаление всей медиатеки.
+
+    scan_workers / probe_workers - сколько папок читается и сколько файлов
+    пробуется одновременно. Для HDD выигрыш дает небольшая очередь (диск
+    сам упорядочивает запросы), для SSD число можно поднять. write_batch -
+    сколько папок или проб записывается в индекс одной транзакцией.
+    listing_cache - необязательный ListingCache для listing().
+
+    Чтение папки никогда не ждет проб: абсолютные времена многофайловых
+    CUE (нужны длительности файлов) откладываются в pending_cue_folders и
+    досчитываются в фоне resolve_cue_times().
+    """
+
+    def __init__(self, index, media_root: str, get_file_type, is_available=None,
+                 scan_workers: int = 4, probe_workers: int = 2, write_batch: int = 200,
+                 listing_cache=None):
+        self.index = index
+        self.media_root = media_root
+        self.get_file_type = get_file_type
+        self.is_available = is_available or (lambda: True)
+        self.scan_workers = scan_workers
+        self.probe_workers = probe_workers
+        self.write_batch = write_batch
+        self.listing_cache = listing_cache
+        self.progress = {'state': 'idle'}
+        self.pending_cue_folders = set()
+        self._started = time.monotonic()
+        self._last_log = self._started
+
+    def full_path(self, folder: str) -> str:
+        return os.path.join(self.media_root, folder) if folder else self.media_root
+
+    def relative_path(self, path: str) -> str:
+        folder = os.path.relpath(path, self.media_root)
+        return '' if folder == '.' else folder.replace(os.sep, '/')
+
+    # --- Одна папка ---
+
+    def read_folder(self, folder: str):
+        """Читает папку с диска: (mtime_ns, подпапки, файлы, CUE-альбомы)
+
+        None, если папки нет или она недоступна.
+        """
+        path = self.full_path(folder)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            subfolders = []
+            files = []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            subfolders.append(entry.name)
+                        elif entry.is_file():
+                            st = entry.stat()
+                            files.append({
+                                'name': entry.name,
+                                'type': self.get_file_type(entry.name),
+                                'size': st.st_size,
+                                'mtime_ns': st.st_mtime_ns
+                            })
+                    except OSError as e:
+                        logger.debug(f"Пропускаем {entry.path}: {e}")
+        except OSError as e:
+            logger.debug(f"Папка недоступна {path}: {e}")
+            return None
+
+        subfolders.sort()
+        files.sort(key=lambda f: f['name'])
+        cue_albums = self.read_cue_albums(path, files)
+        return mtime_ns, subfolders, files, cue_albums
+
+    def read_cue_albums(self, path: str, files, get_duration=None):
+        """Разбирает CUE-файлы папки
+
+        Без get_duration длительности файлов не узнаются: у треков после
+        первого FILE многофайлового CUE абсолютное время пустое, а папка
+        попадает в pending_cue_folders.
+        """
+        albums = []
+        for f in files:
+            if not f['name'].lower().endswith('.cue'):
+                continue
+            try:
+                parser = CueParser(os.path.join(path, f['name']), get_duration or _unknown_duration)
+                if not parser.resolve_times() and get_duration is None:
+                    self.pending_cue_folders.add(self.relative_path(path))
+                info = parser.get_info()
+            except Exception as e:
+                logger.warning(f"Ошибка разбора CUE файла {f['name']}: {e}")
+                continue
+            if info['tracks']:
+                info['cue_file'] = f['name']
+                albums.append(info)
+        return albums
+
+    def scan_folder(self, folder: str):
+        """Сканирует одну папку в индекс, возвращает ее содержимое (или None)"""
+        result = self.read_folder(folder)
+        if result is None:
+            return None
+        mtime_ns, subfolders, files, cue_albums = result
+        if self.listing_cache is not None:
+            self.listing_cache.invalidate(folder)
+        if self.is_available():
+            try:
+                self.index.replace_folder(folder, mtime_ns, subfolders, files, cue_albums)
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи индекса медиатеки для '{folder}': {e}")
+        return {'folders': subfolders, 'files': files, 'mtime_ns': mtime_ns}
+
+    def listing(self, folder: str):
+        """FolderListing папки: из кэша или индекса, если mtime папки не изменился
+
+        Стоимость при актуальном кэше - один stat папки; иначе папка
+        читается одним os.scandir. None, если папки нет.
+        """
+        path = self.full_path(folder)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        if self.listing_cache is not None:
+            cached = self.listing_cache.get(folder, mtime_ns)
+            if cached is not None:
+                return cached
+        contents = None
+        try:
+            if self.index.folder_mtime(folder) == mtime_ns:
+                contents = self.index.list_folder(folder)
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения индекса медиатеки: {e}")
+        if contents is None:
+            contents = self.scan_folder(folder)
+            if contents is None:
+                return None
+        listing = FolderListing.from_dict(path, contents)
+        if self.listing_cache is not None:
+            self.listing_cache.put(folder, listing)
+        return listing
+
+    # --- Параметры потоков ---
+
+    def stream_info(self, path: str):
+        """Параметры аудиопотока: из индекса или пробой (с записью в индекс)"""
+        st = os.stat(path)
+        relative = self.relative_path(path)
+        try:
+            info = self.index.get_stream_info(relative, st.st_size, st.st_mtime_ns)
+            if info is not None:
+                return info
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения индекса медиатеки: {e}")
+
+        info = run_blocking(probe_audio_file, path)
+        if info is not None:
+            try:
+                self.index.store_stream_info(relative, st.st_size, st.st_mtime_ns, info)
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи индекса медиатеки: {e}")
+        return info
+
+    def file_duration(self, path: str):
+        """Длительность аудиофайла в секундах: из индекса или пробой"""
+        info = self.stream_info(path)
+        return info.get('duration') if info else None
+
+    def resolve_cue_times(self) -> int:
+        """Досчитывает абсолютные времена отложенных многофайловых CUE
+
+        Длительности файлов берутся из индекса (параметры потоков общие
+        с воспроизведением), недостающие пробуются параллельно и тоже
+        попадают в индекс. Возвращает число обработанных папок.
+        """
+        resolved = 0
+        while self.pending_cue_folders and self.is_available():
+            folder = self.pending_cue_folders.pop()
+            try:
+                contents = self.index.list_folder(folder)
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка чтения индекса медиатеки: {e}")
+                continue
+            if contents is None:
+                continue  # Папка исчезла или еще не записана - ее перечитает сканирование
+            albums = self.read_cue_albums(self.full_path(folder), contents['files'], self.file_duration)
+            try:
+                self.index.update_cue_times(
+                    [(join_path(folder, album['cue_file']), album['tracks']) for album in albums])
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи индекса медиатеки: {e}")
+            resolved += 1
+        return resolved
+
+    def probe_pending(self, batch: int = None) -> int:
+        """Пробует пачку аудиофайлов без параметров потока, возвращает их число
+
+        Файлы пробуются параллельно (probe_workers), результаты пишутся
+        одной транзакцией.
+        """
+        pending = self.index.files_without_stream_info(batch or self.write_batch)
+        if not pending:
+            return 0
+
+        def probe(row):
+            relative, size, mtime_ns = row
+            # Неудачу тоже запоминаем (с временем) - повтор через PROBE_RETRY_INTERVAL, а не в этом же цикле
+            info = run_blocking(probe_audio_file, self.full_path(relative)) or {}
+            return relative, size, mtime_ns, info
+
+        with ThreadPoolExecutor(max_workers=self.probe_workers, thread_name_prefix='library-probe') as pool:
+            results = list(pool.map(probe, pending))
+        if self.is_available():
+            self.index.store_stream_infos(results)
+        return len(pending)
+
+    def probe_all(self) -> int:
+        """Пробует все аудиофайлы без параметров потока, возвращает их число"""
+        total = self.index.stats()['unprobed_files']
+        if self.progress['state'] == 'idle':
+            self._started = self._last_log = time.monotonic()
+        probed = 0
+        while total and self.is_available():
+            count = self.probe_pending()
+            if not count:
+                break
+            probed += count
+            self._report('probing', files_probed=probed, files_total=total)
+        return probed
+
+    # --- Сканирование поддерева ---
+
+    def scan_all(self, root: str = ''):
+        """Инкрементальное сканирование поддерева root, затем проба новых файлов
+
+        Каждая папка стоит один stat; перечитываются только папки, mtime
+        которых отличается от индекса (новые, измененные). Подпапки
+        неизмененной папки берутся из индекса. Папки читаются параллельно
+        (scan_workers), результаты пишутся пачками по write_batch папок.
+        Прерванное сканирование продолжается с того же места: записанные
+        папки совпадут по mtime, остальные останутся непросканированными.
+        Возвращает число перечитанных папок или None, если HDD недоступен.
+        """
+        if not self.is_available():
+            logger.info("📚 HDD недоступен - сканирование медиатеки отложено")
+            return None
+
+        known = self.index.folder_tree(root)
+        children = {}
+        for path, (parent, _) in known.items():
+            children.setdefault(parent, []).append(path)
+
+        self._started = time.monotonic()
+        self._last_log = self._started
+        visited = 0
+        changed = 0
+        batch = []
+        last_write = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.scan_workers, thread_name_prefix='library-scan') as pool:
+            def submit(folder):
+                entry = known.get(folder)
+                return pool.submit(run_blocking, self._visit, folder, entry[1] if entry else None)
+
+            running = {submit(root)}
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if result is None:
+                        continue  # Папка исчезла - ее уберет пересканирование родителя
+                    visited += 1
+                    folder, read = result
+                    if read is None:
+                        subfolders = children.get(folder, ())
+                    else:
+                        changed += 1
+                        batch.append((folder, *read))
+                        subfolders = [join_path(folder, name) for name in read[1]]
+                    running.update(submit(child) for child in subfolders)
+
+                if batch and (len(batch) >= self.write_batch or time.monotonic() - last_write >= 1.0):
+                    if not self._write_folders(batch):
+                        pool.shutdown(cancel_futures=True)
+                        return None
+                    batch = []
+                    last_write = time.monotonic()
+                self._report('scanning', folders_visited=visited, folders_changed=changed)
+
+            if batch and not self._write_folders(batch):
+                return None
+
+        probed = self.probe_all()
+        self.resolve_cue_times()
+        elapsed = time.monotonic() - self._started
+        self.progress = {'state': 'idle', 'folders_visited': visited, 'folders_changed': changed,
+                         'files_probed': probed, 'elapsed': round(elapsed, 1)}
+        if changed or probed:
+            logger.info(f"📚 Медиатека: проверено папок {visited}, перечитано {changed}, "
+                        f"проб файлов {probed} за {elapsed:.1f} с")
+        return changed
+
+    def _visit(self, folder: str, known_mtime_ns):
+        """Рабочий поток: (папка, None) если папка не изменилась, иначе (папка, read_folder)"""
+        try:
+            mtime_ns = os.stat(self.full_path(folder)).st_mtime_ns
+        except OSError:
+            return None
+        if known_mtime_ns == mtime_ns:
+            return folder, None
+        read = self.read_folder(folder)
+        return None if read is None else (folder, read)
+
+    def _write_folders(self, batch) -> bool:
+        if not self.is_available():
+            logger.warning("📚 HDD отключен во время сканирования - прерываем")
+            self.progress = {'state': 'idle'}
+            return False
+        try:
+            self.index.replace_folders(batch)
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи индекса медиатеки: {e}")
+        return True
+
+    def _report(self, state: str, **counters):
+        """Обновляет progress и периодически пишет ход сканирования в лог"""
+        now = time.monotonic()
+        elapsed = now - self._started
+        self.progress = {'state': state, 'elapsed': round(elapsed, 1), **counters}
+        if now - self._last_log < PROGRESS_LOG_INTERVAL:
+            return
+        self._last_log = now
+        if state == 'scanning':
+            rate = counters['folders_visited'] / elapsed if elapsed else 0
+            logger.info(f"📚 Сканирование: папок {counters['folders_visited']} "
+                        f"(перечитано {counters['folders_changed']}), {rate:.0f} папок/с")
+        else:
+            logger.info(f"📚 Проба файлов: {counters['files_probed']} из {counters['files_total']}")
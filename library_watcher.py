@@ -0,0 +1,308 @@
+"""
+Наблюдатель за медиатекой Aether Player
+Держит индекс актуальным без полных обходов: изменения папок приходят
+от inotify (через ctypes, без внешних зависимостей), а при его отсутствии
+или переполнении очереди - инкрементальным пересканированием по mtime
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+from library_index import PROBE_RETRY_INTERVAL, join_path, parent_of
+
+logger = logging.getLogger('aether_player')
+
+# Константы из <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    _inotify_init1 = _libc.inotify_init1
+    _inotify_add_watch = _libc.inotify_add_watch
+    _inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    _inotify_rm_watch = _libc.inotify_rm_watch
+    _inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    INOTIFY_AVAILABLE = True
+except (OSError, AttributeError):
+    INOTIFY_AVAILABLE = False
+
+
+class Inotify:
+    """Минимальная обертка над inotify: одна папка - один watch"""
+
+    def __init__(self):
+        fd = _inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.fd = fd
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        wd = _inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        _inotify_rm_watch(self.fd, wd)  # Ошибка не важна - watch мог уже исчезнуть
+
+    def read_events(self):
+        """Прочитанные события: [(wd, mask, имя)]"""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            if not data:
+                return events
+            offset = 0
+            while offset + _EVENT.size <= len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class LibraryWatcher:
+    """Фоновое поддержание индекса медиатеки
+
+    При старте и после каждого возвращения диска - инкрементальное
+    сканирование (stat каждой папки, перечитываются только измененные),
+    затем watch на каждую папку. События копятся в наборе "грязных" папок
+    и разбираются пачкой через debounce секунд после последнего события,
+    поэтому копирование альбома дает одно пересканирование папки, а не
+    сотню. Без inotify (или при нехватке max_user_watches) индекс
+    догоняется периодическим сканированием раз в rescan_interval.
+    """
+
+    def __init__(self, scanner, debounce: float = 1.0, poll_interval: float = 10.0,
+                 rescan_interval: float = 300.0):
+        self.scanner = scanner
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self._inotify = None
+        self._watches = {}  # wd -> папка
+        self._folders = {}  # папка -> wd
+        self._watch_limited = False
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._last_event = 0.0
+        self._active = False  # Индекс синхронизирован с подключенным диском
+        self._last_scan = 0.0
+        self._last_probe = 0.0
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='library-watcher', daemon=True)
+            self._thread.start()
+
+    def mark_dirty(self, folder: str):
+        """Просит пересканировать папку (например, после загрузки файла)"""
+        with self._dirty_lock:
+            self._dirty.add(folder)
+            self._last_event = time.monotonic()
+
+    # --- Основной цикл ---
+
+    def _run(self):
+        while True:
+            try:
+                self._step()
+            except Exception as e:
+                logger.error(f"Ошибка наблюдения за медиатекой: {e}")
+                self._deactivate()
+                time.sleep(self.poll_interval)
+
+    def _step(self):
+        if not self.scanner.is_available():
+            if self._active:
+                logger.info("📚 HDD отключен - наблюдение за медиатекой приостановлено")
+                self._deactivate()
+            time.sleep(self.poll_interval)
+            return
+
+        if not self._active:
+            self._activate()
+            return
+
+        timeout = self.debounce if self._dirty else self.poll_interval
+        if self._inotify is not None:
+            readable, _, _ = select.select([self._inotify.fd], [], [], timeout)
+            if readable:
+                self._handle_events(self._inotify.read_events())
+        else:
+            time.sleep(timeout)
+
+        if not self._active:
+            return  # Событие IN_UNMOUNT / переполнение - начинаем заново
+        with self._dirty_lock:
+            ready = self._dirty and time.monotonic() - self._last_event >= self.debounce
+        if ready:
+            self._flush_dirty()
+        if self.scanner.pending_cue_folders:
+            # Многофайловые CUE, прочитанные при просмотре папок, - без ожидания пользователя
+            self.scanner.resolve_cue_times()
+        if time.monotonic() - self._last_probe >= PROBE_RETRY_INTERVAL:
+            # Повтор неудачных проб, даже если в медиатеке ничего не менялось
+            self._last_probe = time.monotonic()
+            self.scanner.probe_all()
+
+        if (self._inotify is None or self._watch_limited) and \
+                time.monotonic() - self._last_scan >= self.rescan_interval:
+            self._full_scan()
+
+    def _activate(self):
+        """Диск появился: догоняем индекс и ставим watch на все папки"""
+        if self._full_scan() is None:
+            return
+        if INOTIFY_AVAILABLE and self._inotify is None:
+            try:
+                self._inotify = Inotify()
+            except OSError as e:
+                logger.warning(f"📚 inotify недоступен ({e}) - медиатека обновляется периодически")
+        if self._inotify is not None:
+            self._watch_tree('')
+            logger.info(f"📚 Наблюдение за медиатекой: {len(self._folders)} папок")
+        self._active = True
+
+    def _deactivate(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        self._watches.clear()
+        self._folders.clear()
+        self._watch_limited = False
+        self._active = False
+
+    def _full_scan(self):
+        self._last_scan = time.monotonic()
+        return self.scanner.scan_all()
+
+    # --- Watch ---
+
+    def _watch_tree(self, root: str):
+        """Ставит watch на папку root и все ее подпапки из индекса"""
+        for folder in sorted(self.scanner.index.folder_tree(root)):
+            if folder in self._folders:
+                continue
+            if self._watch_limited:
+                return
+            try:
+                wd = self._inotify.add_watch(self.scanner.full_path(folder))
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    # fs.inotify.max_user_watches исчерпан - остаток догоняем по mtime
+                    logger.warning("📚 Исчерпан лимит inotify watch - часть медиатеки "
+                                   "обновляется периодическим сканированием")
+                    self._watch_limited = True
+                    return
+                continue  # Папка исчезла между сканированием и add_watch
+            self._watches[wd] = folder
+            self._folders[folder] = wd
+
+    def _unwatch_tree(self, root: str):
+        """Снимает watch с папки root и ее подпапок"""
+        prefix = root + '/'
+        for folder in [f for f in self._folders if f == root or f.startswith(prefix)]:
+            wd = self._folders.pop(folder)
+            self._watches.pop(wd, None)
+            self._inotify.rm_watch(wd)
+
+    # --- События ---
+
+    def _handle_events(self, events):
+        dirty = set()
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("📚 Переполнение очереди inotify - полная сверка медиатеки")
+                self._resync()
+                return
+            if mask & IN_UNMOUNT:
+                logger.info("📚 Файловая система медиатеки отмонтирована")
+                self._deactivate()
+                return
+            folder = self._watches.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:
+                # Watch снят ядром (папка удалена) - родитель получит свое событие
+                self._watches.pop(wd, None)
+                if self._folders.get(folder) == wd:
+                    del self._folders[folder]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if folder:
+                    dirty.add(parent_of(folder))
+                continue
+            if mask & IN_MOVED_FROM and mask & IN_ISDIR:
+                # Папка уехала - старые пути watch больше не верны
+                self._unwatch_tree(join_path(folder, name))
+            dirty.add(folder)
+        if dirty:
+            with self._dirty_lock:
+                self._dirty |= dirty
+                self._last_event = time.monotonic()
+
+    def _flush_dirty(self):
+        """Пересканирует накопившиеся папки, новые подпапки - целиком"""
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        for folder in sorted(dirty):
+            result = self.scanner.scan_folder(folder)
+            if result is None:
+                continue
+            if self._inotify is None or self._watch_limited:
+                continue  # Новые подпапки досканирует периодическая сверка
+            if folder not in self._folders:
+                self._watch_tree(folder)
+            for name in result['folders']:
+                child = join_path(folder, name)
+                if child not in self._folders:
+                    # Новая или переименованная папка: сканируем поддерево
+                    self.scanner.scan_all(child)
+                    self._watch_tree(child)
+        self.scanner.probe_all()
+
+    def _resync(self):
+        """После потери событий: сверка по mtime и watch на новые папки"""
+        with self._dirty_lock:
+            self._dirty.clear()
+        if self._full_scan() is None:
+            self._deactivate()
+            return
+        if self._inotify is not None:
+            self._watch_tree('')
@@ -0,0 +1,114 @@
+"""
+Кэш метаданных аудиофайлов для Aether Player
+Результат пробы файла (кодек, частота, каналы, битрейт, длительность)
+хранится по ключу (путь, размер, mtime) с вытеснением LRU
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger('aether_player')
+
+
+class MetadataCache:
+    """LRU кэш результатов пробы аудиофайлов
+
+    Ключ включает размер и mtime файла, поэтому перезаписанный файл
+    пробуется заново. loader(path) -> dict вызывается вне блокировки;
+    одновременные запросы одного файла пробуют его один раз.
+    """
+
+    def __init__(self, loader, maxsize: int = 256, on_loaded=None):
+        self._loader = loader
+        self.maxsize = maxsize
+        self._on_loaded = on_loaded  # Вызывается после фоновой загрузки: on_loaded(path)
+        self._entries = OrderedDict()
+        self._inflight = {}  # ключ -> threading.Event
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (path, st.st_size, st.st_mtime_ns)
+
+    def peek(self, path: str):
+        """Метаданные из кэша или None, без пробы файла"""
+        key = self._key(path)
+        if key is None:
+            return None
+        with self._lock:
+            info = self._entries.get(key)
+            if info is not None:
+                self._entries.move_to_end(key)
+            return info
+
+    def get(self, path: str):
+        """Метаданные файла; при промахе пробует файл в текущем потоке"""
+        key = self._key(path)
+        if key is None:
+            return None
+        return self._load(key)
+
+    def prefetch(self, path: str):
+        """Пробует файл в фоне, если его еще нет в кэше"""
+        key = self._key(path)
+        if key is None:
+            return
+        with self._lock:
+            if key in self._entries or key in self._inflight:
+                return
+        threading.Thread(target=self._load, args=(key, True),
+                         name='metadata-prefetch', daemon=True).start()
+
+    def invalidate(self, path: str = None):
+        """Удаляет записи файла (или все записи)"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] == path]:
+                del self._entries[key]
+
+    def _load(self, key, notify: bool = False):
+        while True:
+            with self._lock:
+                info = self._entries.get(key)
+                if info is not None:
+                    self._entries.move_to_end(key)
+                    return info
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = self._inflight[key] = threading.Event()
+                    break
+            # Файл уже пробует другой поток - ждем его результат
+            pending.wait()
+            with self._lock:
+                if key in self._entries or key in self._inflight:
+                    continue
+            return None
+
+        path = key[0]
+        info = None
+        try:
+            info = self._loader(path)
+        except Exception as e:
+            logger.warning(f"Ошибка чтения метаданных {path}: {e}")
+        finally:
+            with self._lock:
+                if info is not None:
+                    # Старые версии этого же файла больше не нужны
+                    for stale in [k for k in self._entries if k[0] == path]:
+                        del self._entries[stale]
+                    self._entries[key] = info
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+                self._inflight.pop(key).set()
+
+        if notify and info is not None and self._on_loaded:
+            self._on_loaded(path)
+        return info
@@ -0,0 +1,393 @@
+"""
+MPV IPC клиент для Aether Player
+Держит одно постоянное соединение с JSON IPC сокетом MPV и мультиплексирует
+запросы нескольких вызывающих по request_id
+"""
+
+import itertools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger('aether_player')
+
+
+class _PendingReply:
+    """Ожидание ответа MPV на один запрос"""
+
+    __slots__ = ('event', 'response', 'connection_lost')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.connection_lost = False
+
+
+class MpvEventWaiter:
+    """Ожидание готовности MPV после loadfile по событиям с одним дедлайном
+
+    Готово, когда все properties получили первое валидное значение после
+    start-file, либо пришло одно из until_events, либо файл не загрузился
+    (end-file с reason=error).
+    """
+
+    def __init__(self, client, until_events=('playback-restart',), properties=()):
+        self._client = client
+        self.until_events = set(until_events)
+        self.properties = tuple(properties)
+        self.values = {}
+        self.events = []
+        self.failed = False
+        self._started = False
+        self._done = threading.Event()
+
+    def feed(self, event: dict):
+        name = event.get('event')
+        self.events.append(name)
+
+        if name == 'start-file':
+            self._started = True
+        elif name == 'end-file' and self._started and event.get('reason') == 'error':
+            self.failed = True
+            self._done.set()
+        elif name == 'property-change':
+            # Значения до start-file могут относиться к предыдущему файлу
+            prop = event.get('name')
+            value = event.get('data')
+            if self._started and prop in self.properties and prop not in self.values and value:
+                self.values[prop] = value
+
+        if name in self.until_events:
+            self._done.set()
+        elif self.properties and all(prop in self.values for prop in self.properties):
+            self._done.set()
+
+    def wait(self, timeout: float) -> bool:
+        """Ждет готовности не дольше timeout, True если файл загружен"""
+        try:
+            ready = self._done.wait(timeout)
+        finally:
+            self.cancel()
+        return ready and not self.failed
+
+    def cancel(self):
+        self._client._remove_waiter(self)
+
+
+class MpvIpcClient:
+    """Постоянное соединение с MPV через Unix сокет
+
+    Все запросы помечаются уникальным request_id, ответы раскладываются
+    фоновым читателем по ожидающим вызывающим. Под gevent (monkey.patch_all)
+    socket и threading кооперативные, поэтому ожидание ответа не блокирует
+    остальные запросы.
+
+    События MPV (property-change, end-file, file-loaded...) передаются
+    подписчикам из add_event_handler(). Подписчики вызываются в потоке
+    читателя, поэтому не должны отправлять команды и ждать ответ.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 2.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock = None
+        self._generation = 0  # Номер текущего соединения, растет при каждом переподключении
+        self._connect_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        self._event_handlers = []
+        self._observed = {}  # имя свойства -> id наблюдения
+        self._waiters = []
+
+    def is_connected(self) -> bool:
+        return self._sock is not None
+
+    def connect(self) -> bool:
+        """Подключается к сокету MPV, если соединения еще нет"""
+        if self._sock is not None:
+            return True
+
+        with self._connect_lock:
+            if self._sock is not None:
+                return True
+
+            if not os.path.exists(self.socket_path):
+                return False
+
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                sock.settimeout(None)
+            except OSError as e:
+                sock.close()
+                logger.debug(f"Не удалось подключиться к MPV сокету: {e}")
+                return False
+
+            self._generation += 1
+            self._sock = sock
+            reader = threading.Thread(target=self._read_loop, args=(sock, self._generation),
+                                      name='mpv-ipc-reader', daemon=True)
+            reader.start()
+            logger.info(f"🔌 IPC соединение с MPV установлено ({self.socket_path})")
+
+        # Наблюдения живут в рамках соединения - восстанавливаем их
+        for name, observe_id in list(self._observed.items()):
+            self._send({"command": ["observe_property", observe_id, name]})
+        self._notify({"event": "ipc-connected"})
+        return True
+
+    def reset(self):
+        """Закрывает текущее соединение (например, после перезапуска MPV)
+
+        Следующая команда переподключится к новому сокету.
+        """
+        with self._connect_lock:
+            self._drop_connection(self._sock, "соединение сброшено")
+
+    close = reset
+
+    def command(self, command, timeout: float = None) -> dict:
+        """Отправляет команду и ждет ответ с тем же request_id
+
+        command - словарь вида {"command": [...]} или список аргументов.
+        Возвращает ответ MPV либо {"status": "error", "message": ...}
+        при локальной ошибке (нет соединения, таймаут).
+        """
+        return self.command_batch([command], timeout)[0]
+
+    def command_batch(self, commands, timeout: float = None) -> list:
+        """Отправляет N команд одной записью в сокет и собирает N ответов
+
+        MPV выполняет команды строго по порядку, поэтому зависимые шаги
+        (set_property vo, затем loadfile) можно отправлять одним пакетом.
+        Ответы возвращаются в порядке команд; общий дедлайн на весь пакет.
+        """
+        commands = [{"command": list(c)} if isinstance(c, (list, tuple)) else c for c in commands]
+        if not commands:
+            return []
+
+        # Одна повторная попытка: соединение могло умереть вместе со старым MPV
+        for attempt in range(2):
+            responses, connection_lost = self._batch_once(commands, timeout)
+            if not connection_lost:
+                break
+        return responses
+
+    def _batch_once(self, commands: list, timeout: float):
+        if not self.connect():
+            return [{"status": "error", "message": "MPV сокет недоступен"} for _ in commands], False
+
+        messages = []
+        pending_replies = []
+        with self._pending_lock:
+            for command in commands:
+                request_id = next(self._request_ids)
+                message = dict(command)
+                message['request_id'] = request_id
+                messages.append(message)
+                pending = _PendingReply()
+                pending_replies.append(pending)
+                self._pending[request_id] = pending
+
+        try:
+            if not self._send(*messages):
+                return [{"status": "error", "message": "Ошибка отправки команды MPV"} for _ in commands], True
+
+            deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+            responses = []
+            connection_lost = False
+            for command, pending in zip(commands, pending_replies):
+                if pending.event.wait(max(0.0, deadline - time.monotonic())):
+                    responses.append(pending.response)
+                    connection_lost = connection_lost or pending.connection_lost
+                else:
+                    logger.warning(f"Таймаут ответа MPV на {command.get('command')}")
+                    responses.append({"status": "error", "message": "Таймаут ответа MPV"})
+            return responses, connection_lost
+        finally:
+            with self._pending_lock:
+                for message in messages:
+                    self._pending.pop(message['request_id'], None)
+
+    def add_event_handler(self, handler):
+        """Подписывает handler(event: dict) на события MPV"""
+        self._event_handlers.append(handler)
+
+    def observe_property(self, name: str):
+        """Включает property-change события для свойства MPV
+
+        Наблюдение сохраняется и повторяется после каждого переподключения.
+        """
+        if name in self._observed:
+            return
+        self._observed[name] = len(self._observed) + 1
+        if self._sock is not None:
+            self._send({"command": ["observe_property", self._observed[name], name]})
+
+    def expect(self, until_events=('playback-restart',), properties=()) -> MpvEventWaiter:
+        """Регистрирует ожидание событий ДО отправки команды (например, loadfile)
+
+        Наблюдаемые properties должны быть включены через observe_property().
+        """
+        waiter = MpvEventWaiter(self, until_events, properties)
+        with self._pending_lock:
+            self._waiters.append(waiter)
+        return waiter
+
+    def _remove_waiter(self, waiter):
+        with self._pending_lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def get_property(self, prop: str):
+        """Читает свойство MPV, None если недоступно"""
+        response = self.command({"command": ["get_property", prop]})
+        if response.get("status") == "error" or response.get("error") not in (None, "success"):
+            return None
+        return response.get("data")
+
+    def _send(self, *messages) -> bool:
+        sock = self._sock
+        if sock is None:
+            return False
+
+        data = ''.join(json.dumps(message) + '\n' for message in messages).encode('utf-8')
+        try:
+            with self._send_lock:
+                sock.sendall(data)
+            return True
+        except OSError as e:
+            logger.warning(f"Ошибка записи в MPV сокет: {e}")
+            with self._connect_lock:
+                self._drop_connection(sock, str(e))
+            return False
+
+    def _read_loop(self, sock, generation):
+        """Читает ответы и события MPV построчно"""
+        buffer = b''
+        reason = "MPV закрыл соединение"
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                buffer += chunk
+                while b'\n' in buffer:
+                    line, buffer = buffer.split(b'\n', 1)
+                    if line.strip():
+                        self._dispatch(line)
+        except OSError as e:
+            reason = str(e)
+        except Exception as e:
+            reason = str(e)
+            logger.error(f"Ошибка чтения MPV сокета: {e}")
+
+        with self._connect_lock:
+            if generation == self._generation:
+                self._drop_connection(sock, reason)
+
+    def _dispatch(self, line: bytes):
+        try:
+            message = json.loads(line)
+        except (ValueError, UnicodeDecodeError) as e:
+            logger.error(f"Ошибка JSON в ответе MPV: {e}")
+            return
+
+        if 'event' in message:
+            self._notify(message)
+            return
+
+        request_id = message.get('request_id')
+        if request_id is not None:
+            with self._pending_lock:
+                pending = self._pending.get(request_id)
+            if pending:
+                pending.response = message
+                pending.event.set()
+
+    def _notify(self, event: dict):
+        with self._pending_lock:
+            waiters = list(self._waiters)
+        for waiter in waiters:
+            waiter.feed(event)
+
+        for handler in self._event_handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика события MPV {event.get('event')}: {e}")
+
+    def _drop_connection(self, sock, reason):
+        """Закрывает сокет и будит всех ожидающих ошибкой (под _connect_lock)"""
+        if sock is None or sock is not self._sock:
+            return
+
+        self._sock = None
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+        logger.info(f"🔌 IPC соединение с MPV закрыто: {reason}")
+
+        with self._pending_lock:
+            pending_replies = list(self._pending.values())
+        for pending in pending_replies:
+            if not pending.event.is_set():
+                pending.response = {"status": "error", "message": f"Соединение с MPV потеряно: {reason}"}
+                pending.connection_lost = True
+                pending.event.set()
+
+
+class CoalescingCommandQueue:
+    """Очередь команд MPV, где новая цель заменяет еще не отправленную старую
+
+    submit() не ждет MPV: команда кладется в слот по ключу ('volume', 'seek'),
+    и фоновый поток отправляет последние значения всех слотов одним пакетом
+    не чаще одного раза за interval секунд.
+    """
+
+    def __init__(self, send_batch, interval: float = 0.05):
+        self._send_batch = send_batch
+        self.interval = interval
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def submit(self, key: str, command: dict):
+        """Ставит команду в слот key, вытесняя неотправленную команду того же слота"""
+        with self._lock:
+            replaced = key in self._slots
+            self._slots[key] = command
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='mpv-coalescer', daemon=True)
+                self._worker.start()
+        if replaced:
+            logger.debug(f"Команда '{key}' заменена более новой до отправки в MPV")
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+
+            with self._lock:
+                commands = list(self._slots.values())
+                self._slots.clear()
+            if not commands:
+                continue
+
+            try:
+                self._send_batch(commands)
+            except Exception as e:
+                logger.error(f"Ошибка отправки объединенных команд MPV: {e}")
+
+            # Квант времени: все, что придет за это время, уйдет одним пакетом
+            time.sleep(self.interval)
@@ -0,0 +1,100 @@
+"""
+Хранилище настроек Aether Player
+Держит настройки в памяти и сбрасывает их на диск с задержкой (write-behind)
+атомарно: временный файл + rename
+"""
+
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger('aether_player')
+
+
+class SettingsStore:
+    """Настройки в памяти с отложенной атомарной записью в JSON файл
+
+    Изменения копятся в памяти, файл пишется не чаще одного раза за
+    debounce секунд и при завершении работы (flush()).
+    """
+
+    def __init__(self, path: str, defaults: dict = None, debounce: float = 2.0):
+        self.path = path
+        self.debounce = debounce
+        self._values = dict(defaults or {})
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # Порядок записей на диск
+        self._dirty = False
+        self._timer = None
+
+    def load(self) -> dict:
+        """Читает файл настроек одним чтением, возвращает копию всех значений"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            if isinstance(stored, dict):
+                with self._lock:
+                    self._values.update(stored)
+                logger.info(f"📂 Настройки загружены из {self.path}")
+        except FileNotFoundError:
+            logger.info(f"📂 Файл настроек {self.path} не найден, используем значения по умолчанию")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось загрузить настройки: {e}")
+        return self.all()
+
+    def has(self, key: str) -> bool:
+        with self._lock:
+            return key in self._values
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            return self._values.get(key, default)
+
+    def all(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def set(self, key: str, value):
+        self.update({key: value})
+
+    def update(self, values: dict):
+        """Меняет значения в памяти и планирует отложенную запись"""
+        with self._lock:
+            changed = False
+            for key, value in values.items():
+                if self._values.get(key) != value or key not in self._values:
+                    self._values[key] = value
+                    changed = True
+            if not changed:
+                return
+            self._dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(self.debounce, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Немедленно записывает изменения на диск (атомарно)"""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                data = json.dumps(self._values, ensure_ascii=False, indent=2)
+                self._dirty = False
+
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                logger.debug(f"💾 Настройки сохранены в {self.path}")
+            except OSError as e:
+                logger.warning(f"Не удалось сохранить настройки: {e}")
+                with self._lock:
+                    self._dirty = True
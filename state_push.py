@@ -0,0 +1,173 @@
+"""
+Push-канал состояния для Aether Player
+Рассылает клиентам Socket.IO версионированный снимок состояния при подписке
+и затем только изменения (дельты), когда состояние действительно меняется.
+Те же версии используются HTTP long-poll клиентами (since / ETag)
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger('aether_player')
+
+
+def diff_state(old, new):
+    """Вычисляет изменения между двумя снимками
+
+    Вложенные словари сравниваются рекурсивно, списки и прочие значения
+    заменяются целиком. Удаленный ключ передается как None.
+    """
+    changes = {}
+    for key, value in new.items():
+        if key not in old:
+            changes[key] = value
+            continue
+        old_value = old[key]
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            nested = diff_state(old_value, value)
+            if nested:
+                changes[key] = nested
+        elif value != old_value:
+            changes[key] = value
+    for key in old:
+        if key not in new:
+            changes[key] = None
+    return changes
+
+
+class StateChannel:
+    """Один канал состояния: функция построения снимка, версия и подписчики"""
+
+    def __init__(self, name, builder):
+        self.name = name
+        self.builder = builder
+        self.version = 0
+        self.snapshot = {}
+        self.subscribers = set()
+        self.waiters = 0  # HTTP запросы, ждущие новую версию
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def refresh(self):
+        """Строит новый снимок; возвращает дельту (или None) и версию (под lock)"""
+        new_snapshot = self.builder()
+        changes = diff_state(self.snapshot, new_snapshot)
+        self.snapshot = new_snapshot
+        if not changes:
+            return None, self.version
+        self.version += 1
+        self.changed.notify_all()
+        return changes, self.version
+
+
+class StatePublisher:
+    """Рассылка снимков и дельт состояния по комнатам Socket.IO
+
+    notify() дешевый и может вызываться при каждом изменении состояния -
+    фоновый поток собирает их и публикует не чаще одного раза за interval.
+    Каналы без подписчиков и long-poll ожиданий не строятся вовсе.
+    socketio может быть None - тогда работает только long-poll.
+    """
+
+    def __init__(self, socketio, interval: float = 0.25, idle_timeout: float = 5.0):
+        self.socketio = socketio
+        self.interval = interval
+        self.idle_timeout = idle_timeout  # Страховочная проверка без notify()
+        self.channels = {}
+        self._changed = threading.Event()
+        self._thread = None
+
+    def add_channel(self, name, builder):
+        self.channels[name] = StateChannel(name, builder)
+
+    def notify(self):
+        """Сообщает, что состояние могло измениться"""
+        self._changed.set()
+
+    def subscribe(self, sid, channel_name):
+        """Подписывает клиента, возвращает полный снимок для него
+
+        Перед выдачей снимка рассылаем накопившуюся дельту остальным
+        подписчикам, чтобы следующие дельты строились от этого же снимка.
+        """
+        channel = self.channels.get(channel_name)
+        if channel is None:
+            return None
+
+        with channel.lock:
+            changes, version = channel.refresh()
+            if changes is not None:
+                self._emit_delta(channel, changes, version)
+            channel.subscribers.add(sid)
+            return {'channel': channel.name, 'version': version, 'state': channel.snapshot}
+
+    def wait_for_change(self, channel_name, since, timeout: float):
+        """Long-poll: ждет версию канала, отличную от since, не дольше timeout
+
+        Возвращает (version, snapshot); snapshot None, если за timeout
+        состояние не изменилось. Версия неизвестная каналу (например, после
+        перезапуска сервера) сразу возвращает текущий снимок.
+        """
+        channel = self.channels.get(channel_name)
+        if channel is None:
+            return None, None
+
+        deadline = time.monotonic() + timeout
+        with channel.lock:
+            changes, version = channel.refresh()
+            if changes is not None:
+                self._emit_delta(channel, changes, version)
+
+            channel.waiters += 1
+            try:
+                while channel.version == since:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return channel.version, None
+                    channel.changed.wait(remaining)
+                return channel.version, channel.snapshot
+            finally:
+                channel.waiters -= 1
+
+    def current(self, channel_name):
+        """Текущие (version, snapshot) канала без ожидания"""
+        return self.wait_for_change(channel_name, None, 0)
+
+    def unsubscribe(self, sid):
+        for channel in self.channels.values():
+            with channel.lock:
+                channel.subscribers.discard(sid)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='state-publisher', daemon=True)
+            self._thread.start()
+
+    def publish(self):
+        """Рассылает дельты всех каналов, у которых есть подписчики или ожидания"""
+        for channel in self.channels.values():
+            with channel.lock:
+                if not channel.subscribers and not channel.waiters:
+                    continue
+                changes, version = channel.refresh()
+                if changes is not None:
+                    self._emit_delta(channel, changes, version)
+
+    def _emit_delta(self, channel, changes, version):
+        if channel.subscribers and self.socketio is not None:
+            self.socketio.emit('state_delta',
+                               {'channel': channel.name, 'version': version, 'changes': changes},
+                               to=channel.name)
+
+    def _run(self):
+        logger.info("📡 Запущена push-рассылка состояния")
+        while True:
+            self._changed.wait(self.idle_timeout)
+            self._changed.clear()
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Ошибка рассылки состояния: {e}")
+            # Не чаще одного раза за interval, изменения за это время объединятся
+            time.sleep(self.interval)
@@ -0,0 +1,83 @@
+"""
+Хранилище состояния плеера для Aether Player
+Изменения применяются под блокировкой, читатели получают неизменяемые
+снимки (copy-on-write) и никогда не ждут писателей
+"""
+
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+
+_MISSING = object()
+
+
+class StateStore:
+    """Версионированное состояние: запись под lock, чтение без блокировок
+
+    Каждая запись строит новый словарь и атомарно подменяет ссылку на
+    снимок, поэтому снимок, полученный читателем, уже не меняется.
+    Каждая публикация увеличивает version и вызывает on_change(version).
+
+    Поддерживает чтение как словарь (state['key'], state.get('key')), чтобы
+    простые обращения выглядели как раньше. Связанные чтения делаются через
+    snapshot(), а чтение-изменение-запись - через transaction().
+    """
+
+    def __init__(self, initial: dict, on_change=None):
+        self._snapshot = dict(initial)
+        self._version = 0
+        self._lock = threading.RLock()
+        self._on_change = on_change
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def snapshot(self):
+        """Неизменяемый снимок всего состояния (без блокировки)"""
+        return MappingProxyType(self._snapshot)
+
+    def __getitem__(self, key):
+        return self._snapshot[key]
+
+    def __contains__(self, key):
+        return key in self._snapshot
+
+    def get(self, key, default=None):
+        return self._snapshot.get(key, default)
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def update(self, values: dict = None, **kwargs):
+        """Атомарно меняет несколько ключей одной публикацией"""
+        changes = dict(values or {}, **kwargs)
+        with self._lock:
+            version = self._publish(changes)
+        if version is not None and self._on_change:
+            self._on_change(version)
+
+    @contextmanager
+    def transaction(self):
+        """Чтение-изменение-запись под lock
+
+        Внутри блока доступен изменяемый черновик; изменения публикуются
+        одной новой версией при выходе без исключения.
+        """
+        with self._lock:
+            draft = dict(self._snapshot)
+            yield draft
+            version = self._publish(draft)
+        if version is not None and self._on_change:
+            self._on_change(version)
+
+    def _publish(self, changes: dict):
+        """Публикует новый снимок, если что-то изменилось (под lock)"""
+        current = self._snapshot
+        if all(current.get(key, _MISSING) == value for key, value in changes.items()):
+            return None
+        new_snapshot = dict(current)
+        new_snapshot.update(changes)
+        self._snapshot = new_snapshot
+        self._version += 1
+        return self._version
@@ -344,21 +344,65 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
-    // ПРОСТОЙ HTTP polling - 1 раз в секунду
-    let statusPollingInterval;
+    // HTTP long-poll - только запасной вариант, когда Socket.IO недоступен:
+    // сервер держит запрос, пока статус не изменится (или 304 через ~25 с)
+    let statusPollingActive = false;
+    let statusPollingGeneration = 0;
+    // Во время воспроизведения версия растет на каждом time-pos (~4 раза в секунду) -
+    // не чаще одного ответа со статусом в секунду, как при прежнем опросе
+    const STATUS_POLL_MIN_INTERVAL = 1000;
     
     function startStatusPolling() {
-        console.log("[SYSTEM] Запуск простого polling (500ms)");
-        
-        if (statusPollingInterval) {
-            clearInterval(statusPollingInterval);
+        if (statusPollingActive) {
+            return;
         }
-        
-        // Немедленно запрашиваем статус
-        fetchStatus();
-        
-        // Устанавливаем интервал 500 миллисекунд для более плавного обновления
-        statusPollingInterval = setInterval(fetchStatus, 500);
+        console.log("[SYSTEM] Socket.IO недоступен - запуск long-poll статуса");
+        statusPollingActive = true;
+        longPollStatus(++statusPollingGeneration, null);
+    }
+
+    function stopStatusPolling() {
+        if (statusPollingActive) {
+            console.log("[SYSTEM] Push-канал активен - long-poll остановлен");
+            statusPollingActive = false;
+            statusPollingGeneration++;
+        }
+    }
+
+    function longPollStatus(generation, version) {
+        const url = version === null ? '/get_status' : `/get_status?since=${version}`;
+        const startedAt = Date.now();
+        fetch(url, { cache: 'no-store' })
+            .then(response => {
+                if (generation !== statusPollingGeneration) return;
+                const nextVersion = response.headers.get('X-State-Version');
+                if (response.status === 304) {
+                    longPollStatus(generation, nextVersion ?? version);
+                    return;
+                }
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                return response.json().then(data => {
+                    if (generation !== statusPollingGeneration) return;
+                    updateUI(data);
+                    const delay = Math.max(0, STATUS_POLL_MIN_INTERVAL - (Date.now() - startedAt));
+                    setTimeout(() => {
+                        if (generation === statusPollingGeneration) {
+                            longPollStatus(generation, nextVersion);
+                        }
+                    }, delay);
+                });
+            })
+            .catch(error => {
+                console.error("[ERROR] Ошибка long-poll статуса:", error);
+                // Пауза перед повтором, чтобы не забивать сервер при ошибках
+                setTimeout(() => {
+                    if (generation === statusPollingGeneration) {
+                        longPollStatus(generation, null);
+                    }
+                }, 2000);
+            });
     }
     
     function fetchStatus() {
@@ -382,82 +426,402 @@ document.addEventListener('DOMContentLoaded', () => {
                 console.error("[ERROR] Ошибка получения статуса:", error);
             });
     }
+
+    // Push-канал состояния: полный снимок при подписке, затем только дельты
+    let pushedStatus = null;
+    let pushedStatusVersion = -1;
+
+    function mergeState(target, changes) {
+        Object.keys(changes).forEach(key => {
+            const value = changes[key];
+            if (value && typeof value === 'object' && !Array.isArray(value) &&
+                target[key] && typeof target[key] === 'object' && !Array.isArray(target[key])) {
+                mergeState(target[key], value);
+            } else {
+                target[key] = value;
+            }
+        });
+        return target;
+    }
+
+    function subscribeStatusChannel() {
+        stopStatusPolling();
+        socket.emit('subscribe_state', { channel: 'status' });
+    }
+
+    function startStatusChannel() {
+        if (typeof socket === 'undefined' || !socket) {
+            startStatusPolling();
+            return;
+        }
+
+        socket.on('connect', subscribeStatusChannel);
+        socket.on('disconnect', () => {
+            pushedStatus = null;
+            startStatusPolling();
+        });
+        socket.on('connect_error', startStatusPolling);
+
+        socket.on('state_snapshot', msg => {
+            if (!msg || msg.channel !== 'status') return;
+            pushedStatus = msg.state;
+            pushedStatusVersion = msg.version;
+            updateUI(pushedStatus);
+        });
+
+        socket.on('state_delta', msg => {
+            if (!msg || msg.channel !== 'status' || !pushedStatus) return;
+            if (msg.version <= pushedStatusVersion) return;
+            if (msg.version !== pushedStatusVersion + 1) {
+                // Пропустили дельту - запрашиваем полный снимок заново
+                console.warn(`[PUSH] Пропуск версий ${pushedStatusVersion} -> ${msg.version}, пересинхронизация`);
+                socket.emit('subscribe_state', { channel: 'status' });
+                return;
+            }
+            pushedStatusVersion = msg.version;
+            updateUI(mergeState(pushedStatus, msg.changes));
+        });
+
+        if (socket.connected) {
+            subscribeStatusChannel();
+        } else {
+            // Пока сокет не подключился, статус получаем опросом
+            startStatusPolling();
+        }
+    }
     
-    // Начальная загрузка
-    console.log("[NETWORK] Запрашиваем начальный статус");
+    startStatusChannel();
+
+    // --- Обработчики событий ---
     
-    fetch('/get_status')
+    // Кнопки воспроизведения файлов
+    function playFromButton(button) {
+        const filepath = button.dataset.filepath;
+        const startTime = button.dataset.startTime; // Время начала в секундах для CUE-треков
+        
+        // Устанавливаем индикацию от клика с передачей времени начала для CUE треков
+        setActiveTrackIndicator(filepath, true, startTime ? parseFloat(startTime) : null);
+        
+        // Готовим данные для отправки
+        let requestBody = `filepath=${encodeURIComponent(filepath)}`;
+        if (startTime) {
+            requestBody += `&start_time=${startTime}`;
+        }
+        
+        fetch('/play', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/x-www-form-urlencoded'},
+            body: requestBody
+        });
+    }
+
+    // Кнопки просмотра изображений
+    function viewImageFromButton(button) {
+        const filepath = button.dataset.filepath;
+        console.log("[ACTION] Просмотр изображения:", filepath);
+
+        // Отправляем запрос на backend для отображения на HDMI через MPV
+        const formData = new FormData();
+        formData.append('filepath', filepath);
+
+        fetch('/view_image', {
+            method: 'POST',
+            body: formData
+        })
         .then(response => response.json())
         .then(data => {
-            console.log("[NETWORK] Начальный статус:", data);
-            updateUI(data);
-            startStatusPolling();
+            console.log("[ACTION] Изображение отправлено на HDMI:", data);
         })
         .catch(error => {
-            console.error("[ERROR] Ошибка начального статуса:", error);
-            setTimeout(startStatusPolling, 3000);
+            console.error("[ERROR] Ошибка отображения изображения:", error);
         });
 
-    // --- Обработчики событий ---
-    
-    // Кнопки воспроизведения файлов
+        // Также открываем в браузере для предварительного просмотра
+        window.open(`/media/${encodeURIComponent(filepath)}`, '_blank');
+    }
+
+    // Кнопки чтения текстовых файлов
+    function readTextFromButton(button) {
+        const filepath = button.dataset.filepath;
+        console.log("[ACTION] Просмотр текстового файла:", filepath);
+        window.open(`/view_text/${encodeURIComponent(filepath)}`, '_blank');
+    }
+
     document.querySelectorAll('.play-button').forEach(button => {
-        button.addEventListener('click', function() {
-            const filepath = this.dataset.filepath;
-            const startTime = this.dataset.startTime; // Время начала в секундах для CUE-треков
-            
-            // Устанавливаем индикацию от клика с передачей времени начала для CUE треков
-            setActiveTrackIndicator(filepath, true, startTime ? parseFloat(startTime) : null);
-            
-            // Готовим данные для отправки
-            let requestBody = `filepath=${encodeURIComponent(filepath)}`;
-            if (startTime) {
-                requestBody += `&start_time=${startTime}`;
+        button.addEventListener('click', () => playFromButton(button));
+    });
+    document.querySelectorAll('.view-button').forEach(button => {
+        button.addEventListener('click', () => viewImageFromButton(button));
+    });
+    document.querySelectorAll('.text-button').forEach(button => {
+        button.addEventListener('click', () => readTextFromButton(button));
+    });
+
+    // --- Виртуальный список больших папок ---
+    // В DOM только видимые строки; содержимое подгружается страницами
+    // из /api/browse по мере прокрутки
+    const virtualBrowser = document.getElementById('virtual-browser');
+    if (virtualBrowser) {
+        initVirtualBrowser(virtualBrowser);
+    }
+
+    function initVirtualBrowser(container) {
+        const ROW_HEIGHT = 48;   // Совпадает с высотой .virtual-rows li
+        const OVERSCAN = 20;     // Строк выше и ниже видимой области
+        const PAGE_SIZE = 500;
+        const path = container.dataset.path;
+        const spacer = container.querySelector('.virtual-spacer');
+        const rows = container.querySelector('.virtual-rows');
+        const entries = [];
+        let total = parseInt(container.dataset.total, 10) || 0;
+        let cursor = null;
+        let exhausted = false;
+        let loading = false;
+        let renderScheduled = false;
+
+        function entryPath(name) {
+            return path ? `${path}/${name}` : name;
+        }
+
+        function renderRow(entry, index) {
+            const li = document.createElement('li');
+            if (index % 2 === 0) {
+                li.classList.add('stripe');
+            }
+            const icon = document.createElement('span');
+            icon.className = 'icon';
+            const label = document.createElement('span');
+            label.textContent = entry.name;
+            li.append(icon);
+
+            if (entry.type === 'folder') {
+                icon.textContent = '📁';
+                const link = document.createElement('a');
+                link.href = '/browse/' + entryPath(entry.name).split('/').map(encodeURIComponent).join('/');
+                link.textContent = entry.name;
+                li.append(link);
+                return li;
+            }
+
+            const button = document.createElement('button');
+            button.dataset.filepath = entryPath(entry.name);
+            if (entry.type === 'image') {
+                icon.textContent = '🖼️';
+                button.className = 'action-button view-button';
+                button.textContent = '👁️ View';
+            } else if (entry.type === 'text') {
+                icon.textContent = '📄';
+                button.className = 'action-button text-button';
+                button.textContent = '📖 Читать';
+            } else {
+                icon.textContent = entry.type === 'video' ? '🎬' : '🎵';
+                button.className = 'action-button play-button';
+                button.textContent = '▶️ Play';
+                if (player_status && player_status.state === 'playing' &&
+                    player_status.track === button.dataset.filepath && !player_status.cue_track_title) {
+                    button.classList.add('playing');
+                }
+            }
+            li.append(label, button);
+            return li;
+        }
+
+        function render() {
+            renderScheduled = false;
+            const first = Math.max(0, Math.floor(container.scrollTop / ROW_HEIGHT) - OVERSCAN);
+            const last = Math.min(total, Math.ceil((container.scrollTop + container.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+            if (last > entries.length) {
+                loadNextPage();
+            }
+            const visible = entries.slice(first, Math.min(last, entries.length));
+            rows.style.transform = `translateY(${first * ROW_HEIGHT}px)`;
+            rows.replaceChildren(...visible.map((entry, i) => renderRow(entry, first + i)));
+        }
+
+        function scheduleRender() {
+            if (!renderScheduled) {
+                renderScheduled = true;
+                requestAnimationFrame(render);
+            }
+        }
+
+        function loadNextPage() {
+            if (loading || exhausted) {
+                return;
+            }
+            loading = true;
+            const params = new URLSearchParams({path: path, limit: PAGE_SIZE});
+            if (cursor) {
+                params.set('cursor', cursor);
+            }
+            fetch(`/api/browse?${params}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (data.status === 'error') {
+                        throw new Error(data.message);
+                    }
+                    entries.push(...data.items);
+                    cursor = data.next_cursor;
+                    exhausted = !cursor;
+                    total = exhausted ? entries.length : data.total;
+                    spacer.style.height = `${total * ROW_HEIGHT}px`;
+                    loading = false;
+                    scheduleRender();
+                })
+                .catch(error => {
+                    console.error("[BROWSE] Ошибка загрузки страницы:", error);
+                    // Повторим при следующей прокрутке
+                    setTimeout(() => { loading = false; }, 2000);
+                });
+        }
+
+        // Кнопки строк создаются заново при прокрутке - обработчик один на список
+        rows.addEventListener('click', event => {
+            const button = event.target.closest('button');
+            if (!button) {
+                return;
+            }
+            if (button.classList.contains('play-button')) {
+                playFromButton(button);
+            } else if (button.classList.contains('view-button')) {
+                viewImageFromButton(button);
+            } else if (button.classList.contains('text-button')) {
+                readTextFromButton(button);
             }
-            
-            fetch('/play', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/x-www-form-urlencoded'},
-                body: requestBody
-            });
         });
-    });
 
-        // Кнопки просмотра изображений
-    document.querySelectorAll('.view-button').forEach(button => {
-        button.addEventListener('click', function() {
-            const filepath = this.dataset.filepath;
-            console.log("[ACTION] Просмотр изображения:", filepath);
+        spacer.style.height = `${total * ROW_HEIGHT}px`;
+        container.addEventListener('scroll', scheduleRender, {passive: true});
+        window.addEventListener('resize', scheduleRender);
+        loadNextPage();
+    }
 
-            // Отправляем запрос на backend для отображения на HDMI через MPV
-            const formData = new FormData();
-            formData.append('filepath', filepath);
+    // --- Поиск по медиатеке (/api/search) ---
+    const searchInput = document.getElementById('library-search-input');
+    if (searchInput) {
+        initLibrarySearch(searchInput);
+    }
 
-            fetch('/view_image', {
-                method: 'POST',
-                body: formData
-            })
-            .then(response => response.json())
-            .then(data => {
-                console.log("[ACTION] Изображение отправлено на HDMI:", data);
-            })
-            .catch(error => {
-                console.error("[ERROR] Ошибка отображения изображения:", error);
-            });
+    function initLibrarySearch(input) {
+        const SEARCH_DELAY = 250; // мс после последнего нажатия
+        const results = document.getElementById('library-search-results');
+        const moreButton = document.getElementById('library-search-more');
+        let timer = null;
+        let generation = 0;
+        let nextOffset = null;
+
+        function joinPath(folder, name) {
+            return folder ? `${folder}/${name}` : name;
+        }
+
+        function browseUrl(path) {
+            return '/browse/' + path.split('/').map(encodeURIComponent).join('/');
+        }
+
+        function actionButton(type, filepath, startTime) {
+            const button = document.createElement('button');
+            button.dataset.filepath = filepath;
+            if (type === 'image') {
+                button.className = 'action-button view-button';
+                button.textContent = '👁️ View';
+            } else if (type === 'text') {
+                button.className = 'action-button text-button';
+                button.textContent = '📖 Читать';
+            } else {
+                button.className = 'action-button play-button';
+                button.textContent = '▶️ Play';
+                if (startTime !== undefined && startTime !== null) {
+                    button.dataset.startTime = startTime;
+                }
+            }
+            return button;
+        }
+
+        function renderResult(result) {
+            const li = document.createElement('li');
+            const icon = document.createElement('span');
+            icon.className = 'icon';
+            const label = document.createElement('span');
+            const context = document.createElement('a');
+            context.className = 'search-context';
+            const folder = result.kind === 'folder' ? result.path.split('/').slice(0, -1).join('/') : result.folder;
+            context.href = browseUrl(folder || '');
+            context.textContent = '/' + (folder || '');
+            let button = null;
+
+            if (result.kind === 'folder') {
+                icon.textContent = '📁';
+                const link = document.createElement('a');
+                link.href = browseUrl(result.path);
+                link.textContent = result.name;
+                li.append(icon, link, context);
+                return li;
+            }
+            if (result.kind === 'file') {
+                icon.textContent = {image: '🖼️', text: '📄', video: '🎬'}[result.type] || '🎵';
+                label.textContent = result.name;
+                button = actionButton(result.type, result.path);
+            } else if (result.kind === 'album') {
+                icon.textContent = '🎼';
+                label.textContent = result.performer ? `${result.title} - ${result.performer}` : result.title;
+                button = actionButton('audio', joinPath(result.folder, result.audio_file));
+            } else {
+                icon.textContent = '🎵';
+                const number = String(result.number).padStart(2, '0');
+                label.textContent = result.performer ? `${number}. ${result.title} - ${result.performer}` : `${number}. ${result.title}`;
+                button = actionButton('audio', joinPath(result.folder, result.file), result.start_time);
+            }
+            li.append(icon, label, context, button);
+            return li;
+        }
 
-            // Также открываем в браузере для предварительного просмотра
-            window.open(`/media/${encodeURIComponent(filepath)}`, '_blank');
+        function search(offset) {
+            const query = input.value.trim();
+            const current = ++generation;
+            if (!query) {
+                results.replaceChildren();
+                moreButton.style.display = 'none';
+                return;
+            }
+            const params = new URLSearchParams({q: query, offset: offset});
+            fetch(`/api/search?${params}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (current !== generation) {
+                        return; // Пришел ответ на устаревший запрос
+                    }
+                    const items = (data.results || []).map(renderResult);
+                    if (offset === 0) {
+                        results.replaceChildren(...items);
+                    } else {
+                        results.append(...items);
+                    }
+                    nextOffset = data.next_offset;
+                    moreButton.style.display = nextOffset !== null && nextOffset !== undefined ? 'block' : 'none';
+                })
+                .catch(error => console.error("[SEARCH] Ошибка поиска:", error));
+        }
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            timer = setTimeout(() => search(0), SEARCH_DELAY);
         });
-    });
+        moreButton.addEventListener('click', () => search(nextOffset));
 
-    // Кнопки чтения текстовых файлов
-    document.querySelectorAll('.text-button').forEach(button => {
-        button.addEventListener('click', function() {
-            const filepath = this.dataset.filepath;
-            console.log("[ACTION] Просмотр текстового файла:", filepath);
-            window.open(`/view_text/${encodeURIComponent(filepath)}`, '_blank');
+        results.addEventListener('click', event => {
+            const button = event.target.closest('button');
+            if (!button) {
+                return;
+            }
+            if (button.classList.contains('play-button')) {
+                playFromButton(button);
+            } else if (button.classList.contains('view-button')) {
+                viewImageFromButton(button);
+            } else if (button.classList.contains('text-button')) {
+                readTextFromButton(button);
+            }
         });
-    });
+    }
 
     // Управление плеером
     playPauseButton.addEventListener('click', () => {
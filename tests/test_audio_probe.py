@@ -0,0 +1,171 @@
+"""Тесты разбора заголовков в audio_probe на синтетических файлах"""
+
+import struct
+import wave
+
+import pytest
+
+from audio_probe import probe_native
+
+
+def write_file(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def id3v2_tag(size=20):
+    """ID3v2.3 тег с size байтами паддинга (размер - synchsafe integer)"""
+    synchsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b'ID3\x03\x00\x00' + synchsafe + b'\x00' * size
+
+
+def flac_data(sample_rate=44100, channels=2, bits=16, total_samples=441000):
+    packed = sample_rate << 44 | (channels - 1) << 41 | (bits - 1) << 36 | total_samples
+    streaminfo = b'\x00' * 10 + packed.to_bytes(8, 'big') + b'\x00' * 16
+    return b'fLaC' + b'\x80' + (34).to_bytes(3, 'big') + streaminfo + b'\x00' * 1000
+
+
+def test_wav(tmp_path):
+    path = tmp_path / 'tone.wav'
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b'\x00\x00' * 16000)
+
+    info = probe_native(str(path))
+    assert info['codec'] == 'PCM_S16LE'
+    assert (info['sample_rate'], info['channels'], info['bits_per_sample']) == (8000, 1, 16)
+    assert info['duration'] == pytest.approx(2.0)
+    assert info['bitrate'] == 128000
+
+
+def test_wav_data_size_limited_by_file_size(tmp_path):
+    """Недописанный WAV: размер data в заголовке больше, чем есть в файле"""
+    fmt = struct.pack('<HHIIHH', 1, 2, 44100, 176400, 4, 16)
+    data = b'RIFF' + struct.pack('<I', 0xFFFFFFFF) + b'WAVE'
+    data += b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+    data += b'data' + struct.pack('<I', 0xFFFFFFF0) + b'\x00' * 176400
+
+    info = probe_native(write_file(tmp_path, 'partial.wav', data))
+    assert info['duration'] == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('prefix', [b'', id3v2_tag()])
+def test_flac(tmp_path, prefix):
+    info = probe_native(write_file(tmp_path, 'album.flac', prefix + flac_data()))
+    assert info['codec'] == 'FLAC'
+    assert (info['sample_rate'], info['channels'], info['bits_per_sample']) == (44100, 2, 16)
+    assert info['duration'] == pytest.approx(10.0)
+
+
+def test_flac_streaminfo_after_other_block(tmp_path):
+    padding = b'\x01' + (8).to_bytes(3, 'big') + b'\x00' * 8
+    data = flac_data(sample_rate=96000, bits=24, total_samples=96000 * 3)
+    data = data[:4] + padding + data[4:]
+
+    info = probe_native(write_file(tmp_path, 'hires.flac', data))
+    assert (info['sample_rate'], info['bits_per_sample']) == (96000, 24)
+    assert info['duration'] == pytest.approx(3.0)
+
+
+def test_dsf(tmp_path):
+    sample_rate = 2822400
+    header = b'DSD ' + struct.pack('<QQQ', 28, 0, 0)
+    fmt = struct.pack('<IIIIIIQ', 1, 0, 2, 2, sample_rate, 1, sample_rate * 5)
+    header += b'fmt ' + struct.pack('<Q', 52) + fmt + struct.pack('<II', 4096, 0)
+
+    info = probe_native(write_file(tmp_path, 'album.dsf', header))
+    assert info['codec'] == 'DSD_LSBF_PLANAR'
+    assert (info['sample_rate'], info['channels'], info['bits_per_sample']) == (sample_rate, 2, 1)
+    assert info['duration'] == pytest.approx(5.0)
+    assert info['bitrate'] == sample_rate * 2
+
+
+def dff_chunk(chunk_id, payload):
+    return chunk_id + struct.pack('>Q', len(payload)) + payload
+
+
+def test_dff(tmp_path):
+    sample_rate = 2822400
+    prop = b'SND ' + dff_chunk(b'FS  ', struct.pack('>I', sample_rate))
+    prop += dff_chunk(b'CHNL', struct.pack('>H', 2) + b'SLFTSRGT')
+    # 2 канала по 1 биту: секунда звука - sample_rate * 2 / 8 байт
+    audio = b'\x69' * (sample_rate * 2 // 8 * 2)
+    body = b'DSD ' + dff_chunk(b'PROP', prop) + dff_chunk(b'DSD ', audio)
+    data = b'FRM8' + struct.pack('>Q', len(body)) + body
+
+    info = probe_native(write_file(tmp_path, 'album.dff', data))
+    assert info['codec'] == 'DSD_MSBF'
+    assert (info['sample_rate'], info['channels']) == (sample_rate, 2)
+    assert info['duration'] == pytest.approx(2.0)
+
+
+# MPEG1 Layer III, 128 кбит/с, 44100 Гц, стерео, без паддинга: кадр 417 байт
+MP3_HEADER = b'\xff\xfb\x90\x00'
+MP3_FRAME = MP3_HEADER + b'\x00' * 413
+
+
+def test_mp3_cbr(tmp_path):
+    frames = 100
+    info = probe_native(write_file(tmp_path, 'track.mp3', MP3_FRAME * frames))
+    assert info['codec'] == 'MP3'
+    assert (info['sample_rate'], info['channels'], info['bitrate']) == (44100, 2, 128000)
+    assert info['duration'] == pytest.approx(417 * frames * 8 / 128000)
+
+
+def test_mp3_cbr_skips_id3_tags(tmp_path):
+    frames = 50
+    id3v1 = b'TAG' + b'\x00' * 125
+    info = probe_native(write_file(tmp_path, 'track.mp3', id3v2_tag(100) + MP3_FRAME * frames + id3v1))
+    assert info['duration'] == pytest.approx(417 * frames * 8 / 128000)
+
+
+def test_mp3_xing_frame_count(tmp_path):
+    frames = 1000
+    # Xing стоит после side info (32 байта для MPEG1 стерео)
+    xing = b'Xing' + struct.pack('>II', 0x1, frames)
+    first = MP3_HEADER + b'\x00' * 32 + xing
+    first += b'\x00' * (417 - len(first))
+
+    info = probe_native(write_file(tmp_path, 'vbr.mp3', first + MP3_FRAME * 10))
+    assert info['duration'] == pytest.approx(frames * 1152 / 44100)
+
+
+def test_mp3_xing_lame_gapless(tmp_path):
+    frames = 1000
+    delay, padding = 576, 1000
+    xing = b'Xing' + struct.pack('>II', 0x1, frames)
+    lame = b'LAME' + b'\x00' * 17 + (delay << 12 | padding).to_bytes(3, 'big')
+    first = MP3_HEADER + b'\x00' * 32 + xing + lame
+    first += b'\x00' * (417 - len(first))
+
+    info = probe_native(write_file(tmp_path, 'gapless.mp3', first + MP3_FRAME * 10))
+    assert info['duration'] == pytest.approx((frames * 1152 - delay - padding) / 44100)
+
+
+def mp4_atom(atom_type, payload):
+    return struct.pack('>I', len(payload) + 8) + atom_type + payload
+
+
+def test_mp4_alac(tmp_path):
+    sample_rate = 48000
+    mvhd = mp4_atom(b'mvhd', b'\x00' * 12 + struct.pack('>II', 1000, 4000) + b'\x00' * 80)
+    mdhd = mp4_atom(b'mdhd', b'\x00' * 12 + struct.pack('>II', sample_rate, sample_rate * 4) + b'\x00' * 4)
+    hdlr = mp4_atom(b'hdlr', b'\x00' * 8 + b'soun' + b'\x00' * 12)
+    entry = (struct.pack('>I', 36) + b'alac' + b'\x00' * 6 + struct.pack('>H', 1)
+             + struct.pack('>HH', 0, 0) + b'\x00' * 4
+             + struct.pack('>HHHH', 2, 24, 0, 0) + struct.pack('>I', sample_rate << 16))
+    stsd = mp4_atom(b'stsd', struct.pack('>II', 0, 1) + entry)
+    trak = mp4_atom(b'trak', mp4_atom(b'mdia', mdhd + hdlr + mp4_atom(b'minf', mp4_atom(b'stbl', stsd))))
+    data = mp4_atom(b'ftyp', b'M4A \x00\x00\x00\x00') + mp4_atom(b'moov', mvhd + trak)
+
+    info = probe_native(write_file(tmp_path, 'track.m4a', data))
+    assert info['codec'] == 'ALAC'
+    assert (info['sample_rate'], info['channels'], info['bits_per_sample']) == (sample_rate, 2, 24)
+    assert info['duration'] == pytest.approx(4.0)
+
+
+def test_unknown_format(tmp_path):
+    assert probe_native(write_file(tmp_path, 'notes.txt', b'just some text' * 10)) is None
@@ -0,0 +1,184 @@
+"""Регрессионные тесты разбора CUE-файлов"""
+
+import codecs
+
+import pytest
+
+from cue_parser import CueParser, detect_cue_encoding, parse_cue_file, parse_cue_time
+
+
+def write_cue(tmp_path, text, encoding='utf-8', name='album.cue'):
+    path = tmp_path / name
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+
+def test_parse_cue_time():
+    assert parse_cue_time('00:00:00') == 0.0
+    assert parse_cue_time('01:02:15') == 62.2
+    assert parse_cue_time('123:00:00') == 7380.0
+    assert parse_cue_time('1:02') is None
+    assert parse_cue_time('') is None
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('FILE "Side A.flac" WAVE', 'Side A.flac'),
+    ('FILE "x.flac" wave', 'x.flac'),
+    ('FILE "x.flac"', 'x.flac'),
+    ('FILE "Side B, \"live\".flac" WAVE', 'Side B, "live".flac'),
+    ('FILE Side A.flac WAVE', 'Side A.flac'),
+    ('FILE Side A.flac wave', 'Side A.flac'),
+    ('FILE side c.flac', 'side c.flac'),
+    ('FILE\t"tabbed.wav"\tWAVE', 'tabbed.wav'),
+    ('file "lower.flac" wave', 'lower.flac'),
+])
+def test_file_names(tmp_path, line, expected):
+    cue = parse_cue_file(write_cue(tmp_path, f'{line}\nTRACK 01 AUDIO\nINDEX 01 00:00:00\n'))
+    assert cue.tracks[0].file == expected
+
+
+def test_album_and_track_fields(tmp_path):
+    path = write_cue(tmp_path, (
+        'REM GENRE "Progressive Rock"\n'
+        'REM DATE 1975\n'
+        'REM COMMENT "ExactAudioCopy v1.0"\n'
+        'PERFORMER "Pink Floyd"\n'
+        'TITLE "Wish You Were Here"\n'
+        'FILE "album.flac" WAVE\n'
+        '  TRACK 01 AUDIO\n'
+        '    TITLE "Shine On You Crazy Diamond"\n'
+        '    FLAGS DCP PRE\n'
+        '    ISRC GBN9Y1100001\n'
+        '    INDEX 01 00:00:00\n'
+        '  TRACK 02 AUDIO\n'
+        '    TITLE "Welcome to the Machine"\n'
+        '    PERFORMER "Roger Waters"\n'
+        '    PREGAP 00:02:00\n'
+        '    INDEX 00 13:30:00\n'
+        '    INDEX 01 13:32:30\n'
+    ))
+    cue = parse_cue_file(path)
+    assert (cue.genre, cue.date, cue.comment) == ('Progressive Rock', '1975', 'ExactAudioCopy v1.0')
+    assert (cue.performer, cue.title) == ('Pink Floyd', 'Wish You Were Here')
+    first, second = cue.tracks
+    assert first.title == 'Shine On You Crazy Diamond'
+    assert first.performer == 'Pink Floyd'  # Наследуется от альбома
+    assert first.flags == ('DCP', 'PRE')
+    assert first.isrc == 'GBN9Y1100001'
+    assert second.performer == 'Roger Waters'
+    assert second.index00 == '13:30:00'
+    assert second.parse_index_to_seconds() == 13 * 60 + 32.4
+    assert second.pregap_seconds() == pytest.approx(2.0 + 2.4)
+
+
+def test_lowercase_commands_and_tabs(tmp_path):
+    path = write_cue(tmp_path, (
+        'rem\tdate\t1999\n'
+        'performer Artist\n'
+        'title\t"Album"\n'
+        'file "a.wav" wave\n'
+        '\ttrack 01 audio\n'
+        '\t\ttitle One\n'
+        '\t\tindex\t01\t00:00:00\n'
+        '\ttrack\t02\taudio\n'
+        '\t\ttitle "Two"\n'
+        '\t\tindex  00  03:58:00\n'
+        '\t\tindex  01  04:00:00\n'
+    ))
+    cue = parse_cue_file(path)
+    assert (cue.date, cue.performer, cue.title) == ('1999', 'Artist', 'Album')
+    assert [t.title for t in cue.tracks] == ['One', 'Two']
+    assert [t.index for t in cue.tracks] == ['00:00:00', '04:00:00']
+    assert cue.tracks[1].index00 == '03:58:00'
+
+
+def test_crlf_and_bom(tmp_path):
+    text = 'TITLE "Альбом"\r\nFILE "a.flac" WAVE\r\nTRACK 01 AUDIO\r\nTITLE "Первый"\r\nINDEX 01 00:00:00\r\n'
+    path = tmp_path / 'bom.cue'
+    path.write_bytes(codecs.BOM_UTF8 + text.encode('utf-8'))
+    cue = parse_cue_file(str(path))
+    assert cue.title == 'Альбом'
+    assert cue.tracks[0].title == 'Первый'
+
+
+def test_data_track_is_skipped(tmp_path):
+    path = write_cue(tmp_path, (
+        'FILE "a.bin" BINARY\n'
+        'TRACK 01 AUDIO\nTITLE "Audio"\nINDEX 01 00:00:00\n'
+        'TRACK 02 MODE1/2352\nTITLE "Data"\nINDEX 01 40:00:00\n'
+    ))
+    cue = parse_cue_file(path)
+    assert len(cue.tracks) == 1
+    assert cue.tracks[0].title == 'Audio'
+    assert cue.tracks[0].index == '00:00:00'
+
+
+def test_missing_or_empty_file(tmp_path):
+    assert parse_cue_file(str(tmp_path / 'missing.cue')) is None
+    assert parse_cue_file(write_cue(tmp_path, 'REM nothing here\n')) is None
+
+
+@pytest.mark.parametrize('raw, expected', [
+    (codecs.BOM_UTF8 + 'TITLE "x"'.encode('utf-8'), 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE + 'TITLE "x"'.encode('utf-16-le'), 'utf-16'),
+    ('TITLE "Кино"'.encode('utf-8'), 'utf-8'),
+    ('TITLE "Группа крови"'.encode('windows-1251'), 'windows-1251'),
+    ('TITLE "Café del Mar - Señor"'.encode('cp1252'), 'cp1252'),
+    (b'TITLE "plain ascii"', 'utf-8'),
+])
+def test_detect_cue_encoding(raw, expected):
+    assert detect_cue_encoding(raw) == expected
+
+
+@pytest.mark.parametrize('title, encoding', [
+    ('Группа крови', 'windows-1251'),
+    ('Café del Mar', 'cp1252'),
+    ('Zoë Keating', 'utf-8'),
+])
+def test_single_byte_encodings_decode(tmp_path, title, encoding):
+    path = write_cue(tmp_path, f'TITLE "{title}"\nFILE "a.flac" WAVE\nTRACK 01 AUDIO\nINDEX 01 00:00:00\n',
+                     encoding=encoding)
+    assert parse_cue_file(path).title == title
+
+
+MULTI_FILE_CUE = (
+    'FILE "a.flac" WAVE\n'
+    'TRACK 01 AUDIO\nINDEX 01 00:00:00\n'
+    'TRACK 02 AUDIO\nINDEX 01 00:10:00\n'
+    'FILE "b.flac" WAVE\n'
+    'TRACK 03 AUDIO\nINDEX 01 00:00:00\n'
+    'FILE "c.flac" WAVE\n'
+    'TRACK 04 AUDIO\nINDEX 01 00:05:00\n'
+)
+
+
+def test_absolute_times_are_lazy_and_use_file_durations(tmp_path):
+    path = write_cue(tmp_path, MULTI_FILE_CUE)
+    durations = {'a.flac': 100.0, 'b.flac': 50.0}
+    requested = []
+
+    def get_duration(file_path):
+        name = file_path.rsplit('/', 1)[-1]
+        requested.append(name)
+        return durations.get(name)
+
+    parser = CueParser(path, get_duration)
+    assert requested == []  # Разбор не пробует файлы
+    info = parser.get_info(with_times=False)
+    assert [t['start_time_seconds'] for t in info['tracks']] == [None] * 4
+    assert requested == []
+
+    info = parser.get_info()
+    assert sorted(requested) == ['a.flac', 'b.flac']  # Длительность последнего файла не нужна
+    assert [t['start_time_seconds'] for t in info['tracks']] == [0.0, 10.0, 100.0, 155.0]
+    assert [t['relative_time_seconds'] for t in info['tracks']] == [0.0, 10.0, 0.0, 5.0]
+    assert info['tracks'][3]['start_time'] == '02:35'
+
+
+def test_unknown_duration_leaves_later_times_empty(tmp_path):
+    path = write_cue(tmp_path, MULTI_FILE_CUE)
+    parser = CueParser(path, lambda file_path: None)
+    assert parser.resolve_times() is False
+    info = parser.get_info()
+    assert [t['start_time_seconds'] for t in info['tracks']] == [0.0, 10.0, None, None]
+    assert info['tracks'][2]['start_time'] == ''
@@ -0,0 +1,70 @@
+"""Тесты поиска трека CUE по позиции воспроизведения"""
+
+from cue_track_table import CueTrackTable
+
+
+def tracks(file, *starts, first_number=1):
+    return [{'number': first_number + i, 'file': file, 'relative_time_seconds': start}
+            for i, start in enumerate(starts)]
+
+
+def test_index_at_boundaries():
+    table = CueTrackTable(tracks('a.flac', 0.0, 100.0, 250.5))
+    assert len(table) == 3
+    assert table.index_at(0.0) == 0
+    assert table.index_at(99.99) == 0
+    assert table.index_at(100.0) == 1
+    assert table.index_at(250.5) == 2
+    # Длительность неизвестна - последний трек открыт до конца
+    assert table.index_at(10000.0) == 2
+    assert table.index_at(10000.0, duration=400.0) == -1
+    assert table.track_at(120.0)['number'] == 2
+
+
+def test_position_before_first_track():
+    table = CueTrackTable(tracks('a.flac', 2.0, 50.0))
+    assert table.index_at(1.0) == -1
+    assert table.track_at(1.0) is None
+
+
+def test_end():
+    table = CueTrackTable(tracks('a.flac', 0.0, 100.0))
+    assert table.end(0, 300.0) == 100.0
+    assert table.end(1, 300.0) == 300.0
+    assert table.end(1) is None
+
+
+def test_only_tracks_of_loaded_file():
+    album = tracks('a.flac', 0.0, 100.0) + tracks('b.flac', 0.0, 80.0, first_number=3)
+    table = CueTrackTable(album)
+    assert [t['number'] for t in table.tracks] == [1, 2]
+
+    table = CueTrackTable(album, file='b.flac')
+    assert [t['number'] for t in table.tracks] == [3, 4]
+    assert table.starts == (0.0, 80.0)
+    assert table.index_of(album[0]) == -1
+    assert table.index_of(album[3]) == 1
+
+
+def test_timeline_offsets():
+    album = tracks('a.flac', 0.0, 100.0) + tracks('b.flac', 0.0, 80.0, first_number=3)
+    table = CueTrackTable(album, offsets={'a.flac': 0.0, 'b.flac': 200.0})
+    assert table.timeline
+    assert table.starts == (0.0, 100.0, 200.0, 280.0)
+    assert table.ends == (100.0, 200.0, 280.0, None)
+    assert table.track_at(150.0)['number'] == 2
+    assert table.track_at(210.0)['number'] == 3
+
+
+def test_index_of():
+    album = tracks('a.flac', 0.0, 100.0)
+    table = CueTrackTable(album)
+    assert table.index_of(album[1]) == 1
+    assert table.index_of({'number': 9}) == -1
+    assert table.index_of(None) == -1
+
+
+def test_empty_table():
+    table = CueTrackTable([])
+    assert len(table) == 0
+    assert table.index_at(5.0) == -1
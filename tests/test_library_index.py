@@ -0,0 +1,106 @@
+"""Тесты индекса медиатеки: полнотекстовый поиск и его триггеры"""
+
+import pytest
+
+import library_index
+from library_index import LibraryIndex, search_match_expression
+
+
+def audio(name, size=1000, mtime_ns=1):
+    return {'name': name, 'type': 'audio', 'size': size, 'mtime_ns': mtime_ns}
+
+
+def cue_album(cue_file, title, performer, track_titles):
+    return {
+        'cue_file': cue_file, 'file': 'album.flac', 'title': title, 'performer': performer,
+        'tracks': [{'number': i + 1, 'title': t, 'performer': performer, 'file': 'album.flac',
+                    'relative_time_seconds': i * 100.0} for i, t in enumerate(track_titles)]
+    }
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LibraryIndex(str(tmp_path / 'library.db'))
+    index.replace_folder('', 1, ['Pink Floyd', 'Björk'], [])
+    index.replace_folder('Pink Floyd', 1, [], [audio('album.flac'), audio('album.cue')], [
+        cue_album('album.cue', 'The Wall', 'Pink Floyd', ['In the Flesh?', 'Another Brick in the Wall'])])
+    index.replace_folder('Björk', 1, [], [audio('Hyperballad.mp3')])
+    yield index
+    index.close()
+
+
+def search_rows(index):
+    return index._connection().execute("SELECT COUNT(*) FROM search").fetchone()[0]
+
+
+def found(results):
+    return {(r['kind'], r.get('name') or r.get('title')) for r in results}
+
+
+def test_search_match_expression():
+    assert search_match_expression('Pink flo') == '"pink"* "flo"*'
+    assert search_match_expression('  "a" OR b*  ') == '"a"* "or"* "b"*'
+    assert search_match_expression('!!! ') == ''
+
+
+def test_search_all_kinds(index):
+    assert found(index.search('pink')) == {('folder', 'Pink Floyd'), ('album', 'The Wall'),
+                                           ('track', 'In the Flesh?'),
+                                           ('track', 'Another Brick in the Wall')}
+    assert found(index.search('hyper')) == {('file', 'Hyperballad.mp3')}
+    assert index.search('') == []
+
+
+def test_search_prefix_and_diacritics(index):
+    assert found(index.search('bjork')) == {('folder', 'Björk')}
+    assert found(index.search('wa fl')) == {('album', 'The Wall'), ('track', 'Another Brick in the Wall')}
+
+
+def test_search_kinds_filter(index):
+    assert found(index.search('pink', kinds=('album',))) == {('album', 'The Wall')}
+    results = index.search('brick', kinds=('track',))
+    assert results[0]['start_time'] == 100.0
+    assert results[0]['folder'] == 'Pink Floyd'
+
+
+def test_folders_and_albums_rank_first(index):
+    assert index.search('pink')[0]['kind'] in ('folder', 'album')
+
+
+def test_rescan_keeps_search_in_sync(index):
+    rows = search_rows(index)
+    # Повторное сканирование той же папки не плодит строк поиска
+    index.replace_folder('Pink Floyd', 2, [], [audio('album.flac'), audio('album.cue')], [
+        cue_album('album.cue', 'The Wall', 'Pink Floyd', ['In the Flesh?', 'Another Brick in the Wall'])])
+    assert search_rows(index) == rows
+
+    # Удаленный файл CUE уносит альбом и треки (каскад) и их строки поиска
+    index.replace_folder('Pink Floyd', 3, [], [audio('album.flac')])
+    assert found(index.search('wall')) == set()
+    assert search_rows(index) == rows - 4
+
+
+def test_removed_tree_leaves_no_search_rows(index):
+    index.replace_folder('', 2, ['Björk'], [])
+    assert index.search('pink') == []
+    assert index.search('flesh') == []
+    assert found(index.search('hyperballad')) == {('file', 'Hyperballad.mp3')}
+    assert search_rows(index) == 2
+
+
+def test_failed_probe_is_retried(index, monkeypatch):
+    path = 'Björk/Hyperballad.mp3'
+    now = 1_000_000.0
+    monkeypatch.setattr(library_index.time, 'time', lambda: now)
+
+    index.store_stream_info(path, 1000, 1, {})
+    assert index.get_stream_info(path, 1000, 1) is None
+    assert path not in [p for p, _, _ in index.files_without_stream_info()]
+
+    now += library_index.PROBE_RETRY_INTERVAL + 1
+    assert path in [p for p, _, _ in index.files_without_stream_info()]
+    assert index.stats()['unprobed_files'] == 3
+
+    index.store_stream_info(path, 1000, 1, {'codec': 'MP3', 'duration': 240.0})
+    assert index.get_stream_info(path, 1000, 1)['duration'] == 240.0
+    assert path not in [p for p, _, _ in index.files_without_stream_info()]